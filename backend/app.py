@@ -1,48 +1,98 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import hmac
+import os
+from datetime import date, timedelta
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
-from db import get_db_connection
-from flask_cors import CORS
-import random
-from datetime import datetime, timedelta
+
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json  # ✅ Add this import
-import os 
 from dotenv import load_dotenv
-load_dotenv()  # This loads the variables from .env
-
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, session
+from flask_cors import CORS
+from psycopg2.extras import Json, RealDictCursor
+
+import item_index
+import prefetch
+from budgets import query_budget
+from compression import init_compression
+from db import get_db_connection, release_request_connections
+from exports import EXPORT_FORMATS, EXPORT_QUERIES, export_rows
+from json_provider import init_json
+from lexicon import resolve_conjugations, resolve_words
+from limits import admission_controlled, load_limits, rejection_counts
+from logs import configure_logging, init_request_logging, logger
+from passwords import HashingBusy, check_password, hash_password
+from queries import (
+    GROWTH_GRANULARITIES, HISTORY_FILTERS, RUN_SOURCES, accuracy_breakdown_query,
+    build_where_clause, conjugation_candidates_query, conjugation_filters,
+    decode_history_cursor, encode_history_cursor, growth_series_query, history_query,
+    record_conjugation_game_query, record_word_game_query, shape_breakdown, shape_stats,
+    stats_queries, update_conjugation_tracking_query, update_word_tracking_query,
+    word_candidates_query, word_filters,
+)
+from versions import bump_data_version, conditional_get
 
-app = Flask(__name__)
-# ✅ Important: specify the exact origin and enable credentials
-raw = os.environ.get("CORS_ORIGIN", "")
-# split into a list (empty list if not set)
-origins = [u.strip() for u in raw.split(",") if u.strip()]
+api = Blueprint("api", __name__)
 
-# if you really want to allow everything as a fallback:
-if not origins:
-    origins = ["*"]
 
-CORS(app,
-     resources={r"/*": {"origins": origins}},
-     supports_credentials=True)
+def cors_origins():
+    raw = os.environ.get("CORS_ORIGIN", "")
+    # split into a list (empty list if not set)
+    origins = [u.strip() for u in raw.split(",") if u.strip()]
 
-app.config.update(
-    SESSION_COOKIE_DOMAIN   = os.environ.get("SESSION_COOKIE_DOMAIN"),
-    SESSION_COOKIE_SAMESITE = os.environ.get("SESSION_COOKIE_SAMESITE"),
-    SESSION_COOKIE_SECURE   = os.environ.get("SESSION_COOKIE_SECURE") == "True",
-)
+    # if you really want to allow everything as a fallback:
+    if not origins:
+        origins = ["*"]
+    return origins
 
 
-app.secret_key = os.environ.get("SECRET_KEY")
-    
-def build_where_clause(conditions):
+def create_app(config=None):
     """
-    Given a list of conditions (strings), return a WHERE clause that joins
-    them with AND. If no conditions, returns an empty string.
+    Build the Flask app. Settings come from the environment (and .env, loaded
+    here once), with `config` applied on top.
     """
-    if conditions:
-        return "WHERE " + " AND ".join(conditions)
-    return ""
+    load_dotenv()  # This loads the variables from .env
+
+    app = Flask(__name__)
+    # ✅ Important: specify the exact origin and enable credentials
+    CORS(app,
+         resources={r"/*": {"origins": cors_origins()}},
+         supports_credentials=True)
+
+    app.config.update(
+        SESSION_COOKIE_DOMAIN   = os.environ.get("SESSION_COOKIE_DOMAIN"),
+        SESSION_COOKIE_SAMESITE = os.environ.get("SESSION_COOKIE_SAMESITE"),
+        SESSION_COOKIE_SECURE   = os.environ.get("SESSION_COOKIE_SECURE") == "True",
+    )
+    app.secret_key = os.environ.get("SECRET_KEY")
+    app.config.update(
+        JSON_PROVIDER        = os.environ.get("JSON_PROVIDER", "orjson"),
+        JSON_DATETIME_FORMAT = os.environ.get("JSON_DATETIME_FORMAT", "http"),
+        COMPRESS_MIN_SIZE    = int(os.environ.get("COMPRESS_MIN_SIZE", 1024)),
+        COMPRESS_LEVEL       = int(os.environ.get("COMPRESS_LEVEL", 5)),
+        METRICS_TOKEN        = os.environ.get("METRICS_TOKEN"),
+    )
+    if config:
+        app.config.update(config)
+
+    load_limits()
+    init_json(app, app.config["JSON_PROVIDER"], app.config["JSON_DATETIME_FORMAT"])
+    init_compression(app, app.config["COMPRESS_MIN_SIZE"], app.config["COMPRESS_LEVEL"])
+
+    configure_logging()
+    init_request_logging(app)
+    app.register_blueprint(api)
+    # Hand pooled connections back even when a view returns early.
+    app.teardown_appcontext(release_request_connections)
+    return app
+
+
+MAX_GROWTH_BUCKETS = 3660
+
+
+def fetch_growth_series(cur, user_id, granularity="day", start=None, end=None, include_baseline=True,
+                        max_buckets=None):
+    """Run `growth_series_query` (see queries.py) and return its rows."""
+    cur.execute(*growth_series_query(user_id, granularity, start, end, include_baseline, max_buckets))
+    return cur.fetchall()
 
 
 
@@ -54,20 +104,43 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route("/", methods=["GET"])
+@api.route("/", methods=["GET"])
+@query_budget(queries=0)
 def health_check():
     return jsonify({"status":"ok"}), 200
 
 
-@app.route('/current_user', methods=["GET"])
+@api.route("/metrics", methods=["GET"])
+@query_budget(queries=0)
+def metrics():
+    """
+    Operational counters, for operators only: the request must carry
+    `Authorization: Bearer <METRICS_TOKEN>`, and without METRICS_TOKEN set
+    the endpoint is off.
+    """
+    token = current_app.config["METRICS_TOKEN"]
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "rejected_requests": rejection_counts(),
+        "prefetch": prefetch.cache.stats(),
+        "item_index": item_index.cache.stats(),
+    }), 200
+
+
+@api.route('/current_user', methods=["GET"])
+@query_budget(queries=0)
 @login_required
 def current_user():
     username = session.get("username")
-    print("username", username)
     return jsonify({"username": username})
 
 # Home route that redirects to dashboard if logged in
-@app.route('/register', methods=["POST"])
+@api.route('/register', methods=["POST"])
+@query_budget(queries=1, rows=10)
 def register():
     data = request.get_json()
     username = data.get("username")
@@ -75,7 +148,10 @@ def register():
     if not username or not password:
         return jsonify({"error": "Username and password required"}), 400
 
-    hashed_password = generate_password_hash(password)
+    try:
+        hashed_password = hash_password(password)
+    except HashingBusy:
+        return hashing_busy()
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -92,11 +168,18 @@ def register():
         session["username"] = username
         return jsonify({"message": "User registered", "user_id": user["id"]}), 201
     except Exception as e:
-        print("Registration Error:", e)
+        logger.exception("Registration failed")
         return jsonify({"error": "Registration failed. Username might be taken."}), 500
 
 
-@app.route('/login', methods=["POST"])
+def hashing_busy():
+    response = jsonify({"error": "Too many sign-ins at once, please retry shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+@api.route('/login', methods=["POST"])
+@query_budget(queries=2, rows=10)
 def login():
     data = request.get_json()
     username = data.get("username")
@@ -109,29 +192,49 @@ def login():
         cur = conn.cursor()
         cur.execute("SELECT id, password_hash FROM users WHERE username = %s;", (username,))
         user = cur.fetchone()
-        print(user)
         cur.close()
         conn.close()
 
-        if user is None or not check_password_hash(user["password_hash"], password):
+        matches, upgraded_hash = False, None
+        if user is not None:
+            matches, upgraded_hash = check_password(user["password_hash"], password)
+        if matches and upgraded_hash:
+            # Hash parameters changed since this one was stored; unless a
+            # concurrent login already replaced it, store the upgrade.
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s;",
+                (upgraded_hash, user["id"], user["password_hash"])
+            )
+            conn.commit()
+            cur.close()
+            conn.close()
+
+        if not matches:
             return jsonify({"error": "Invalid username or password"}), 401
 
         # Valid credentials; set session data to create a session cookie.
         session["user_id"] = user["id"]
         session["username"] = username
         return jsonify({"message": "Logged in successfully", "user_id": user["id"]})
+    except HashingBusy:
+        return hashing_busy()
     except Exception as e:
-        print("Login Error:", e)
+        logger.exception("Login failed")
         return jsonify({"error": "Login failed due to a server error."}), 500
 
 
-@app.route('/logout', methods=["POST"])
+@api.route('/logout', methods=["POST"])
+@query_budget(queries=0)
 def logout():
     session.clear()  # Remove all keys from session
     return jsonify({"message": "Logged out successfully"})
 
-@app.route("/settings", methods=["GET"])
+@api.route("/settings", methods=["GET"])
+@query_budget(queries=1, rows=10)
 @login_required
+@conditional_get
 def get_settings():
     user_id=session.get("user_id")
     conn = get_db_connection()
@@ -144,7 +247,8 @@ def get_settings():
         return jsonify({"error": "User not found"}), 404
     return jsonify(row["settings"]), 200
 
-@app.route("/settings", methods=["PUT"])
+@api.route("/settings", methods=["PUT"])
+@query_budget(queries=1, rows=10)
 @login_required
 def update_settings():
     user_id=session.get("user_id")
@@ -161,11 +265,13 @@ def update_settings():
     conn.commit()
     cur.close()
     conn.close()
+    bump_data_version(user_id)
     return jsonify({"status": "ok"}), 200
 
 
 # Updated API to handle multiple translations
-@app.route('/add_word', methods=['POST'])
+@api.route('/add_word', methods=['POST'])
+@query_budget(queries=5, rows=700)
 @login_required
 def add_word():
     try:
@@ -187,15 +293,13 @@ def add_word():
         cur = conn.cursor()
 
         # ✅ Check if the word already exists
-        cur.execute("SELECT id, translations FROM vocabulary WHERE LOWER(word) = LOWER(%s) AND user_id = %s;", (word, user_id))
+        cur.execute("SELECT id, translations FROM vocabulary_entries WHERE LOWER(word) = LOWER(%s) AND user_id = %s;", (word, user_id))
         result = cur.fetchone()
-        print("here")
         if result:
             word_id = result["id"]  # ✅ Use dictionary-style access
             existing_translations = result["translations"]
-            print("here")
 
-            # ✅ Append new translation only if it's unique
+            # ✅ Append new translation only if it's unique (stored as the user's override)
             if translation not in existing_translations:
                 updated_translations = existing_translations + [translation]
                 cur.execute(
@@ -203,41 +307,45 @@ def add_word():
                     (updated_translations, word_id, user_id)
                 )
         else:
-            # ✅ Insert new word & get ID
-            print("here")
+            # ✅ Find or create the shared lexicon entry, then insert the user's
+            # row; it keeps its translation only if the entry's differ
+            entry = resolve_words(cur, [(word, part_of_speech, article, translation)])[0]
             cur.execute(
-                "INSERT INTO vocabulary (word, translations, part_of_speech, article, user_id, class) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id;",
-                (word, [translation], part_of_speech, article, user_id, word_class)
+                "INSERT INTO vocabulary (lexicon_id, translations, user_id, class) VALUES (%s, %s, %s, %s) RETURNING id;",
+                (entry["id"], None if entry["translations"] == [translation] else [translation], user_id, word_class)
             )
             result=cur.fetchone()
             word_id = result["id"]
 
             # ✅ Insert into word_tracking
             cur.execute(
-                "INSERT INTO word_tracking (word_id, word, total_attempts, mistake_timestamps, last_accessed, score, user_id) "
-                "VALUES (%s, %s, 0, ARRAY[]::TIMESTAMPTZ[], NOW(), 5, %s);",
-                (word_id, word, user_id)
+                "INSERT INTO word_tracking (word_id, total_attempts, mistake_timestamps, last_accessed, score, user_id) "
+                "VALUES (%s, 0, ARRAY[]::TIMESTAMPTZ[], NOW(), 5, %s);",
+                (word_id, user_id)
             )
 
         conn.commit()
         cur.close()
         conn.close()
+        bump_data_version(user_id)
 
         return jsonify({"message": "Word added successfully!", "word_id": word_id}), 201
 
     except Exception as e:
-        print("❌ Error in add_word:", str(e))  # Debugging log
+        logger.exception("Error in add_word")
         return jsonify({"error": str(e)}), 500
 
     
-@app.route('/get_words', methods=['GET'])
+@api.route('/get_words', methods=['GET'])
+@query_budget(queries=1, rows=700)
 @login_required
+@conditional_get
 def get_words():
     try:
         user_id=session.get("user_id")
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM vocabulary WHERE user_id = %s;", (user_id,))
+        cur.execute("SELECT * FROM vocabulary_entries WHERE user_id = %s;", (user_id,))
         words = cur.fetchall()
         cur.close()
         conn.close()
@@ -245,7 +353,8 @@ def get_words():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/update_word/<int:word_id>', methods=['PUT'])
+@api.route('/update_word/<int:word_id>', methods=['PUT'])
+@query_budget(queries=1, rows=10)
 @login_required
 def update_word(word_id):
     try:
@@ -255,7 +364,6 @@ def update_word(word_id):
         translations = data.get('translation', [])  # Now handling a full list
         part_of_speech = data.get('part_of_speech')
         word_class = data.get('word_class')
-        print(word_class)
         article = data.get('article')
 
         if article in ["none", "", None]:  
@@ -269,43 +377,33 @@ def update_word(word_id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
-        # ✅ Fetch the existing word before updating
-        cur.execute("SELECT word FROM vocabulary WHERE id = %s AND user_id = %s;", (word_id, user_id))
-        result = cur.fetchone()
-
-        if not result:
-            return jsonify({"error": "Word not found"}), 404
-
-        old_word = result["word"]
-
-        # ✅ Update `vocabulary` table
+        # ✅ Update `vocabulary` table (word_tracking holds no copy of the text);
+        # the row now owns all its text, so it no longer uses the shared entry
         cur.execute("""
             UPDATE vocabulary 
-            SET word = %s, translations = %s, part_of_speech = %s, article = %s, class = %s
-            WHERE id = %s AND user_id = %s;
+            SET word = %s, translations = %s, part_of_speech = %s, article = %s, class = %s, lexicon_id = NULL
+            WHERE id = %s AND user_id = %s
+            RETURNING id;
         """, (new_word, translations, part_of_speech, article, word_class, word_id, user_id))
 
-        # ✅ If the word itself changed, update `word_tracking`
-        if old_word != new_word:
-            cur.execute("""
-                UPDATE word_tracking 
-                SET word = %s
-                WHERE word_id = %s AND user_id = %s;
-            """, (new_word, word_id, user_id))
+        if not cur.fetchone():
+            return jsonify({"error": "Word not found"}), 404
 
         conn.commit()
         cur.close()
         conn.close()
+        bump_data_version(user_id)
 
         return jsonify({"message": "Word updated successfully!"}), 200
 
     except Exception as e:
-        print("❌ ERROR in update_word:", str(e))  
+        logger.exception("Error in update_word")
         return jsonify({"error": str(e)}), 500
 
 
 
-@app.route('/delete_word/<int:word_id>', methods=['DELETE'])
+@api.route('/delete_word/<int:word_id>', methods=['DELETE'])
+@query_budget(queries=3, rows=10)
 @login_required
 def delete_word(word_id):
     try:
@@ -314,7 +412,7 @@ def delete_word(word_id):
         cur = conn.cursor()
 
         # ✅ First, check if the word exists before deleting
-        cur.execute("SELECT word FROM vocabulary WHERE id = %s AND user_id = %s;", (word_id, user_id))
+        cur.execute("SELECT id FROM vocabulary WHERE id = %s AND user_id = %s;", (word_id, user_id))
         result = cur.fetchone()
 
         if not result:
@@ -329,180 +427,304 @@ def delete_word(word_id):
         conn.commit()
         cur.close()
         conn.close()
+        bump_data_version(user_id)
 
         return jsonify({"message": "Word deleted successfully!"}), 200
 
     except Exception as e:
-        print("❌ ERROR in delete_word:", str(e))  
+        logger.exception("Error in delete_word")
+        return jsonify({"error": str(e)}), 500
+
+
+
+# --- Batch endpoints ---
+# Bodies carry either `ids` (list of ids) or `filter` (column -> accepted
+# values), plus `set` for updates. Each batch runs as a few set-based
+# statements in a single transaction.
+BATCH_MAX_IDS = 5000
+WORD_BATCH_FILTERS = {"class": "class", "part_of_speech": "part_of_speech"}
+WORD_BATCH_FIELDS = {"part_of_speech": "part_of_speech", "article": "article", "word_class": "class"}
+CONJUGATION_BATCH_FILTERS = {
+    "verb": "verb", "person": "person", "tense": "tense",
+    "verb_group": "verb_group", "irregular": "irregular", "pronominal": "pronominal",
+}
+CONJUGATION_BATCH_FIELDS = {
+    "tense": "tense", "irregular": "irregular", "pronominal": "pronominal", "verb_group": "verb_group",
+}
+# Filters match the resolved rows (table -> entries view, columns that may
+# come from the shared lexicon). A batch update of one of those columns
+# copies the rest onto the row and detaches it from its lexicon entry, like
+# update_word / update_conjugation do.
+BATCH_ENTRY_VIEWS = {
+    "vocabulary": ("vocabulary_entries", ("word", "translations", "part_of_speech", "article")),
+    "conjugations": ("conjugation_entries",
+                     ("verb", "person", "tense", "conjugation", "irregular", "pronominal", "verb_group")),
+}
+
+
+def batch_target(data, filter_columns):
+    """
+    Turn a batch request body into (conditions, params, requested_ids).
+    `requested_ids` is None for filter-based batches. Raises ValueError on a
+    malformed body.
+    """
+    ids = data.get("ids")
+    filters = data.get("filter")
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids
+        ):
+            raise ValueError("ids must be a non-empty list of integers")
+        if len(ids) > BATCH_MAX_IDS:
+            raise ValueError(f"At most {BATCH_MAX_IDS} ids per batch")
+        return ["id = ANY(%(ids)s)"], {"ids": ids}, ids
+
+    if isinstance(filters, dict) and filters:
+        conditions, params = [], {}
+        for key, values in filters.items():
+            if key not in filter_columns:
+                raise ValueError(f"Unsupported filter: {key}")
+            if not isinstance(values, list):
+                values = [values]
+            conditions.append(f"{filter_columns[key]} = ANY(%(f_{key})s)")
+            params[f"f_{key}"] = values
+        return conditions, params, None
+
+    raise ValueError("Provide either ids or a non-empty filter")
+
+
+def batch_assignments(data, field_columns):
+    """Turn the `set` object of a batch update into (SET clauses, params)."""
+    fields = data.get("set")
+    if not isinstance(fields, dict) or not fields:
+        raise ValueError("set must be a non-empty object")
+    assignments, params = [], {}
+    for key, value in fields.items():
+        if key not in field_columns:
+            raise ValueError(f"Field cannot be batch-updated: {key}")
+        if key in ("article", "word_class") and value in ["none", "", None]:
+            value = "none"
+        assignments.append(f"{field_columns[key]} = %(s_{key})s")
+        params[f"s_{key}"] = value
+    return assignments, params
+
+
+def batch_results(requested_ids, affected_ids, status):
+    """Per-id outcome; filter-based batches report the ids they matched."""
+    affected = set(affected_ids)
+    if requested_ids is None:
+        return [{"id": i, "status": status} for i in sorted(affected)]
+    return [{"id": i, "status": status if i in affected else "not_found"} for i in requested_ids]
+
+
+def run_batch_update(table, data, filter_columns, field_columns):
+    user_id = session.get("user_id")
+    try:
+        conditions, params, requested_ids = batch_target(data, filter_columns)
+        assignments, set_params = batch_assignments(data, field_columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    params.update(set_params, user_id=user_id)
+
+    view, content_columns = BATCH_ENTRY_VIEWS[table]
+    assigned = {field_columns[key] for key in data["set"]}
+    if assigned & set(content_columns):
+        assignments += [f"{column} = e.{column}" for column in content_columns if column not in assigned]
+        assignments.append("lexicon_id = NULL")
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"""
+        UPDATE {table} t SET {", ".join(assignments)}
+        FROM {view} e
+        {build_where_clause(["e.id = t.id"] + [f"e.{c}" for c in conditions + ["user_id = %(user_id)s"]])}
+        RETURNING t.id;
+    """, params)
+    updated = [row["id"] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    conn.close()
+    if updated:
+        bump_data_version(user_id)
+    return jsonify({
+        "updated": len(updated),
+        "results": batch_results(requested_ids, updated, "updated"),
+    }), 200
+
+
+def run_batch_delete(table, tracking_table, tracking_key, data, filter_columns):
+    user_id = session.get("user_id")
+    try:
+        conditions, params, requested_ids = batch_target(data, filter_columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    params["user_id"] = user_id
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # Lock the matching rows first so the tracking and main-table deletes
+    # act on exactly the same ids.
+    view, _ = BATCH_ENTRY_VIEWS[table]
+    cur.execute(f"""
+        SELECT id FROM {table}
+        WHERE user_id = %(user_id)s AND id IN (
+            SELECT id FROM {view}
+            {build_where_clause(conditions + ["user_id = %(user_id)s"])}
+        )
+        FOR UPDATE;
+    """, params)
+    doomed = [row["id"] for row in cur.fetchall()]
+    if doomed:
+        cur.execute(
+            f"DELETE FROM {tracking_table} WHERE {tracking_key} = ANY(%s) AND user_id = %s;",
+            (doomed, user_id),
+        )
+        cur.execute(f"DELETE FROM {table} WHERE id = ANY(%s) AND user_id = %s;", (doomed, user_id))
+    conn.commit()
+    cur.close()
+    conn.close()
+    if doomed:
+        bump_data_version(user_id)
+    return jsonify({
+        "deleted": len(doomed),
+        "results": batch_results(requested_ids, doomed, "deleted"),
+    }), 200
+
+
+@api.route('/batch_update_words', methods=['POST'])
+@query_budget(queries=1, rows=100)
+@login_required
+@admission_controlled("batch")
+def batch_update_words():
+    try:
+        return run_batch_update("vocabulary", request.get_json(silent=True) or {},
+                                WORD_BATCH_FILTERS, WORD_BATCH_FIELDS)
+    except Exception as e:
+        logger.exception("Error in batch_update_words")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/batch_delete_words', methods=['POST'])
+@query_budget(queries=3, rows=400)
+@login_required
+@admission_controlled("batch")
+def batch_delete_words():
+    try:
+        return run_batch_delete("vocabulary", "word_tracking", "word_id",
+                                request.get_json(silent=True) or {}, WORD_BATCH_FILTERS)
+    except Exception as e:
+        logger.exception("Error in batch_delete_words")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route('/batch_update_conjugations', methods=['POST'])
+@query_budget(queries=1, rows=100)
+@login_required
+@admission_controlled("batch")
+def batch_update_conjugations():
+    try:
+        return run_batch_update("conjugations", request.get_json(silent=True) or {},
+                                CONJUGATION_BATCH_FILTERS, CONJUGATION_BATCH_FIELDS)
+    except Exception as e:
+        logger.exception("Error in batch_update_conjugations")
         return jsonify({"error": str(e)}), 500
 
 
+@api.route('/batch_delete_conjugations', methods=['POST'])
+@query_budget(queries=3, rows=400)
+@login_required
+@admission_controlled("batch")
+def batch_delete_conjugations():
+    try:
+        return run_batch_delete("conjugations", "conjugation_tracking", "id",
+                                request.get_json(silent=True) or {}, CONJUGATION_BATCH_FILTERS)
+    except Exception as e:
+        logger.exception("Error in batch_delete_conjugations")
+        return jsonify({"error": str(e)}), 500
 
-@app.route("/start_game", methods=["POST"])
+
+@api.route("/start_game", methods=["POST"])
+@query_budget(queries=2, rows=1700)
 @login_required
+@admission_controlled("game")
 def start_game():
     try:
         user_id=session.get("user_id")
         if not request.is_json:
             return jsonify({"error": "Invalid JSON format"}), 400
         data = request.get_json()
-        classes    = data.get("classes", [])
-        parts_of_speech = data.get("parts_of_speech", [])
-        print("Received JSON Data:", data)
-
-        conn = get_db_connection()
-        cur = conn.cursor()
+        filters = word_filters(data)
+        logger.debug("start_game filters", extra={"sample": 0.1, "filters": data})
 
-        # ✅ Step 1: Check for inconsistencies between `vocabulary` and `word_tracking`
-        cur.execute("""
-            SELECT wt.word_id
-            FROM word_tracking wt
-            LEFT JOIN vocabulary v ON wt.word_id = v.id
-            WHERE v.id IS NULL;
-        """)
-        invalid_entries = cur.fetchall()
-
-        if invalid_entries:
-            print("❌ ERROR: Inconsistent word IDs in word_tracking:", invalid_entries)
-            return jsonify({"error": "Invalid word IDs found in word_tracking"}), 500
-
-        # ✅ Step 2: Check for words in `vocabulary` that are missing from `word_tracking`
-        cur.execute("""
-            SELECT v.id FROM vocabulary v
-            LEFT JOIN word_tracking wt ON v.id = wt.word_id
-            WHERE wt.word_id IS NULL;
-        """)
-        missing_words = cur.fetchall()
+        # Usually ready already: the last end_game precomputed it.
+        words = prefetch.take(user_id, "words", filters)
+        if words is None:
+            words = item_index.candidates(user_id, "words", filters)
+        if words is None:
+            conn = get_db_connection()
+            cur = conn.cursor()
 
-        if missing_words:
-            print("❌ ERROR: Missing word IDs in word_tracking:", missing_words)
-            return jsonify({"error": "Words in vocabulary not found in word_tracking"}), 500
+            # Score repair and tracking checks run in maintenance.py, not here.
+            cur.execute(*word_candidates_query(user_id, **filters))
+            words = cur.fetchall()
 
-        # ✅ Step 3: Update scores in `word_tracking`
-        cur.execute("""
-            UPDATE word_tracking
-            SET score = GREATEST(
-                1 + (array_length(mistake_timestamps, 1) * 2) + 
-                EXTRACT(EPOCH FROM (NOW() - COALESCE(last_accessed, '2000-01-01'::TIMESTAMPTZ))) / 3600,
-                1
-            )
-            WHERE score IS NULL OR score < 1;
-        """)
-        conn.commit()
-        print("✅ Updated scores for existing words.")
-
-        # --- Step 2: build WHERE clauses ---
-        where_clauses = ["v.user_id = %(user_id)s"]
-        params = {"user_id": user_id}
-
-        if classes:
-            where_clauses.append("v.class = ANY(%(classes)s)")
-            params["classes"] = classes
-
-        if parts_of_speech:
-            where_clauses.append("v.part_of_speech = ANY(%(parts_of_speech)s)")
-            params["parts_of_speech"] = parts_of_speech
-
-        where_sql = " AND ".join(where_clauses)
-
-        # --- Step 3: pick your words ---
-        query = f"""
-        SELECT v.id, v.word, v.translations, v.part_of_speech, v.article, v.class
-        FROM vocabulary v
-        JOIN word_tracking wt ON v.id = wt.word_id
-        WHERE {where_sql}
-        ORDER BY RANDOM() * wt.score DESC
-        LIMIT 500
-        """
-        cur.execute(query, params)
-        words = cur.fetchall()
-
-        cur.close()
-        conn.close()
+            cur.close()
+            conn.close()
 
         return jsonify({"words": words}), 200  # 🔥 Only return words, no game_id
 
     except psycopg2.Error as e:
-        print("❌ PostgreSQL Error:", e.pgcode, e.pgerror)
+        logger.exception("PostgreSQL error in start_game", extra={"pgcode": e.pgcode})
         return jsonify({"error": f"PostgreSQL Error: {e.pgerror}"}), 500
     except Exception as e:
-        print("❌ General Database Error:", str(e))
+        logger.exception("Error in start_game")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/end_game", methods=["POST"])
+@api.route("/end_game", methods=["POST"])
+@query_budget(queries=2, rows=450)
 @login_required
+@admission_controlled("game")
 def end_game():
     if not request.is_json:
         return jsonify({"error": "Invalid JSON format"}), 400
     user_id=session.get("user_id")
     data = request.get_json()
     results = data.get("results")       # List of word attempts
-    time_limit = data.get("time_limit") / 60
-    game_type = data.get("game_type")
-    zen_mode = data.get("zen_mode")
-    total_attempts = data.get("total_attempts")  # total words attempted
-    score = data.get("score")                   # final correct words
-    ungraded = data.get("ungraded", False)      # new boolean
-    classes      = data.get("classes", ["all"])  # default to ['all']
-    parts_of_speech = data.get("parts_of_speech", ["all"])
-
-    if results is None or total_attempts is None or score is None:
+
+    if results is None or data.get("total_attempts") is None or data.get("score") is None:
         return jsonify({"error": "Missing required data"}), 400
 
     try:
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # Insert a row in game_runs, now including 'ungraded'
-        cur.execute("""
-            INSERT INTO game_runs 
-              (time_limit, game_type, zen_mode, total_words_attempted, correct_words, ungraded, user_id, classes, parts_of_speech)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """, (time_limit, game_type, zen_mode, total_attempts, score, ungraded, user_id, classes, parts_of_speech))
-
-        # For each word attempt, update word_tracking
-        for result in results:
-            word_id = result["word_id"]
-            correct = result["correct"]
-
-            # update last_accessed, total_attempts, mistake_timestamps
-            cur.execute("""
-                UPDATE word_tracking
-                SET last_accessed = NOW(),
-                    total_attempts = total_attempts + 1,
-                    mistake_timestamps = CASE
-                        WHEN %s = FALSE THEN array_append(mistake_timestamps, NOW())
-                        ELSE mistake_timestamps
-                    END
-                WHERE word_id = %s AND user_id= %s;
-            """, (correct, word_id, user_id))
-
-            # Adjust the word's score
-            cur.execute("""
-                UPDATE word_tracking
-                SET score = GREATEST(
-                    3 + (array_length(mistake_timestamps, 1) * 2) +
-                        EXTRACT(EPOCH FROM (NOW() - last_accessed)) / 3600,
-                    3
-                )
-                WHERE word_id = %s AND user_id= %s;
-            """, (word_id, user_id))
+        # Insert a row in game_runs, then apply every attempt in one UPDATE
+        cur.execute(*record_word_game_query(user_id, data))
+        if results:
+            cur.execute(*update_word_tracking_query(user_id, results))
 
         conn.commit()
         cur.close()
         conn.close()
 
+        item_index.record_results(user_id, "words", [r["word_id"] for r in results],
+                                  [r["correct"] is False for r in results])
+        if data.get("prefetch", True):
+            filters = word_filters(data)
+            prefetch.schedule(user_id, "words", filters, word_candidates_query(user_id, **filters))
+
         return jsonify({"message": "Game ended successfully!"}), 200
 
     except Exception as e:
-        print("❌ Error in end_game:", str(e))
+        logger.exception("Error in end_game")
         return jsonify({"error": str(e)}), 500
 
 
 
 # ✅ Add a new conjugation entry
-@app.route('/add_conjugation', methods=['POST'])
+@api.route('/add_conjugation', methods=['POST'])
+@query_budget(queries=5, rows=700)
 @login_required
 def add_conjugation():
     try:
@@ -525,7 +747,7 @@ def add_conjugation():
 
         # ✅ Check if this conjugation already exists for this verb
         cur.execute("""
-            SELECT id FROM conjugations
+            SELECT id FROM conjugation_entries
             WHERE verb = %s AND person = %s AND tense = %s AND user_id = %s;
         """, (verb, person, tense, user_id))
         result = cur.fetchone()
@@ -535,42 +757,48 @@ def add_conjugation():
             conjugation_id = result["id"]
             message = "Conjugation already exists."
         else:
-            # ✅ Insert new conjugation and get its ID
+            # ✅ Find or create the shared lexicon entry, then insert the user's row
+            lexicon_id = resolve_conjugations(
+                cur, [(verb, person, tense, conjugation, irregular, pronominal, verb_group)]
+            )[0]
             cur.execute("""
-                INSERT INTO conjugations (verb, person, tense, conjugation, irregular, pronominal, verb_group, user_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO conjugations (lexicon_id, user_id)
+                VALUES (%s, %s)
                 RETURNING id;
-            """, (verb, person, tense, conjugation, irregular, pronominal, verb_group, user_id))
+            """, (lexicon_id, user_id))
             result = cur.fetchone()
             conjugation_id = result["id"]
             message = "Conjugation added successfully."
 
             # ✅ Also insert into `conjugation_tracking`
             cur.execute("""
-                INSERT INTO conjugation_tracking (id, verb, person, tense, total_attempts, mistake_timestamps, last_accessed, score, user_id)
-                VALUES (%s, %s, %s, %s, 0, ARRAY[]::TIMESTAMPTZ[], NOW(), 5, %s);
-            """, (conjugation_id, verb, person, tense, user_id))
+                INSERT INTO conjugation_tracking (id, total_attempts, mistake_timestamps, last_accessed, score, user_id)
+                VALUES (%s, 0, ARRAY[]::TIMESTAMPTZ[], NOW(), 5, %s);
+            """, (conjugation_id, user_id))
 
         conn.commit()
         cur.close()
         conn.close()
+        bump_data_version(user_id)
 
         return jsonify({"message": message, "conjugation_id": conjugation_id}), 201
 
     except Exception as e:
-        print("❌ ERROR in add_conjugation:", str(e))  
+        logger.exception("Error in add_conjugation")
         return jsonify({"error": str(e)}), 500
 
 
 # ✅ Retrieve all conjugations
-@app.route('/get_conjugations', methods=['GET'])
+@api.route('/get_conjugations', methods=['GET'])
+@query_budget(queries=1, rows=700)
 @login_required
+@conditional_get
 def get_conjugations():
     try:
         conn = get_db_connection()
         user_id=session.get("user_id")
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM conjugations WHERE user_id = %s;", (user_id,))
+        cur.execute("SELECT * FROM conjugation_entries WHERE user_id = %s;", (user_id,))
         conjugations = cur.fetchall()
         cur.close()
         conn.close()
@@ -579,7 +807,8 @@ def get_conjugations():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/update_conjugation/<int:conjugation_id>', methods=['PUT'])
+@api.route('/update_conjugation/<int:conjugation_id>', methods=['PUT'])
+@query_budget(queries=1, rows=10)
 @login_required
 def update_conjugation(conjugation_id):
     try:
@@ -601,43 +830,32 @@ def update_conjugation(conjugation_id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
-        # ✅ Fetch the existing conjugation before updating
-        cur.execute("""
-            SELECT verb, person, tense FROM conjugations WHERE id = %s AND user_id = %s;
-        """, (conjugation_id, user_id))
-        result = cur.fetchone()
-
-        if not result:
-            return jsonify({"error": "Conjugation not found"}), 404
-
-        old_verb, old_person, old_tense = result["verb"], result["person"], result["tense"]
-
-        # ✅ Update `conjugations` table
+        # ✅ Update `conjugations` table (conjugation_tracking holds no copy of the text);
+        # the row now owns all its columns, so it no longer uses the shared entry
         cur.execute("""
             UPDATE conjugations 
-            SET verb = %s, person = %s, tense = %s, conjugation = %s, irregular = %s, pronominal = %s, verb_group= %s
-            WHERE id = %s AND user_id = %s;
+            SET verb = %s, person = %s, tense = %s, conjugation = %s, irregular = %s, pronominal = %s, verb_group= %s,
+                lexicon_id = NULL
+            WHERE id = %s AND user_id = %s
+            RETURNING id;
         """, (new_verb, new_person, new_tense, new_conjugation, irregular, pronominal, verb_group, conjugation_id, user_id))
 
-        # ✅ If the verb, person, or tense changed, update `conjugation_tracking`
-        if (old_verb, old_person, old_tense) != (new_verb, new_person, new_tense):
-            cur.execute("""
-                UPDATE conjugation_tracking 
-                SET verb = %s, person = %s, tense = %s
-                WHERE id = %s AND user_id = %s;
-            """, (new_verb, new_person, new_tense, conjugation_id, user_id))
+        if not cur.fetchone():
+            return jsonify({"error": "Conjugation not found"}), 404
 
         conn.commit()
         cur.close()
         conn.close()
+        bump_data_version(user_id)
 
         return jsonify({"message": "Conjugation updated successfully!"}), 200
 
     except Exception as e:
-        print("❌ ERROR in update_conjugation:", str(e))  
+        logger.exception("Error in update_conjugation")
         return jsonify({"error": str(e)}), 500
     
-@app.route('/delete_conjugation/<int:conjugation_id>', methods=['DELETE'])
+@api.route('/delete_conjugation/<int:conjugation_id>', methods=['DELETE'])
+@query_budget(queries=3, rows=10)
 @login_required
 def delete_conjugation(conjugation_id):
     try:
@@ -646,7 +864,7 @@ def delete_conjugation(conjugation_id):
         user_id=session.get("user_id")
 
         # ✅ First, check if the conjugation exists
-        cur.execute("SELECT verb FROM conjugations WHERE id = %s AND user_id = %s;", (conjugation_id, user_id))
+        cur.execute("SELECT id FROM conjugations WHERE id = %s AND user_id = %s;", (conjugation_id, user_id))
         result = cur.fetchone()
 
         if not result:
@@ -661,17 +879,20 @@ def delete_conjugation(conjugation_id):
         conn.commit()
         cur.close()
         conn.close()
+        bump_data_version(user_id)
 
         return jsonify({"message": "Conjugation deleted successfully!"}), 200
 
     except Exception as e:
-        print("❌ ERROR in delete_conjugation:", str(e))  
+        logger.exception("Error in delete_conjugation")
         return jsonify({"error": str(e)}), 500
 
 
 
-@app.route("/start_conjugation_game", methods=["POST"])
+@api.route("/start_conjugation_game", methods=["POST"])
+@query_budget(queries=2, rows=1700)
 @login_required
+@admission_controlled("game")
 def start_conjugation_game():
     try:
         if not request.is_json:
@@ -679,113 +900,37 @@ def start_conjugation_game():
 
         data = request.get_json()
         user_id=session.get("user_id")
-        print("Received JSON Data:", data)
+        logger.debug("start_conjugation_game filters", extra={"sample": 0.1, "filters": data})
 
         # 1) Parse advanced filters
-        time_limit = data.get("time_limit", 300)
-        mode = data.get("mode", "both")   # "regular", "irregular", or "both"
-        tenses = data.get("tenses", [])   # array of strings
-        groups = data.get("groups", [])   # array of ints
-        pronominal_mode = data.get("pronominal_mode", "both")  # "only", "exclude", "both"
-        params = {"user_id": user_id}
+        filters = conjugation_filters(data)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Usually ready already: the last end_conjugation_game precomputed it.
+        conjugations = prefetch.take(user_id, "conjugations", filters)
+        if conjugations is None:
+            conjugations = item_index.candidates(user_id, "conjugations", filters)
+        if conjugations is None:
+            conn = get_db_connection()
+            cur = conn.cursor()
 
-        # --- Step 1: Validate your tracking tables (same as before) ---
-        # (unchanged code) ...
-        cur.execute("""
-            SELECT ct.id
-            FROM conjugation_tracking ct
-            LEFT JOIN conjugations c ON ct.id = c.id
-            WHERE c.id IS NULL;
-        """)
-        invalid_entries = cur.fetchall()
-        if invalid_entries:
-            print("❌ ERROR: Inconsistent IDs in conj tracking:", invalid_entries)
-            return jsonify({"error": "Inconsistent conj IDs found"}), 500
+            # Score repair and tracking checks run in maintenance.py, not here.
+            cur.execute(*conjugation_candidates_query(user_id, **filters))
+            conjugations = cur.fetchall()
 
-        cur.execute("""
-            SELECT c.id FROM conjugations c
-            LEFT JOIN conjugation_tracking ct ON c.id = ct.id
-            WHERE ct.id IS NULL;
-        """)
-        missing_conjugations = cur.fetchall()
-        if missing_conjugations:
-            print("❌ ERROR: Missing conj in tracking:", missing_conjugations)
-            return jsonify({"error": "Some conj are missing from tracking"}), 500
-
-        # Step 2: Update scores if needed (same as before)
-        cur.execute("""
-            UPDATE conjugation_tracking
-            SET score = GREATEST(
-                1 + (array_length(mistake_timestamps, 1) * 2) + 
-                EXTRACT(EPOCH FROM (NOW() - COALESCE(last_accessed, '2000-01-01'::TIMESTAMPTZ))) / 3600,
-                1
-            )
-            WHERE score IS NULL OR score < 1;
-        """)
-        conn.commit()
-
-        # 2) Build WHERE clauses
-        where_clauses = []
-        where_clauses.append("c.user_id = %(user_id)s")
-
-        # (a) Filter by "mode" => irregular
-        if mode == "regular":
-            where_clauses.append("c.irregular = FALSE")
-        elif mode == "irregular":
-            where_clauses.append("c.irregular = TRUE")
-        # if "both", we do no filter
-
-        # (b) Filter by tenses
-        if len(tenses) > 0:
-            where_clauses.append("c.tense = ANY(%(tenses)s)")
-            params["tenses"] = tenses  # e.g. ["présent","imparfait"]
-
-        # (c) Filter by groups
-        if len(groups) > 0:
-            where_clauses.append("c.verb_group = ANY(%(groups)s)")
-            params["groups"] = groups  # e.g. [1,2]
-
-        # (d) pronominal mode
-        if pronominal_mode == "only":
-            where_clauses.append("c.pronominal = TRUE")
-        elif pronominal_mode == "exclude":
-            where_clauses.append("c.pronominal = FALSE")
-        # if "both", no filter
-
-        # Build final WHERE
-        where_sql = ""
-        if where_clauses:
-            where_sql = "WHERE " + " AND ".join(where_clauses)
-
-        # Step 3: Query
-        query = f"""
-            SELECT c.id, c.verb, c.person, c.tense, c.conjugation, 
-                   c.irregular, c.pronominal, c.verb_group
-            FROM conjugations c
-            JOIN conjugation_tracking ct ON c.id = ct.id
-            {where_sql}
-            ORDER BY RANDOM() * ct.score DESC
-            LIMIT 500;
-        """
-
-        cur.execute(query, params)
-        conjugations = cur.fetchall()
-
-        cur.close()
-        conn.close()
+            cur.close()
+            conn.close()
 
         return jsonify({"conjugations": conjugations}), 200
 
     except Exception as e:
-        print("❌ Error in start_conjugation_game:", str(e))
+        logger.exception("Error in start_conjugation_game")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/end_conjugation_game", methods=["POST"])
+@api.route("/end_conjugation_game", methods=["POST"])
+@query_budget(queries=2, rows=450)
 @login_required
+@admission_controlled("game")
 def end_conjugation_game():
     if not request.is_json:
         return jsonify({"error": "Invalid JSON format"}), 400
@@ -793,357 +938,368 @@ def end_conjugation_game():
     data = request.get_json()
     user_id=session.get("user_id")
     results = data.get("results")  # List of attempts
-    time_limit = data.get("time_limit")  # in seconds
-    mode = data.get("mode")  # "regular","irregular","both"
-    zen_mode = data.get("zen_mode", False)
-    ungraded = data.get("ungraded", False)
-    tenses = data.get("tenses", [])  # array of strings
-    groups = data.get("groups", [])  # array of ints
-    pronominal_mode = data.get("pronominal_mode", "both")
-
-    total_attempts = data.get("total_attempts")
-    correct_answers = data.get("correct_answers")  # or "score"
-
-    if results is None or total_attempts is None or correct_answers is None:
+
+    if results is None or data.get("total_attempts") is None or data.get("correct_answers") is None:
         return jsonify({"error": "Missing required data"}), 400
 
     try:
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # Insert a row in "conjugation_game_runs"
-        # storing each field in the new columns
-        # e.g. "end_time" is optional
-        cur.execute("""
-            INSERT INTO conjugation_game_runs (
-              end_time,
-              time_limit,
-              mode,
-              zen_mode,
-              ungraded,
-              tenses,
-              groups,
-              pronominal_mode,
-              total_attempts,
-              correct_answers,
-              user_id
-            )
-            VALUES (
-              NOW(),
-              %s, %s, %s, %s,
-              %s, %s, %s,
-              %s, %s, %s
-            );
-        """, (
-            time_limit,
-            mode,
-            zen_mode,
-            ungraded,
-            tenses,            # TEXT[]
-            groups,            # INT[]
-            pronominal_mode,   # TEXT
-            total_attempts,
-            correct_answers, 
-            user_id
-        ))
-
-        # Update each attempt in "conjugation_tracking"
-        for result in results:
-            conj_id = result["id"]
-            correct = result["correct"]
-
-            # update usage
-            cur.execute("""
-                UPDATE conjugation_tracking
-                SET last_accessed = NOW(),
-                    total_attempts = total_attempts + 1
-                WHERE id = %s AND user_id = %s;
-            """, (conj_id, user_id))
-
-            if not correct:
-                cur.execute("""
-                    UPDATE conjugation_tracking
-                    SET mistake_timestamps = array_append(mistake_timestamps, NOW())
-                    WHERE id = %s AND user_id = %s;
-                """, (conj_id, user_id))
-
-            # re-calc score
-            cur.execute("""
-                UPDATE conjugation_tracking
-                SET score = GREATEST(
-                    3 + (array_length(mistake_timestamps, 1) * 2) +
-                        EXTRACT(EPOCH FROM (NOW() - last_accessed)) / 3600,
-                    3
-                )
-                WHERE id = %s AND user_id = %s;
-            """, (conj_id, user_id))
+        # Insert a row in "conjugation_game_runs", then apply every attempt
+        # to "conjugation_tracking" in one UPDATE
+        cur.execute(*record_conjugation_game_query(user_id, data))
+        if results:
+            cur.execute(*update_conjugation_tracking_query(user_id, results))
 
         conn.commit()
         cur.close()
         conn.close()
 
+        item_index.record_results(user_id, "conjugations", [r["id"] for r in results],
+                                  [not r["correct"] for r in results])
+        if data.get("prefetch", True):
+            filters = conjugation_filters(data)
+            prefetch.schedule(user_id, "conjugations", filters,
+                              conjugation_candidates_query(user_id, **filters))
+
         return jsonify({"message": "Conjugation game ended successfully!"}), 200
 
     except Exception as e:
-        print("❌ ERROR in end_conjugation_game:", str(e))
+        logger.exception("Error in end_conjugation_game")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/stats", methods=["GET"])
+@api.route("/stats", methods=["GET"])
+@query_budget(queries=15, rows=4000)
 @login_required
+@admission_controlled("stats")
 def get_stats():
     try:
         time_range = request.args.get("range", "all")
-
-        # Define base time filters.
-        if time_range == "week":
-            base_time = ">= NOW() - INTERVAL '7 days'"
-        elif time_range == "month":
-            base_time = ">= NOW() - INTERVAL '30 days'"
-        else:
-            base_time = None
-
-        # Helper lists of conditions for each section.
-        user_condition = "user_id = %s"
-
-        # For vocabulary, conjugations, game_runs, conjugation_game_runs, and tracking.
-        vocab_conditions = []
-        conj_conditions = []
-        game_conditions = []         # For game_runs table.
-        conj_game_conditions = []    # For conjugation_game_runs table.
-        tracking_conditions = []     # For word_tracking and conjugation_tracking.
-
-        if base_time:
-            vocab_conditions.append("created_at " + base_time)
-            conj_conditions.append("created_at " + base_time)
-            game_conditions.append("timestamp " + base_time)
-            conj_game_conditions.append("end_time " + base_time)
-            tracking_conditions.append("last_accessed " + base_time)
-
-        # Always add the user condition.
-        vocab_conditions.append(user_condition)
-        conj_conditions.append(user_condition)
-        game_conditions.append(user_condition)
-        conj_game_conditions.append(user_condition)
-        tracking_conditions.append(user_condition)
-
-        # Build WHERE clauses.
-        vocab_clause = build_where_clause(vocab_conditions)
-        conj_clause = build_where_clause(conj_conditions)
-        game_clause = build_where_clause(game_conditions)
-        conj_game_clause = build_where_clause(conj_game_conditions)
-        tracking_clause = build_where_clause(tracking_conditions)
-
-        # Now, for graded/ungraded queries add the extra "ungraded" condition.
-        # For game_runs:
-        graded_game_clause = build_where_clause(game_conditions + ["ungraded = FALSE"])
-        ungraded_game_clause = build_where_clause(game_conditions + ["ungraded = TRUE"])
-        # For conjugation_game_runs:
-        graded_conj_game_clause = build_where_clause(conj_game_conditions + ["ungraded = FALSE"])
-        ungraded_conj_game_clause = build_where_clause(conj_game_conditions + ["ungraded = TRUE"])
-        # For tracking, filter for total_attempts > 0:
-        word_tracking_clause = build_where_clause(tracking_conditions + ["total_attempts > 0"])
-        conj_tracking_clause = build_where_clause(tracking_conditions + ["total_attempts > 0"])
+        user_id = session.get("user_id")
 
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        rows = {}
+        for section in stats_queries(time_range, user_id).values():
+            for name, sql, params in section:
+                cur.execute(sql, params)
+                rows[name] = cur.fetchall()
+        result = shape_stats(rows)
+
+        cur.close()
+        conn.close()
+        return jsonify(result), 200
+
+    except Exception as e:
+        logger.exception("Error in get_stats")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/stats/growth", methods=["GET"])
+@query_budget(queries=1, rows=2000)
+@login_required
+@admission_controlled("stats")
+def get_growth():
+    """
+    Growth time series over an arbitrary date range.
+
+    Query args: `granularity` ("day", "week" or "month", default "day"),
+    `start` and `end` as inclusive YYYY-MM-DD dates (both optional; `end`
+    defaults to today, and without `start` the series covers at most
+    MAX_GROWTH_BUCKETS buckets).
+    """
+    granularity = request.args.get("granularity", "day")
+    if granularity not in GROWTH_GRANULARITIES:
+        return jsonify({"error": "granularity must be one of: day, week, month"}), 400
+
+    try:
+        start = request.args.get("start")
+        end = request.args.get("end")
+        start = date.fromisoformat(start) if start else None
+        # `end` is inclusive for callers; the series bound is exclusive.
+        end = date.fromisoformat(end) if end else date.today()
+        end += timedelta(days=1)
+    except ValueError:
+        return jsonify({"error": "start and end must be dates in YYYY-MM-DD format"}), 400
+    except OverflowError:
+        return jsonify({"error": "end is out of range"}), 400
+
+    if start:
+        if start >= end:
+            return jsonify({"error": "start must not be after end"}), 400
+        days_per_bucket = {"day": 1, "week": 7, "month": 28}[granularity]
+        if (end - start).days / days_per_bucket > MAX_GROWTH_BUCKETS:
+            return jsonify({"error": "Date range too large for this granularity"}), 400
+
+    try:
+        user_id = session.get("user_id")
+        conn = get_db_connection()
+        cur = conn.cursor()
+        series = fetch_growth_series(cur, user_id, granularity, start=start, end=end,
+                                     max_buckets=MAX_GROWTH_BUCKETS)
+        cur.close()
+        conn.close()
+        return jsonify({"granularity": granularity, "series": series}), 200
+    except Exception as e:
+        logger.exception("Error in get_growth")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/stats/breakdown", methods=["GET"])
+@query_budget(queries=1, rows=30)
+@login_required
+@admission_controlled("stats")
+def get_breakdown():
+    """
+    All-time accuracy per class and part of speech (vocabulary) and per
+    tense, verb group and pronominal (conjugations), read from the
+    counters the end-game routes maintain.
+    """
+    try:
         user_id = session.get("user_id")
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(*accuracy_breakdown_query(user_id))
+        result = shape_breakdown(cur.fetchall())
+        cur.close()
+        conn.close()
+        return jsonify(result), 200
+    except Exception as e:
+        logger.exception("Error in get_breakdown")
+        return jsonify({"error": str(e)}), 500
+
+
+SEARCH_MODES = ("prefix", "substring", "fuzzy")
+SEARCH_SCOPES = ("all", "words", "conjugations")
+MAX_SEARCH_LIMIT = 100
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
-        params = (user_id,)
-
-        # --- OVERVIEW STATS ---
-        cur.execute(f"SELECT COUNT(*) AS words_added FROM vocabulary {vocab_clause};", params)
-        words_added = cur.fetchone()["words_added"]
-
-        cur.execute(f"SELECT COUNT(*) AS conj_added FROM conjugations {conj_clause};", params)
-        conj_added = cur.fetchone()["conj_added"]
-
-        cur.execute(f"SELECT COUNT(*) AS word_games_played FROM game_runs {game_clause};", params)
-        word_games_played = cur.fetchone()["word_games_played"]
-
-        cur.execute(f"SELECT COUNT(*) AS conj_games_played FROM conjugation_game_runs {conj_game_clause};", params)
-        conj_games_played = cur.fetchone()["conj_games_played"]
-
-        # Accuracy calculations for graded attempts.
-        cur.execute(f"""
-            SELECT COALESCE(SUM(correct_words),0) AS word_correct,
-                   COALESCE(SUM(total_words_attempted),0) AS word_attempts
-            FROM game_runs {graded_game_clause};
-        """, params)
-        word_stats = cur.fetchone()
-
-        cur.execute(f"""
-            SELECT COALESCE(SUM(correct_answers),0) AS conj_correct,
-                   COALESCE(SUM(total_attempts),0) AS conj_attempts
-            FROM conjugation_game_runs {graded_conj_game_clause};
-        """, params)
-        conj_stats = cur.fetchone()
-
-        total_attempts = word_stats["word_attempts"] + conj_stats["conj_attempts"]
-        total_correct = word_stats["word_correct"] + conj_stats["conj_correct"]
-        avg_accuracy = (total_correct / total_attempts * 100) if total_attempts > 0 else 0
-
-        # Most frequent format played
-        cur.execute(f"""
-            SELECT CONCAT('Vocabulary (', game_type, '), ', (time_limit * 60), 's, ',
-                          CASE WHEN ungraded THEN 'Ungraded' ELSE 'Graded' END) AS format,
-                          COUNT(*) AS cnt
-            FROM game_runs {game_clause}
-            GROUP BY format;
-        """, params)
-        word_formats = cur.fetchall()
-
-        cur.execute(f"""
-            SELECT CONCAT('Conjugation, ', time_limit, 's, ',
-                          CASE WHEN ungraded THEN 'Ungraded' ELSE 'Graded' END) AS format,
-                          COUNT(*) AS cnt
-            FROM conjugation_game_runs {conj_game_clause}
-            GROUP BY format;
-        """, params)
-        conj_formats = cur.fetchall()
-
-        all_formats = word_formats + conj_formats
-        most_frequent_format = "N/A"
-        if all_formats:
-            all_formats.sort(key=lambda x: x["cnt"], reverse=True)
-            most_frequent_format = all_formats[0]["format"]
-
-        overall_stats = {
-            "wordsAdded": words_added,
-            "conjugationsAdded": conj_added,
-            "wordGamesPlayed": word_games_played,
-            "conjugationGamesPlayed": conj_games_played,
-            "averageAccuracy": round(avg_accuracy, 2),
-            "mostFrequentFormat": most_frequent_format
-        }
-
-        # --- CUMULATIVE GROWTH DATA ---
-        cur.execute(f"""
-            SELECT date_trunc('day', created_at) AS day, COUNT(*) AS count
-            FROM vocabulary {vocab_clause}
-            GROUP BY day
-            ORDER BY day;
-        """, params)
-        word_daily = cur.fetchall()
-
-        cur.execute(f"""
-            SELECT date_trunc('day', created_at) AS day, COUNT(*) AS count
-            FROM conjugations {conj_clause}
-            GROUP BY day
-            ORDER BY day;
-        """, params)
-        conj_daily = cur.fetchall()
-
-        cumulative = {}
-        for row in word_daily:
-            day_str = row["day"].strftime("%Y-%m-%d")
-            cumulative[day_str] = {"newWords": row["count"], "newConjugations": 0}
-        for row in conj_daily:
-            day_str = row["day"].strftime("%Y-%m-%d")
-            if day_str in cumulative:
-                cumulative[day_str]["newConjugations"] = row["count"]
-            else:
-                cumulative[day_str] = {"newWords": 0, "newConjugations": row["count"]}
-        dates = sorted(cumulative.keys())
-        cumulative_growth = []
-        cum_words = 0
-        cum_conjs = 0
-        for d in dates:
-            cum_words += cumulative[d]["newWords"]
-            cum_conjs += cumulative[d]["newConjugations"]
-            cumulative_growth.append({
-                "date": d,
-                "cumulativeWords": cum_words,
-                "cumulativeConjugations": cum_conjs
-            })
-
-        # --- RUN DATA FOR GRAPHS ---
-        cur.execute(f"""
-            SELECT timestamp AS run_date,
-                   CASE WHEN total_words_attempted = 0 THEN 0
-                        ELSE (correct_words::float/total_words_attempted*100)
-                   END AS accuracy
-            FROM game_runs {graded_game_clause}
-            ORDER BY timestamp;
-        """, params)
-        graded_word_runs = cur.fetchall()
-
-        cur.execute(f"""
-            SELECT end_time AS run_date,
-                   CASE WHEN total_attempts = 0 THEN 0
-                        ELSE (correct_answers::float/total_attempts*100)
-                   END AS accuracy
-            FROM conjugation_game_runs {graded_conj_game_clause}
-            ORDER BY end_time;
-        """, params)
-        graded_conj_runs = cur.fetchall()
-
-        cur.execute(f"""
-            SELECT timestamp AS run_date, correct_words AS score, time_limit,
-                   (correct_words::float/(time_limit * 60)) AS ratio
-            FROM game_runs {ungraded_game_clause}
-            ORDER BY timestamp;
-        """, params)
-        ungraded_word_runs = cur.fetchall()
-
-        cur.execute(f"""
-            SELECT end_time AS run_date, correct_answers AS score, time_limit,
-                   (correct_answers::float/time_limit) AS ratio
-            FROM conjugation_game_runs {ungraded_conj_game_clause}
-            ORDER BY end_time;
-        """, params)
-        ungraded_conj_runs = cur.fetchall()
-
-        # --- BEST/WORST WORDS ---
-        cur.execute(f"""
-            SELECT word, total_attempts,
-                   COALESCE(array_length(mistake_timestamps, 1), 0) AS mistakes
-            FROM word_tracking {word_tracking_clause};
-        """, params)
-        word_stats_rows = cur.fetchall()
-        for row in word_stats_rows:
-            attempts = row["total_attempts"]
-            mistakes = row["mistakes"]
-            row["accuracy"] = ((attempts - mistakes) / attempts * 100) if attempts > 0 else 0
-        best_words = sorted(word_stats_rows, key=lambda r: (r["accuracy"], r["total_attempts"]), reverse=True)[:5]
-        worst_words = sorted(word_stats_rows, key=lambda r: (r["mistakes"], r["total_attempts"]), reverse=True)[:5]
-
-        # --- BEST/WORST CONJUGATIONS ---
-        cur.execute(f"""
-            SELECT verb, tense, person, total_attempts,
-                   COALESCE(array_length(mistake_timestamps, 1), 0) AS mistakes
-            FROM conjugation_tracking {conj_tracking_clause};
-        """, params)
-        conj_stats_rows = cur.fetchall()
-        for row in conj_stats_rows:
-            attempts = row["total_attempts"]
-            mistakes = row["mistakes"]
-            row["accuracy"] = ((attempts - mistakes) / attempts * 100) if attempts > 0 else 0
-        best_conjs = sorted(conj_stats_rows, key=lambda r: (r["accuracy"], r["total_attempts"]), reverse=True)[:5]
-        worst_conjs = sorted(conj_stats_rows, key=lambda r: (r["mistakes"], r["total_attempts"]), reverse=True)[:5]
-
-        result = {
-            "overallStats": overall_stats,
-            "cumulativeGrowth": cumulative_growth,
-            "gradedWordRuns": graded_word_runs,
-            "gradedConjRuns": graded_conj_runs,
-            "ungradedWordRuns": ungraded_word_runs,
-            "ungradedConjRuns": ungraded_conj_runs,
-            "bestWords": best_words,
-            "worstWords": worst_words,
-            "bestConjugations": best_conjs,
-            "worstConjugations": worst_conjs
-        }
 
+def search_words(cur, user_id, q, mode, limit, offset):
+    """
+    Ranked page of vocabulary rows whose word or translations match `q`.
+    Text lives in the shared lexicon, so this reads the user's rows through
+    vocabulary_entries (via the user_id index) and matches them there.
+    """
+    if mode == "fuzzy":
+        match = "(lower(v.word) %% %(q)s OR %(q)s <%% leximax_search_text(v.translations))"
+    elif mode == "prefix":
+        match = """(lower(v.word) LIKE %(prefix)s
+                    OR leximax_search_text(v.translations) LIKE %(prefix)s
+                    OR leximax_search_text(v.translations) LIKE %(word_prefix)s)"""
+    else:
+        match = """(lower(v.word) LIKE %(substring)s
+                    OR leximax_search_text(v.translations) LIKE %(substring)s)"""
+
+    cur.execute(f"""
+        SELECT v.id, v.word, v.translations, v.part_of_speech, v.article, v.class,
+               GREATEST(similarity(lower(v.word), %(q)s),
+                        word_similarity(%(q)s, leximax_search_text(v.translations)))
+               + CASE WHEN lower(v.word) = %(q)s THEN 1
+                      WHEN lower(v.word) LIKE %(prefix)s THEN 0.5
+                      ELSE 0 END AS rank,
+               COUNT(*) OVER () AS total
+        FROM vocabulary_entries v
+        WHERE v.user_id = %(user_id)s AND {match}
+        ORDER BY rank DESC, v.word, v.id
+        LIMIT %(limit)s OFFSET %(offset)s;
+    """, search_params(user_id, q, limit, offset))
+    return cur.fetchall()
+
+
+def search_conjugations(cur, user_id, q, mode, limit, offset):
+    """Ranked page of conjugations whose verb or conjugated form matches `q`."""
+    if mode == "fuzzy":
+        match = "(lower(c.verb) %% %(q)s OR lower(c.conjugation) %% %(q)s)"
+    elif mode == "prefix":
+        match = "(lower(c.verb) LIKE %(prefix)s OR lower(c.conjugation) LIKE %(prefix)s)"
+    else:
+        match = "(lower(c.verb) LIKE %(substring)s OR lower(c.conjugation) LIKE %(substring)s)"
+
+    cur.execute(f"""
+        SELECT c.id, c.verb, c.person, c.tense, c.conjugation,
+               c.irregular, c.pronominal, c.verb_group,
+               GREATEST(similarity(lower(c.verb), %(q)s),
+                        similarity(lower(c.conjugation), %(q)s))
+               + CASE WHEN lower(c.verb) = %(q)s OR lower(c.conjugation) = %(q)s THEN 1
+                      WHEN lower(c.verb) LIKE %(prefix)s OR lower(c.conjugation) LIKE %(prefix)s THEN 0.5
+                      ELSE 0 END AS rank,
+               COUNT(*) OVER () AS total
+        FROM conjugation_entries c
+        WHERE c.user_id = %(user_id)s AND {match}
+        ORDER BY rank DESC, c.verb, c.tense, c.person, c.id
+        LIMIT %(limit)s OFFSET %(offset)s;
+    """, search_params(user_id, q, limit, offset))
+    return cur.fetchall()
+
+
+def search_params(user_id, q, limit, offset):
+    escaped = escape_like(q)
+    return {
+        "user_id": user_id,
+        "q": q,
+        "prefix": escaped + "%",
+        "word_prefix": "% " + escaped + "%",
+        "substring": "%" + escaped + "%",
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+def search_page(rows, limit, offset):
+    total = rows[0]["total"] if rows else 0
+    for row in rows:
+        del row["total"]
+        row["rank"] = round(row["rank"], 4)
+    return {"results": rows, "total": total, "limit": limit, "offset": offset}
+
+
+@api.route("/search", methods=["GET"])
+@query_budget(queries=2, rows=1300)
+@login_required
+@admission_controlled("search")
+def search():
+    """
+    Server-side search over the user's words and conjugations.
+
+    Query args: `q` (required), `mode` ("prefix", "substring" or "fuzzy",
+    default "substring"), `scope` ("all", "words" or "conjugations", default
+    "all"), and `limit`/`offset` for paging each scope's ranked results.
+    """
+    q = request.args.get("q", "").strip().lower()
+    mode = request.args.get("mode", "substring")
+    scope = request.args.get("scope", "all")
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": "mode must be one of: prefix, substring, fuzzy"}), 400
+    if scope not in SEARCH_SCOPES:
+        return jsonify({"error": "scope must be one of: all, words, conjugations"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), MAX_SEARCH_LIMIT)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    try:
+        user_id = session.get("user_id")
+        conn = get_db_connection()
+        cur = conn.cursor()
+        result = {"query": q, "mode": mode}
+        if scope in ("all", "words"):
+            rows = search_words(cur, user_id, q, mode, limit, offset)
+            result["words"] = search_page(rows, limit, offset)
+        if scope in ("all", "conjugations"):
+            rows = search_conjugations(cur, user_id, q, mode, limit, offset)
+            result["conjugations"] = search_page(rows, limit, offset)
         cur.close()
         conn.close()
         return jsonify(result), 200
+    except Exception as e:
+        logger.exception("Error in search")
+        return jsonify({"error": str(e)}), 500
+
+
+MAX_HISTORY_LIMIT = 200
+
+
+@api.route("/history", methods=["GET"])
+@query_budget(queries=1, rows=150)
+@login_required
+@admission_controlled("stats")
+def history():
+    """
+    The user's game runs, newest first, both games merged.
+
+    Query args: `game` ("vocabulary" or "conjugation", default both),
+    `game_type` (vocabulary runs only), `mode` (conjugation runs only),
+    `ungraded` ("true" or "false"), `time_limit` in seconds, `limit`
+    (default 50), and `cursor`, the `next_cursor` of the previous page.
+    """
+    games = list(RUN_SOURCES)
+    game = request.args.get("game")
+    if game is not None:
+        if game not in RUN_SOURCES:
+            return jsonify({"error": "game must be one of: vocabulary, conjugation"}), 400
+        games = [game]
+
+    filters = {}
+    for name, (filter_game, _) in HISTORY_FILTERS.items():
+        if request.args.get(name):
+            filters[name] = request.args[name]
+            games = [g for g in games if g == filter_game]
+    if not games:
+        return jsonify({"error": "game_type applies to vocabulary runs and mode to conjugation runs"}), 400
+    ungraded = request.args.get("ungraded")
+    if ungraded is not None:
+        if ungraded not in ("true", "false"):
+            return jsonify({"error": "ungraded must be true or false"}), 400
+        filters["ungraded"] = ungraded == "true"
+    try:
+        if request.args.get("time_limit"):
+            filters["time_limit"] = int(request.args["time_limit"])
+        limit = min(max(int(request.args.get("limit", 50)), 1), MAX_HISTORY_LIMIT)
+    except ValueError:
+        return jsonify({"error": "time_limit and limit must be integers"}), 400
+    try:
+        cursor = request.args.get("cursor")
+        cursor = decode_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        user_id = session.get("user_id")
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(*history_query(user_id, games, filters, cursor=cursor, limit=limit))
+        runs = cur.fetchall()
+        cur.close()
+        conn.close()
 
+        next_cursor = None
+        if len(runs) > limit:
+            runs = runs[:limit]
+            next_cursor = encode_history_cursor(runs[-1])
+        return jsonify({"runs": runs, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        logger.exception("Error in history")
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/export/<dataset>", methods=["GET"])
+@query_budget(queries=2)
+@login_required
+@admission_controlled("export")
+def export(dataset):
+    """
+    Stream the user's `vocabulary`, `conjugations` or game `history` as CSV
+    (default) or JSONL (`?format=jsonl`), straight from a server-side cursor.
+    """
+    fmt = request.args.get("format", "csv")
+    if dataset not in EXPORT_QUERIES:
+        return jsonify({"error": "dataset must be one of: vocabulary, conjugations, history"}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be one of: csv, jsonl"}), 400
+
+    user_id = session.get("user_id")
+    chunks = export_rows(user_id, dataset, fmt)
+    try:
+        next(chunks)  # runs the query, so failures still get a proper 500
     except Exception as e:
-        print("❌ Error in get_stats:", str(e))
+        logger.exception("Error in export")
         return jsonify({"error": str(e)}), 500
 
+    response = Response(chunks, mimetype=EXPORT_FORMATS[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename=leximax-{dataset}.{fmt}"
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,284 @@
+"""
+Async serving mode.
+
+    uvicorn asgi:app --workers 4
+
+Each uvicorn worker is a separate process, so per-user state (data
+versions, rate limits) defaults to a SQLite STATE_STORE shared through the
+temp directory, as under gunicorn; set STATE_STORE to override it.
+
+The game and stats endpoints are served by a Quart app on an asyncpg
+connection pool; /stats runs its independent sections (overview, growth,
+runs, best/worst) concurrently on separate pooled connections. Every other
+route, and all CORS preflights, pass through to the regular Flask app, so
+both modes share the session cookie and return identical JSON (the SQL and
+response shaping come from queries.py).
+"""
+import asyncio
+import os
+import tempfile
+from functools import wraps
+
+import asyncpg
+from asgiref.wsgi import WsgiToAsgi
+from dotenv import load_dotenv
+from quart import Quart, jsonify, request, session
+
+import db
+import prefetch
+from app import cors_origins, create_app
+from limits import admit, release
+from logs import logger
+from queries import (
+    conjugation_candidates_query, conjugation_filters, record_conjugation_game_query,
+    record_word_game_query, shape_stats, stats_queries, to_asyncpg,
+    update_conjugation_tracking_query, update_word_tracking_query, word_candidates_query,
+    word_filters,
+)
+from versions import get_data_version
+
+ASYNC_PATHS = {"/start_game", "/end_game", "/start_conjugation_game", "/end_conjugation_game", "/stats"}
+
+pool = None
+
+
+async def fetch(conn, sql, params=()):
+    return [dict(row) for row in await conn.fetch(*to_asyncpg(sql, params))]
+
+
+async def execute(conn, sql, params=()):
+    await conn.execute(*to_asyncpg(sql, params))
+
+
+_prefetch_tasks = set()
+
+
+def schedule_prefetch(user_id, kind, filters, query):
+    """Async counterpart of prefetch.schedule, run on the asyncpg pool."""
+    if not prefetch.prefetch_enabled():
+        return
+    version = get_data_version(user_id)
+
+    async def run():
+        try:
+            async with pool.acquire() as conn:
+                rows = await fetch(conn, *query)
+            prefetch.store(user_id, kind, filters, version, rows)
+        except Exception as e:
+            logger.warning("prefetch failed", extra={"kind": kind, "error": str(e)})
+
+    # Keep a reference so the task isn't garbage-collected mid-flight.
+    task = asyncio.get_running_loop().create_task(run())
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if "user_id" not in session:
+            return jsonify({"error": "Unauthorized, please log in."}), 401
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+def admission_controlled(endpoint_class):
+    """Async counterpart of limits.admission_controlled."""
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            # The state store is synchronous (SQLite); keep it off the event loop.
+            lease, retry_after = await asyncio.to_thread(admit, session.get("user_id"), endpoint_class)
+            if retry_after:
+                return (jsonify({"error": "Too many requests, please slow down."}), 429,
+                        {"Retry-After": str(retry_after)})
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                await asyncio.to_thread(release, lease)
+        return decorated_function
+    return decorator
+
+
+def create_async_app(flask_app):
+    qapp = Quart(__name__)
+    # Same secret and cookie settings, so Flask-issued sessions are accepted.
+    qapp.secret_key = flask_app.secret_key
+    for key in ("SESSION_COOKIE_NAME", "SESSION_COOKIE_DOMAIN", "SESSION_COOKIE_PATH",
+                "SESSION_COOKIE_SAMESITE", "SESSION_COOKIE_SECURE"):
+        if key in flask_app.config:
+            qapp.config[key] = flask_app.config[key]
+    origins = cors_origins()
+
+    @qapp.before_serving
+    async def open_pools():
+        global pool
+        pool = await asyncpg.create_pool(
+            dsn=os.environ["DATABASE_URL"],
+            ssl=os.environ.get("PGSSLMODE", "require"),
+            min_size=int(os.environ.get("ASYNC_DB_POOL_MIN", 2)),
+            max_size=int(os.environ.get("ASYNC_DB_POOL_MAX", 20)),
+        )
+        # The pass-through Flask routes use the regular psycopg2 pool.
+        await asyncio.get_running_loop().run_in_executor(None, db.init_pool)
+
+    @qapp.after_serving
+    async def close_pools():
+        await pool.close()
+        await asyncio.get_running_loop().run_in_executor(None, db.close_pool)
+
+    @qapp.after_request
+    async def add_cors_headers(response):
+        origin = request.headers.get("Origin")
+        if origin and ("*" in origins or origin in origins):
+            response.headers["Access-Control-Allow-Origin"] = origin
+            response.headers["Access-Control-Allow-Credentials"] = "true"
+            response.headers.add("Vary", "Origin")
+        return response
+
+    @qapp.route("/start_game", methods=["POST"])
+    @login_required
+    @admission_controlled("game")
+    async def start_game():
+        try:
+            user_id = session.get("user_id")
+            if not request.is_json:
+                return jsonify({"error": "Invalid JSON format"}), 400
+            data = await request.get_json()
+
+            filters = word_filters(data)
+            # Never block the event loop on a prefetch that is still running.
+            words = prefetch.take(user_id, "words", filters, wait=0)
+            if words is None:
+                async with pool.acquire() as conn:
+                    words = await fetch(conn, *word_candidates_query(user_id, **filters))
+            return jsonify({"words": words}), 200
+
+        except asyncpg.PostgresError as e:
+            logger.exception("PostgreSQL error in start_game", extra={"pgcode": e.sqlstate})
+            return jsonify({"error": f"PostgreSQL Error: {e}"}), 500
+        except Exception as e:
+            logger.exception("Error in start_game")
+            return jsonify({"error": str(e)}), 500
+
+    @qapp.route("/end_game", methods=["POST"])
+    @login_required
+    @admission_controlled("game")
+    async def end_game():
+        if not request.is_json:
+            return jsonify({"error": "Invalid JSON format"}), 400
+        user_id = session.get("user_id")
+        data = await request.get_json()
+        results = data.get("results")
+        if results is None or data.get("total_attempts") is None or data.get("score") is None:
+            return jsonify({"error": "Missing required data"}), 400
+
+        try:
+            async with pool.acquire() as conn, conn.transaction():
+                await execute(conn, *record_word_game_query(user_id, data))
+                if results:
+                    await execute(conn, *update_word_tracking_query(user_id, results))
+            if data.get("prefetch", True):
+                filters = word_filters(data)
+                schedule_prefetch(user_id, "words", filters, word_candidates_query(user_id, **filters))
+            return jsonify({"message": "Game ended successfully!"}), 200
+        except Exception as e:
+            logger.exception("Error in end_game")
+            return jsonify({"error": str(e)}), 500
+
+    @qapp.route("/start_conjugation_game", methods=["POST"])
+    @login_required
+    @admission_controlled("game")
+    async def start_conjugation_game():
+        try:
+            if not request.is_json:
+                return jsonify({"error": "Invalid JSON format"}), 400
+            data = await request.get_json()
+            user_id = session.get("user_id")
+
+            filters = conjugation_filters(data)
+            conjugations = prefetch.take(user_id, "conjugations", filters, wait=0)
+            if conjugations is None:
+                async with pool.acquire() as conn:
+                    conjugations = await fetch(conn, *conjugation_candidates_query(user_id, **filters))
+            return jsonify({"conjugations": conjugations}), 200
+
+        except Exception as e:
+            logger.exception("Error in start_conjugation_game")
+            return jsonify({"error": str(e)}), 500
+
+    @qapp.route("/end_conjugation_game", methods=["POST"])
+    @login_required
+    @admission_controlled("game")
+    async def end_conjugation_game():
+        if not request.is_json:
+            return jsonify({"error": "Invalid JSON format"}), 400
+        data = await request.get_json()
+        user_id = session.get("user_id")
+        results = data.get("results")
+        if results is None or data.get("total_attempts") is None or data.get("correct_answers") is None:
+            return jsonify({"error": "Missing required data"}), 400
+
+        try:
+            async with pool.acquire() as conn, conn.transaction():
+                await execute(conn, *record_conjugation_game_query(user_id, data))
+                if results:
+                    await execute(conn, *update_conjugation_tracking_query(user_id, results))
+            if data.get("prefetch", True):
+                filters = conjugation_filters(data)
+                schedule_prefetch(user_id, "conjugations", filters,
+                                  conjugation_candidates_query(user_id, **filters))
+            return jsonify({"message": "Conjugation game ended successfully!"}), 200
+        except Exception as e:
+            logger.exception("Error in end_conjugation_game")
+            return jsonify({"error": str(e)}), 500
+
+    @qapp.route("/stats", methods=["GET"])
+    @login_required
+    @admission_controlled("stats")
+    async def get_stats():
+        try:
+            queries = stats_queries(request.args.get("range", "all"), session.get("user_id"))
+
+            async def run_section(section):
+                async with pool.acquire() as conn:
+                    return {name: await fetch(conn, sql, params) for name, sql, params in section}
+
+            rows = {}
+            for section_rows in await asyncio.gather(*(run_section(s) for s in queries.values())):
+                rows.update(section_rows)
+            return jsonify(shape_stats(rows)), 200
+
+        except Exception as e:
+            logger.exception("Error in get_stats")
+            return jsonify({"error": str(e)}), 500
+
+    return qapp
+
+
+class Dispatcher:
+    """Route ASYNC_PATHS to the Quart app and everything else to Flask."""
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or (
+            scope["type"] == "http"
+            and scope["path"] in ASYNC_PATHS
+            and scope["method"] != "OPTIONS"
+        ):
+            await self.async_app(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+
+# Workers share per-user state; .env is read first so it can still choose the store.
+load_dotenv()
+os.environ.setdefault(
+    "STATE_STORE", "sqlite:///" + os.path.join(tempfile.gettempdir(), "leximax-state.db")
+)
+
+flask_app = create_app()
+app = Dispatcher(create_async_app(flask_app), flask_app)
@@ -0,0 +1,93 @@
+"""
+Microbenchmark: Flask's default JSON provider vs OrjsonProvider, plus the
+cost and payoff of compressing the result.
+
+    python bench/bench_json.py [--rows 500] [--repeat 200]
+
+Payloads mimic /get_words (vocabulary rows with datetimes) and the
+start-game routes (500 RealDictRows).
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from psycopg2.extras import RealDictRow  # noqa: E402
+
+from json_provider import OrjsonProvider, orjson  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_rows(n):
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(n):
+        row = RealDictRow()
+        row.update({
+            "id": i,
+            "word": f"mot{i}",
+            "translations": [f"word {i}", f"term {i}"],
+            "part_of_speech": "noun",
+            "article": "le",
+            "class": "lesson-3",
+            "user_id": 1,
+            "created_at": now - timedelta(minutes=i),
+        })
+        rows.append(row)
+    return rows
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if orjson is None:
+        raise SystemExit("orjson is not installed; nothing to compare.")
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast_http = OrjsonProvider(app)
+    fast_iso = OrjsonProvider(app)
+    fast_iso.datetime_format = "iso"
+    payload = {"words": make_rows(args.rows)}
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    with app.app_context():
+        baseline = best_of(lambda: default.response(payload), args.repeat)
+        print(f"  {'flask default':<22}{baseline * 1e3:8.3f} ms")
+        for label, provider in (("orjson (http dates)", fast_http), ("orjson (iso dates)", fast_iso)):
+            t = best_of(lambda: provider.response(payload), args.repeat)
+            print(f"  {label:<22}{t * 1e3:8.3f} ms   {baseline / t:5.1f}x faster")
+
+        body = fast_http.response(payload).get_data()
+    print(f"\nbody: {len(body)} bytes")
+    t = best_of(lambda: gzip.compress(body, compresslevel=5, mtime=0), args.repeat)
+    print(f"  gzip -5    {len(gzip.compress(body, 5, mtime=0)):8d} bytes  {t * 1e3:8.3f} ms")
+    if brotli is not None:
+        t = best_of(lambda: brotli.compress(body, quality=5), args.repeat)
+        print(f"  brotli q5  {len(brotli.compress(body, quality=5)):8d} bytes  {t * 1e3:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Login throughput, and what a login burst does to game traffic.
+
+Start the server, e.g. `gunicorn -c gunicorn.conf.py -w 2 -b :8000 wsgi:app`,
+then run
+
+    python bench/bench_login.py --user bench --password secret http://localhost:8000
+
+First /start_game is measured alone, then again while --logins client
+threads log in back to back. Compare runs with PASSWORD_HASH_WORKERS=0
+(hashing on the request threads) and the default pool, and with different
+PASSWORD_HASH_METHOD costs. 503s during the burst are logins shed by the
+bounded hashing queue; they are counted separately from errors.
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+
+from bench_serving import connect, login, run_load
+
+
+def login_burst(base_url, username, password, concurrency, stop):
+    """Log in back to back from `concurrency` threads until `stop` is set."""
+    body = json.dumps({"username": username, "password": password})
+    headers = {"Content-Type": "application/json"}
+    latencies, counts = [], {"shed": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def client():
+        conn = connect(base_url)
+        local, shed, failed = [], 0, 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                conn.request("POST", "/login", body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = connect(base_url)
+                continue
+            if response.status == 503:
+                shed += 1
+            elif response.status != 200:
+                failed += 1
+            else:
+                local.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            counts["shed"] += shed
+            counts["errors"] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    return threads, latencies, counts
+
+
+def summary(latencies):
+    p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else float("nan")
+    return p50, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=16, help="client threads logging in")
+    parser.add_argument("--games", type=int, default=8, help="client threads calling /start_game")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per phase")
+    args = parser.parse_args()
+
+    cookie = login(args.base_url, args.user, args.password)
+
+    print(f"{'phase':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'shed':>8}{'errors':>8}")
+    latencies, errors, elapsed = run_load(args.base_url, cookie, "start_game", args.games, args.duration)
+    p50, p95 = summary(latencies)
+    print(f"{'start_game alone':<28}{len(latencies) / elapsed:>10.1f}{p50:>10.1f}{p95:>10.1f}{'':>8}{errors:>8}")
+
+    stop = threading.Event()
+    started = time.monotonic()
+    threads, login_latencies, counts = login_burst(args.base_url, args.user, args.password, args.logins, stop)
+    latencies, errors, elapsed = run_load(args.base_url, cookie, "start_game", args.games, args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    burst_elapsed = time.monotonic() - started
+
+    p50, p95 = summary(latencies)
+    print(f"{'start_game during burst':<28}{len(latencies) / elapsed:>10.1f}{p50:>10.1f}{p95:>10.1f}{'':>8}{errors:>8}")
+    p50, p95 = summary(login_latencies)
+    print(f"{'login':<28}{len(login_latencies) / burst_elapsed:>10.1f}{p50:>10.1f}{p95:>10.1f}"
+          f"{counts['shed']:>8}{counts['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Throughput of the re-scoring engine's in-process phases: turning fetched
+rows into arrays, scoring them, and encoding them for COPY, against a plain
+per-row Python loop over the same rows.
+
+    python bench/bench_rescore.py [--rows 200000] [--mistakes 6] [--repeat 5]
+
+Rows have the shape rescore.py fetches (id, last_accessed epoch, mistake
+epochs). For end-to-end numbers against a real database, run
+`python rescore.py --dry-run`, which reports rows/s per phase.
+"""
+import argparse
+import io
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rescore import Chunk, copy_chunk, decayed_scores, standard_scores  # noqa: E402
+
+
+def make_rows(n, mean_mistakes):
+    now = time.time()
+    rows = []
+    for i in range(n):
+        last = None if i % 50 == 0 else now - random.uniform(0, 90 * 86400)
+        mistakes = [now - random.uniform(0, 365 * 86400)
+                    for _ in range(random.randint(0, 2 * mean_mistakes))]
+        rows.append((i + 1, last, mistakes))
+    return rows
+
+
+def per_row(rows, now, half_life_days=30):
+    """The same decayed formula, one row at a time."""
+    out = []
+    for row_id, last, mistakes in rows:
+        hours = (now - (946684800.0 if last is None else last)) / 3600
+        decayed = sum(math.pow(2, -((now - t) / 86400) / half_life_days) for t in mistakes)
+        out.append((row_id, max(1 + 2 * decayed + hours, 1)))
+    return out
+
+
+def per_row_copy_text(scored):
+    return "".join(f"{row_id}\t{score:.6f}\n" for row_id, score in scored)
+
+
+class CopySink:
+    """Stands in for a cursor: reads the COPY buffer without a database."""
+
+    def copy_expert(self, sql, buf):
+        buf.read()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--mistakes", type=int, default=6, help="mean mistakes per row")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.mistakes)
+    now = time.time()
+    chunk = Chunk(rows)
+    scores = decayed_scores(chunk, now)
+    scored = per_row(rows, now)
+    sink = CopySink()
+
+    results = [
+        ("rows -> arrays", best_of(lambda: Chunk(rows), args.repeat)),
+        ("standard (numpy)", best_of(lambda: standard_scores(chunk, now), args.repeat)),
+        ("decayed (numpy)", best_of(lambda: decayed_scores(chunk, now), args.repeat)),
+        ("decayed (per row)", best_of(lambda: per_row(rows, now), args.repeat)),
+        ("copy text (numpy)", best_of(lambda: copy_chunk(sink, chunk.ids, scores), args.repeat)),
+        ("copy text (per row)", best_of(lambda: io.StringIO(per_row_copy_text(scored)), args.repeat)),
+    ]
+    print(f"{args.rows} rows, ~{args.mistakes} mistakes each, best of {args.repeat}")
+    for label, seconds in results:
+        print(f"  {label:<22}{seconds * 1e3:9.1f} ms  {args.rows / seconds:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare requests/sec per core of the sync and async serving modes.
+
+Start both servers with the same number of worker processes, e.g.
+
+    gunicorn -c gunicorn.conf.py -w 2 -b :8000 wsgi:app
+    uvicorn asgi:app --workers 2 --port 8001
+
+then run
+
+    python bench/bench_serving.py --user bench --password secret \
+        --cores 2 sync=http://localhost:8000 async=http://localhost:8001
+
+Each target is hit with the same closed-loop load (N client threads with
+keep-alive connections) on /stats and /start_game. `--cores` is the number
+of CPU cores the server under test was allowed to use.
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+ENDPOINTS = {
+    "stats": ("GET", "/stats?range=all", None),
+    "start_game": ("POST", "/start_game", {"classes": [], "parts_of_speech": []}),
+    "start_conjugation_game": ("POST", "/start_conjugation_game", {"mode": "both"}),
+}
+
+
+def connect(base_url):
+    parts = urlsplit(base_url)
+    cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return cls(parts.netloc, timeout=30)
+
+
+def login(base_url, username, password):
+    conn = connect(base_url)
+    body = json.dumps({"username": username, "password": password})
+    conn.request("POST", "/login", body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise SystemExit(f"Login against {base_url} failed with HTTP {response.status}")
+    cookie = response.getheader("Set-Cookie").split(";", 1)[0]
+    conn.close()
+    return cookie
+
+
+def run_load(base_url, cookie, endpoint, concurrency, duration):
+    method, path, payload = ENDPOINTS[endpoint]
+    body = json.dumps(payload) if payload is not None else None
+    headers = {"Cookie": cookie, "Content-Type": "application/json"}
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        conn = connect(base_url)
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = connect(base_url)
+                continue
+            local.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return latencies, errors[0], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="+", help="label=base_url pairs")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--cores", type=int, required=True, help="CPU cores available to each server")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per endpoint")
+    parser.add_argument("--endpoints", default="stats,start_game", help="comma-separated: " + ",".join(ENDPOINTS))
+    args = parser.parse_args()
+
+    print(f"{'target':<10}{'endpoint':<24}{'req/s':>10}{'req/s/core':>12}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for target in args.targets:
+        label, base_url = target.split("=", 1)
+        cookie = login(base_url, args.user, args.password)
+        for endpoint in args.endpoints.split(","):
+            latencies, errors, elapsed = run_load(base_url, cookie, endpoint, args.concurrency, args.duration)
+            rps = len(latencies) / elapsed
+            p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+            p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else float("nan")
+            print(f"{label:<10}{endpoint:<24}{rps:>10.1f}{rps / args.cores:>12.1f}{p50:>10.1f}{p95:>10.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Per-route query budgets.
+
+Each route declares the most queries, and the most table rows read, that
+one request may cost, right under its @api.route:
+
+    @api.route('/get_words', methods=['GET'])
+    @query_budget(queries=1, rows=400)
+    @login_required
+    def get_words(): ...
+
+Declaring a budget costs nothing at runtime. check_budgets.py runs every
+route against a throwaway Postgres seeded with fixed data (see SEED there)
+and fails when a request goes over, so row budgets are relative to that
+data set: the test user owns a few hundred items, while other users own
+thousands, so a per-user query that starts scanning the whole table, or a
+loop issuing one query per item, blows its budget.
+
+Rows are counted from pg_stat_xact_user_tables (rows returned by
+sequential scans plus rows fetched through indexes) after every statement.
+Statements run through named (server-side) cursors are counted as queries
+only, since their rows are fetched after the view returns.
+"""
+import threading
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+_local = threading.local()
+
+ROWS_READ_SQL = """
+    SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0)
+    FROM pg_stat_xact_user_tables;
+"""
+
+
+class Budget:
+    def __init__(self, queries, rows=None):
+        self.queries = queries
+        self.rows = rows
+
+    def __repr__(self):
+        return f"Budget(queries={self.queries}, rows={self.rows})"
+
+
+def query_budget(queries, rows=None):
+    """Declare the budget of the route below; see check_budgets.py."""
+    def decorator(view):
+        view.query_budget = Budget(queries, rows)
+        return view
+    return decorator
+
+
+class RequestCost:
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.statements = []
+
+
+@contextmanager
+def measure():
+    """Count the queries and rows of everything run on this thread inside the block."""
+    cost = RequestCost()
+    _local.cost = cost
+    try:
+        yield cost
+    finally:
+        _local.cost = None
+
+
+_counting_classes = {}
+
+
+def _counting(factory):
+    cls = _counting_classes.get(factory)
+    if cls is None:
+        class CountingCursor(factory):
+            def execute(self, query, vars=None):
+                cost = getattr(_local, "cost", None)
+                if cost is None:
+                    return super().execute(query, vars)
+                conn = self.connection
+                if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    # This statement starts a new transaction. Since Postgres 15
+                    # the xact view also holds earlier transactions' stats until
+                    # they are flushed, so take a baseline rather than assume 0;
+                    # the reading opens the transaction the statement runs in.
+                    conn.rows_read = conn.read_rows_so_far()
+                result = super().execute(query, vars)
+                cost.queries += 1
+                cost.statements.append(" ".join(str(query).split())[:100])
+                if self.name is None:
+                    total = conn.read_rows_so_far()
+                    cost.rows += total - conn.rows_read
+                    conn.rows_read = total
+                return result
+
+        cls = _counting_classes[factory] = CountingCursor
+    return cls
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """Connection whose cursors report to the active `measure()` block."""
+
+    rows_read = 0
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=_counting(factory), **kwargs)
+
+    def read_rows_so_far(self):
+        """Rows read by the current transaction so far."""
+        cur = super().cursor(cursor_factory=psycopg2.extensions.cursor)
+        cur.execute(ROWS_READ_SQL)
+        total = cur.fetchone()[0]
+        cur.close()
+        return int(total)
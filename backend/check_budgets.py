@@ -0,0 +1,312 @@
+"""
+Check every route against its query budget (see budgets.py).
+
+    python check_budgets.py            # exits non-zero on any violation
+    python check_budgets.py --verbose  # also list each request's statements
+    python check_budgets.py --keep     # leave the database running afterwards
+
+Spins up a throwaway Postgres cluster (initdb + pg_ctl, listening on a unix
+socket in a temporary directory), applies migrations/, seeds SEED, then
+calls every route in app.py once through the Flask test client, logged in
+as the seeded test user. A route without a budget or without a request in
+cases() is a failure too, so new routes can't skip the check.
+
+Needs the Postgres server binaries (with contrib, for pg_trgm): on PATH,
+in PG_BIN, or wherever `pg_config --bindir` points.
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from werkzeug.security import generate_password_hash
+
+import budgets
+import db
+import migrate
+
+TEST_USER = ("budget-user", "budget-password")
+METRICS_TOKEN = "budget-check"
+
+# The test user's data is small; other users' is large, so scanning past
+# the test user's rows shows up in the row counts.
+SEED = {
+    "words": 300,
+    "conjugations": 300,
+    "games": 60,
+    "other_users": 4,
+    "other_words": 5000,
+    "other_conjugations": 5000,
+    "other_games": 1000,
+}
+
+SEED_SQL = """
+    INSERT INTO vocabulary (word, translations, part_of_speech, article, class, user_id, created_at)
+    SELECT 'mot' || g, ARRAY['word ' || g], (ARRAY['noun', 'verb', 'adjective'])[g %% 3 + 1],
+           'le', 'lesson-' || (g %% 5), %(user_id)s, NOW() - g * INTERVAL '1 hour'
+    FROM generate_series(1, %(words)s) g;
+
+    INSERT INTO conjugations (verb, person, tense, conjugation, irregular, pronominal, verb_group, user_id, created_at)
+    SELECT 'verbe' || (g / 6), (ARRAY['je', 'tu', 'il', 'nous', 'vous', 'ils'])[g %% 6 + 1],
+           (ARRAY['présent', 'imparfait', 'futur'])[g %% 3 + 1], 'forme' || g,
+           g %% 4 = 0, g %% 7 = 0, g %% 3 + 1, %(user_id)s, NOW() - g * INTERVAL '1 hour'
+    FROM generate_series(1, %(conjugations)s) g;
+
+    INSERT INTO game_runs (timestamp, time_limit, game_type, zen_mode, total_words_attempted,
+                           correct_words, ungraded, user_id, classes, parts_of_speech)
+    SELECT NOW() - g * INTERVAL '1 day', 1, 'translation', FALSE, 20, g %% 20, g %% 5 = 0,
+           %(user_id)s, ARRAY['all'], ARRAY['all']
+    FROM generate_series(1, %(games)s) g;
+
+    INSERT INTO conjugation_game_runs (end_time, time_limit, mode, zen_mode, ungraded, tenses,
+                                       groups, pronominal_mode, total_attempts, correct_answers, user_id)
+    SELECT NOW() - g * INTERVAL '1 day', 60, 'both', FALSE, g %% 5 = 0, ARRAY['présent'],
+           ARRAY[1], 'both', 20, g %% 20, %(user_id)s
+    FROM generate_series(1, %(games)s) g;
+"""
+
+SEED_TRACKING_SQL = """
+    INSERT INTO word_tracking (word_id, total_attempts, mistake_timestamps, last_accessed, score, user_id)
+    SELECT id, 3, ARRAY[NOW() - INTERVAL '2 days']::TIMESTAMPTZ[], NOW() - INTERVAL '1 day', 5, user_id
+    FROM vocabulary;
+
+    INSERT INTO conjugation_tracking (id, total_attempts, mistake_timestamps, last_accessed, score, user_id)
+    SELECT id, 3, ARRAY[NOW() - INTERVAL '2 days']::TIMESTAMPTZ[], NOW() - INTERVAL '1 day', 5, user_id
+    FROM conjugations;
+"""
+
+
+# Link the seeded rows to the shared lexicon, as migration 007 does for
+# existing data; every user's words and conjugations are the same entries.
+SEED_LEXICON_SQL = """
+    INSERT INTO lexicon_words (word, part_of_speech, article, translations)
+    SELECT DISTINCT word, part_of_speech, article, translations FROM vocabulary
+    ON CONFLICT DO NOTHING;
+
+    UPDATE vocabulary v
+    SET lexicon_id = l.id, word = NULL, part_of_speech = NULL, article = NULL, translations = NULL
+    FROM lexicon_words l
+    WHERE l.word = v.word AND l.part_of_speech = v.part_of_speech AND l.article = v.article;
+
+    INSERT INTO lexicon_conjugations (verb, person, tense, conjugation, irregular, pronominal, verb_group)
+    SELECT DISTINCT verb, person, tense, conjugation, irregular, pronominal, verb_group FROM conjugations
+    ON CONFLICT DO NOTHING;
+
+    UPDATE conjugations c
+    SET lexicon_id = l.id, verb = NULL, person = NULL, tense = NULL, conjugation = NULL,
+        irregular = NULL, pronominal = NULL, verb_group = NULL
+    FROM lexicon_conjugations l
+    WHERE (l.verb, l.person, l.tense, l.conjugation, l.irregular, l.pronominal, l.verb_group)
+        = (c.verb, c.person, c.tense, c.conjugation, c.irregular, c.pronominal, c.verb_group);
+"""
+
+
+def pg_bin(name):
+    bindir = os.environ.get("PG_BIN")
+    if not bindir and shutil.which(name) is None and shutil.which("pg_config"):
+        bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True).stdout.strip()
+    path = os.path.join(bindir, name) if bindir else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise SystemExit(f"{name} not found; install the Postgres server or set PG_BIN.")
+    return path
+
+
+class EphemeralPostgres:
+    """A Postgres cluster in a temporary directory, reachable only over a unix socket."""
+
+    def __init__(self, keep=False):
+        self.keep = keep
+        self.dir = tempfile.mkdtemp(prefix="leximax-budgets-")
+        self.data = os.path.join(self.dir, "data")
+        self.port = random.randint(20000, 60000)
+
+    @property
+    def url(self):
+        return f"postgresql://postgres@/postgres?host={self.dir}&port={self.port}"
+
+    def __enter__(self):
+        subprocess.run([pg_bin("initdb"), "-D", self.data, "-U", "postgres", "-A", "trust",
+                        "-E", "UTF8", "--no-sync"], check=True, capture_output=True)
+        options = f"-F -p {self.port} -k {self.dir} -c listen_addresses=''"
+        subprocess.run([pg_bin("pg_ctl"), "-D", self.data, "-l", os.path.join(self.dir, "server.log"),
+                        "-o", options, "-w", "start"], check=True, capture_output=True)
+        return self
+
+    def __exit__(self, *exc):
+        if self.keep:
+            print(f"Database left running: {self.url}")
+            return
+        subprocess.run([pg_bin("pg_ctl"), "-D", self.data, "-m", "immediate", "stop"], capture_output=True)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def seed():
+    conn = db.get_db_connection(scoped=False)
+    cur = conn.cursor()
+    user_ids = []
+    for n in range(SEED["other_users"] + 1):
+        username, password = TEST_USER if n == 0 else (f"other-{n}", "password")
+        cur.execute("INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id;",
+                    (username, generate_password_hash(password)))
+        user_ids.append(cur.fetchone()["id"])
+    # The test user's rows go in first, so they are contiguous on disk.
+    for n, user_id in enumerate(user_ids):
+        prefix = "" if n == 0 else "other_"
+        cur.execute(SEED_SQL, {
+            "user_id": user_id,
+            "words": SEED[prefix + "words"],
+            "conjugations": SEED[prefix + "conjugations"],
+            "games": SEED[prefix + "games"],
+        })
+    cur.execute(SEED_TRACKING_SQL)
+    cur.execute(SEED_LEXICON_SQL)
+    conn.commit()
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE;")
+
+    cur.execute("SELECT id FROM vocabulary WHERE user_id = %s ORDER BY id;", (user_ids[0],))
+    word_ids = [row["id"] for row in cur.fetchall()]
+    cur.execute("SELECT id FROM conjugations WHERE user_id = %s ORDER BY id;", (user_ids[0],))
+    conjugation_ids = [row["id"] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return word_ids, conjugation_ids
+
+
+def cases(word_ids, conjugation_ids):
+    """(endpoint, method, url, json body) for one request to every route, in order."""
+    words, conjugations = word_ids[:20], conjugation_ids[:20]
+    return [
+        ("api.health_check", "GET", "/", None),
+        ("api.metrics", "GET", "/metrics", None),
+        ("api.current_user", "GET", "/current_user", None),
+        ("api.get_settings", "GET", "/settings", None),
+        ("api.update_settings", "PUT", "/settings", {"theme": "dark"}),
+        ("api.add_word", "POST", "/add_word",
+         {"word": "nouveau", "translation": "new", "part_of_speech": "adjective"}),
+        ("api.get_words", "GET", "/get_words", None),
+        ("api.update_word", "PUT", f"/update_word/{word_ids[-1]}",
+         {"word": "changé", "translation": ["changed"], "part_of_speech": "verb"}),
+        ("api.batch_update_words", "POST", "/batch_update_words",
+         {"ids": word_ids[20:40], "set": {"word_class": "lesson-9"}}),
+        ("api.start_game", "POST", "/start_game", {"classes": [], "parts_of_speech": []}),
+        ("api.end_game", "POST", "/end_game", {
+            "time_limit": 60, "game_type": "translation", "zen_mode": False, "ungraded": False,
+            "total_attempts": len(words), "score": len(words) // 2,
+            "results": [{"word_id": i, "correct": n % 2 == 0} for n, i in enumerate(words)],
+        }),
+        ("api.add_conjugation", "POST", "/add_conjugation",
+         {"verb": "budgéter", "person": "je", "tense": "présent", "conjugation": "budgète"}),
+        ("api.get_conjugations", "GET", "/get_conjugations", None),
+        ("api.update_conjugation", "PUT", f"/update_conjugation/{conjugation_ids[-1]}",
+         {"verb": "verbe0", "person": "tu", "tense": "futur", "conjugation": "changeras"}),
+        ("api.batch_update_conjugations", "POST", "/batch_update_conjugations",
+         {"ids": conjugation_ids[20:40], "set": {"irregular": True}}),
+        ("api.start_conjugation_game", "POST", "/start_conjugation_game", {"mode": "both"}),
+        ("api.end_conjugation_game", "POST", "/end_conjugation_game", {
+            "time_limit": 60, "mode": "both", "zen_mode": False, "ungraded": False,
+            "tenses": ["présent"], "groups": [1], "pronominal_mode": "both",
+            "total_attempts": len(conjugations), "correct_answers": len(conjugations) // 2,
+            "results": [{"id": i, "correct": n % 2 == 0} for n, i in enumerate(conjugations)],
+        }),
+        ("api.get_stats", "GET", "/stats?range=all", None),
+        ("api.get_growth", "GET", "/stats/growth?granularity=week", None),
+        ("api.get_breakdown", "GET", "/stats/breakdown", None),
+        ("api.search", "GET", "/search?q=mot1&mode=substring", None),
+        ("api.history", "GET", "/history?limit=50", None),
+        ("api.export", "GET", "/export/vocabulary?format=csv", None),
+        ("api.delete_word", "DELETE", f"/delete_word/{word_ids[-2]}", None),
+        ("api.batch_delete_words", "POST", "/batch_delete_words", {"ids": word_ids[40:50]}),
+        ("api.delete_conjugation", "DELETE", f"/delete_conjugation/{conjugation_ids[-2]}", None),
+        ("api.batch_delete_conjugations", "POST", "/batch_delete_conjugations",
+         {"ids": conjugation_ids[40:50]}),
+        ("api.register", "POST", "/register", {"username": "budget-new", "password": "secret"}),
+        ("api.logout", "POST", "/logout", None),
+        ("api.login", "POST", "/login", {"username": TEST_USER[0], "password": TEST_USER[1]}),
+    ]
+
+
+def check(app, word_ids, conjugation_ids, verbose=False):
+    failures = []
+    for rule in app.url_map.iter_rules():
+        view = app.view_functions[rule.endpoint]
+        if rule.endpoint.startswith("api.") and getattr(view, "query_budget", None) is None:
+            failures.append(f"{rule.rule}: no @query_budget declared")
+    requested = {(endpoint, method) for endpoint, method, _, _ in cases(word_ids, conjugation_ids)}
+    for rule in app.url_map.iter_rules():
+        for method in rule.methods - {"HEAD", "OPTIONS"}:
+            if rule.endpoint.startswith("api.") and (rule.endpoint, method) not in requested:
+                failures.append(f"{method} {rule.rule}: no request in cases()")
+
+    client = app.test_client()
+    login = client.post("/login", json={"username": TEST_USER[0], "password": TEST_USER[1]})
+    if login.status_code != 200:
+        raise SystemExit(f"Could not log in as the test user: {login.get_json()}")
+
+    print(f"{'route':<46}{'queries':>12}{'rows':>16}")
+    for endpoint, method, url, body in cases(word_ids, conjugation_ids):
+        budget = app.view_functions[endpoint].query_budget
+        with budgets.measure() as cost:
+            response = client.open(url, method=method, json=body,
+                                   headers={"Authorization": f"Bearer {METRICS_TOKEN}"})
+            response.get_data()  # drain streamed responses inside the measurement
+        label = f"{method} {url.split('?')[0]}"
+        rows_budget = "-" if budget.rows is None else budget.rows
+        print(f"{label:<46}{cost.queries:>6} / {budget.queries:<4}{cost.rows:>8} / {rows_budget:<6}")
+        if verbose:
+            for statement in cost.statements:
+                print(f"    {statement}")
+        if response.status_code >= 400:
+            failures.append(f"{label}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+        if cost.queries > budget.queries:
+            failures.append(f"{label}: {cost.queries} queries, budget {budget.queries}")
+        if budget.rows is not None and cost.rows > budget.rows:
+            failures.append(f"{label}: {cost.rows} rows read, budget {budget.rows}")
+    return failures
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check routes against their query budgets")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="leave the database running")
+    args = parser.parse_args(argv)
+
+    with EphemeralPostgres(keep=args.keep) as pg:
+        os.environ.update({
+            "DATABASE_URL": pg.url,
+            "PGSSLMODE": "disable",
+            "SECRET_KEY": "budget-check",
+            "STATE_STORE": "memory",
+            "RATE_LIMITS_ENABLED": "0",
+            "METRICS_TOKEN": METRICS_TOKEN,
+            # Measure start routes without a prefetched result to fall back
+            # on, and with the item index cold (built on the first call).
+            "PREFETCH_ENABLED": "0",
+            "ITEM_INDEX_ENABLED": "1",
+            "LOG_LEVEL": "WARNING",
+        })
+        migrate.main([])
+        word_ids, conjugation_ids = seed()
+
+        from app import create_app
+        db.CONNECTION_FACTORY = budgets.CountingConnection
+        db.init_pool(1, 2)
+        try:
+            failures = check(create_app(), word_ids, conjugation_ids, verbose=args.verbose)
+        finally:
+            db.close_pool()
+
+    if failures:
+        print(f"\n{len(failures)} budget failure(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nAll routes within budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""
+Response compression.
+
+JSON and text responses above COMPRESS_MIN_SIZE bytes are compressed with
+brotli (when the `brotli` package is installed and the client accepts it)
+or gzip. Streaming responses are left alone. Strong ETags get an encoding
+suffix, so each representation keeps a distinct validator.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=min(level, 9), mtime=0)
+
+
+def init_compression(app, min_size=1024, level=5):
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        if response.content_length is not None and response.content_length < min_size:
+            return response
+        encoding = _choose_encoding()
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(_compress(data, encoding, level))
+        response.headers["Content-Encoding"] = encoding
+
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{encoding}")
+        return response
+
+    return compress_response
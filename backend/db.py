@@ -1,12 +1,169 @@
+import os
+import threading
+import time
+
 import psycopg2
+from flask import g, has_request_context
 from psycopg2.extras import RealDictCursor
-import os
-from dotenv import load_dotenv
-load_dotenv()  # This loads the variables from .env
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+# Queries run once per pooled connection at startup so the first real
+# requests don't pay for backend catalog/relcache loading on the hot tables.
+WARMUP_QUERIES = [
+    "SELECT 1;",
+    "SELECT id, settings FROM users WHERE FALSE;",
+    "SELECT * FROM vocabulary_entries v JOIN word_tracking wt ON wt.word_id = v.id WHERE FALSE;",
+    "SELECT * FROM conjugation_entries c JOIN conjugation_tracking ct ON ct.id = c.id WHERE FALSE;",
+    "SELECT * FROM game_runs WHERE FALSE;",
+    "SELECT * FROM conjugation_game_runs WHERE FALSE;",
+]
 
-def get_db_connection():
-    return psycopg2.connect(
+# Swapped for an instrumented connection class by check_budgets.py.
+CONNECTION_FACTORY = None
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _connect_kwargs():
+    return dict(
         dsn=os.environ["DATABASE_URL"],
         sslmode=os.environ.get("PGSSLMODE", "require"),
-        cursor_factory=RealDictCursor
+        cursor_factory=RealDictCursor,
+        connection_factory=CONNECTION_FACTORY,
     )
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free slot instead of raising."""
+
+    def __init__(self, minconn, maxconn, timeout=None, **kwargs):
+        super().__init__(minconn, maxconn, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError("connection pool exhausted")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._slots.release()
+
+
+class PooledConnection:
+    """
+    Wraps a pooled psycopg2 connection so existing `conn.close()` calls hand
+    it back to the pool (rolled back if a transaction was left open).
+    """
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "released", False)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def close(self):
+        if self.released:
+            return
+        object.__setattr__(self, "released", True)
+        conn = self._conn
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                if conn.autocommit:
+                    conn.autocommit = False
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        try:
+            self._pool.putconn(conn, close=broken)
+        except PoolError:
+            # The pool was closed while this connection was checked out.
+            conn.close()
+
+
+def init_pool(minconn=None, maxconn=None):
+    """
+    Create this process's connection pool. Call it after forking (e.g. from
+    a gunicorn post_fork hook): connections must never be shared between
+    processes.
+    """
+    global _pool, _pool_pid
+    minconn = int(minconn if minconn is not None else os.environ.get("DB_POOL_MIN", 1))
+    maxconn = int(maxconn if maxconn is not None else os.environ.get("DB_POOL_MAX", 10))
+    timeout = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+        # A pool inherited through fork belongs to the parent; dropping it
+        # without closing leaves the parent's sockets alone.
+        _pool = BlockingConnectionPool(minconn, maxconn, timeout=timeout, **_connect_kwargs())
+        _pool_pid = os.getpid()
+        return _pool
+
+
+def warm_pool():
+    """Check out `pool.minconn` connections, run WARMUP_QUERIES on each, return them."""
+    pool = init_pool()
+    conns = [pool.getconn() for _ in range(pool.minconn)]
+    try:
+        for conn in conns:
+            cur = conn.cursor()
+            for query in WARMUP_QUERIES:
+                cur.execute(query)
+            cur.close()
+            conn.rollback()
+    finally:
+        for conn in conns:
+            pool.putconn(conn)
+    return len(conns)
+
+
+def close_pool(timeout=10.0):
+    """Wait up to `timeout` seconds for checked-out connections, then close all."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        pool, _pool = _pool, None
+        owned = _pool_pid == os.getpid()
+        _pool_pid = None
+    if pool is None or not owned:
+        return
+    deadline = time.monotonic() + timeout
+    while pool._used and time.monotonic() < deadline:
+        time.sleep(0.05)
+    pool.closeall()
+
+
+def get_db_connection(scoped=True):
+    """
+    Return a connection. With a pool initialised for this process the
+    connection comes from the pool; otherwise a new one is opened.
+
+    Scoped connections opened during a request are also released when the
+    request ends, in case the view returned early without closing them.
+    Pass `scoped=False` for connections that outlive the request (streaming).
+    """
+    if _pool is None or _pool_pid != os.getpid():
+        return psycopg2.connect(**_connect_kwargs())
+    conn = PooledConnection(_pool, _pool.getconn())
+    if scoped and has_request_context():
+        g.setdefault("db_connections", []).append(conn)
+    return conn
+
+
+def release_request_connections(exc=None):
+    """Teardown hook: return any connection a view forgot to close."""
+    for conn in g.pop("db_connections", []):
+        conn.close()
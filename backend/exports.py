@@ -0,0 +1,117 @@
+"""
+Streaming CSV / JSONL exports.
+
+Rows are read through a named (server-side) cursor in batches of
+EXPORT_BATCH_SIZE and encoded batch by batch, so memory use does not depend
+on how much data the account holds.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from psycopg2.extras import RealDictCursor
+
+from db import get_db_connection
+from queries import RUN_SOURCES
+
+EXPORT_BATCH_SIZE = 2000
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+EXPORT_QUERIES = {
+    "vocabulary": """
+        SELECT v.id, v.word, v.translations, v.part_of_speech, v.article, v.class,
+               v.created_at, wt.total_attempts,
+               COALESCE(array_length(wt.mistake_timestamps, 1), 0) AS mistakes,
+               wt.last_accessed, wt.score
+        FROM vocabulary_entries v
+        LEFT JOIN word_tracking wt ON wt.word_id = v.id AND wt.user_id = v.user_id
+        WHERE v.user_id = %(user_id)s
+        ORDER BY v.id
+    """,
+    "conjugations": """
+        SELECT c.id, c.verb, c.person, c.tense, c.conjugation, c.irregular,
+               c.pronominal, c.verb_group, c.created_at, ct.total_attempts,
+               COALESCE(array_length(ct.mistake_timestamps, 1), 0) AS mistakes,
+               ct.last_accessed, ct.score
+        FROM conjugation_entries c
+        LEFT JOIN conjugation_tracking ct ON ct.id = c.id AND ct.user_id = c.user_id
+        WHERE c.user_id = %(user_id)s
+        ORDER BY c.id
+    """,
+    # The columns /history returns (queries.RUN_SOURCES), from the hot and
+    # archive table of each game; runs past the retention window live in the
+    # archives (see maintenance.py's archive_runs), and detached partitions
+    # are not exported.
+    "history": "\n        UNION ALL".join(
+        f"""
+        SELECT {src["history"]}
+        FROM {table}
+        WHERE user_id = %(user_id)s"""
+        for src in RUN_SOURCES.values()
+        for table in (src["table"], src["archive"])
+    ) + """
+        ORDER BY played_at, game, id
+    """,
+}
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _csv_value(value):
+    value = _plain(value)
+    if isinstance(value, list):
+        return json.dumps([_plain(v) for v in value], ensure_ascii=False)
+    return "" if value is None else value
+
+
+def encode_csv(rows, columns=None):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if columns:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row.values()])
+    return buf.getvalue()
+
+
+def encode_jsonl(rows, columns=None):
+    return "".join(json.dumps(row, default=_plain, ensure_ascii=False) + "\n" for row in rows)
+
+
+def export_rows(user_id, dataset, fmt):
+    """
+    Yield the encoded export in chunks. The connection stays open (inside a
+    single read-only transaction) until the generator is exhausted or closed.
+    The first chunk is always empty, so callers can surface query errors
+    before any response headers go out.
+    """
+    encode = encode_csv if fmt == "csv" else encode_jsonl
+    conn = get_db_connection(scoped=False)
+    try:
+        conn.cursor().execute("SET TRANSACTION READ ONLY;")
+        cur = conn.cursor(name=f"export_{dataset}", cursor_factory=RealDictCursor)
+        cur.itersize = EXPORT_BATCH_SIZE
+        cur.execute(EXPORT_QUERIES[dataset], {"user_id": user_id})
+        yield ""
+        first = True
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if first and fmt == "csv":
+                # Named cursors only know their columns after the first fetch.
+                yield encode_csv([], columns=[col.name for col in cur.description])
+            if not rows:
+                break
+            yield encode(rows)
+            first = False
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
@@ -0,0 +1,58 @@
+"""
+Gunicorn settings for production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment (or .env). The app is
+preloaded in the master; each worker builds its own connection pool after
+forking, warms it, and drains it on graceful shutdown.
+"""
+import multiprocessing
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True") == "True"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 0))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+
+# One pooled connection per worker thread, so requests never queue for one.
+os.environ.setdefault("DB_POOL_MAX", str(threads))
+os.environ.setdefault("DB_POOL_MIN", str(min(threads, 2)))
+
+# Per-user state (data versions, ...) must be shared between workers.
+if workers > 1:
+    os.environ.setdefault(
+        "STATE_STORE", "sqlite:///" + os.path.join(tempfile.gettempdir(), "leximax-state.db")
+    )
+
+
+def post_fork(server, worker):
+    import db
+
+    try:
+        db.init_pool()
+        warmed = db.warm_pool()
+        server.log.info("Worker %s: warmed %d pooled connection(s)", worker.pid, warmed)
+    except Exception as e:
+        # This worker then falls back to opening a connection per request.
+        server.log.warning("Worker %s: connection pool unavailable: %s", worker.pid, e)
+
+
+def worker_exit(server, worker):
+    import db
+    import passwords
+
+    passwords.shutdown()
+    db.close_pool(timeout=float(os.environ.get("DB_POOL_DRAIN_TIMEOUT", 5)))
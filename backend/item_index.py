@@ -0,0 +1,219 @@
+"""
+In-process, array-backed index of a user's items for the start-game routes.
+
+Start-game filters (class, part of speech, tense, verb group, irregular,
+pronominal) all come from small enumerations, so instead of sending every
+start call to Postgres, an index per active user and kind holds the item
+ids, scores and mistake counts as NumPy arrays, plus one packed bitmap per
+filter value. A filter is a few bitwise ORs and ANDs; candidates are then
+drawn exactly like the SQL does (random key times score, top 500), and only
+the picked rows are read, by primary key.
+
+Indexes are tagged with the user's data version (see versions.py): every
+CRUD route bumps it, so the next lookup in any worker drops the stale index
+and rebuilds it. End-game routes update the played items' mistake counts
+and scores in place (`record_results`), using the formula the tracking
+UPDATE applies; games ended on other workers are picked up when the index
+expires (ITEM_INDEX_TTL). Indexes live per process in an LRU bounded by
+ITEM_INDEX_MEMORY_BYTES, and their memory is reported in /metrics.
+
+Environment: ITEM_INDEX_ENABLED (default 0), ITEM_INDEX_MEMORY_BYTES
+(default 64 MiB), ITEM_INDEX_TTL seconds (default 300).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from db import get_db_connection
+from queries import ITEM_INDEX_QUERIES, ITEMS_BY_ID_QUERIES, SCORE_BASE, SCORE_PER_MISTAKE
+from versions import get_data_version
+
+CANDIDATE_LIMIT = 500
+
+# Filterable columns per kind, as selected by ITEM_INDEX_QUERIES.
+DIMENSIONS = {
+    "words": ("class", "part_of_speech"),
+    "conjugations": ("irregular", "tense", "verb_group", "pronominal"),
+}
+
+# Rough per-bitmap bookkeeping (dict slot, array header, value) for the
+# memory budget.
+_BITMAP_OVERHEAD = 200
+
+
+def index_enabled():
+    return os.environ.get("ITEM_INDEX_ENABLED", "0").lower() not in ("0", "false", "no")
+
+
+def _conditions(kind, filters):
+    """The start-game filters as (dimension, accepted values) pairs, ANDed."""
+    if kind == "words":
+        conditions = [("class", filters.get("classes")), ("part_of_speech", filters.get("parts_of_speech"))]
+    else:
+        mode, pronominal_mode = filters.get("mode"), filters.get("pronominal_mode")
+        conditions = [
+            ("irregular", [mode == "irregular"] if mode in ("regular", "irregular") else None),
+            ("tense", filters.get("tenses")),
+            ("verb_group", filters.get("groups")),
+            ("pronominal", [pronominal_mode == "only"] if pronominal_mode in ("only", "exclude") else None),
+        ]
+    return [(dimension, values) for dimension, values in conditions if values]
+
+
+class ItemIndex:
+    """One user's items of one kind: ids (sorted), scores, mistakes, bitmaps."""
+
+    def __init__(self, kind, rows):
+        n = len(rows)
+        self.size = n
+        self.ids = np.fromiter((r["id"] for r in rows), dtype=np.int32, count=n)
+        self.scores = np.fromiter(
+            (1.0 if r["score"] is None else r["score"] for r in rows), dtype=np.float64, count=n
+        )
+        self.mistakes = np.fromiter((r["mistakes"] for r in rows), dtype=np.int32, count=n)
+        self.bitmaps = {}
+        for dimension in DIMENSIONS[kind]:
+            positions = {}
+            for i, row in enumerate(rows):
+                if row[dimension] is not None:
+                    positions.setdefault(row[dimension], []).append(i)
+            bitmaps = self.bitmaps[dimension] = {}
+            for value, where in positions.items():
+                mask = np.zeros(n, dtype=bool)
+                mask[where] = True
+                bitmaps[value] = np.packbits(mask)
+        self.nbytes = (self.ids.nbytes + self.scores.nbytes + self.mistakes.nbytes
+                       + sum(b.nbytes + _BITMAP_OVERHEAD for d in self.bitmaps.values() for b in d.values()))
+
+    def matching(self, conditions):
+        """Boolean mask of the items matching every (dimension, values) condition."""
+        bits = np.packbits(np.ones(self.size, dtype=bool))
+        for dimension, values in conditions:
+            any_of = np.zeros_like(bits)
+            for value in values:
+                bitmap = self.bitmaps[dimension].get(value)
+                if bitmap is not None:
+                    any_of |= bitmap
+            bits &= any_of
+        return np.unpackbits(bits, count=self.size).view(bool)
+
+    def candidates(self, conditions, limit=CANDIDATE_LIMIT):
+        """Ids of up to `limit` matching items, as ORDER BY RANDOM() * score DESC picks them."""
+        positions = np.flatnonzero(self.matching(conditions))
+        keys = np.random.default_rng().random(len(positions)) * self.scores[positions]
+        if len(positions) > limit:
+            top = np.argpartition(-keys, limit - 1)[:limit]
+            positions, keys = positions[top], keys[top]
+        return self.ids[positions[np.argsort(-keys)]].tolist()
+
+    def record_results(self, ids, mistakes):
+        """Apply one game's attempts, as the end-game tracking UPDATE does."""
+        ids = np.asarray(ids, dtype=np.int32)
+        positions = np.searchsorted(self.ids, ids).clip(max=max(self.size - 1, 0))
+        known = (self.ids[positions] == ids) if self.size else np.zeros(len(ids), dtype=bool)
+        np.add.at(self.mistakes, positions[known], np.asarray(mistakes, dtype=np.int32)[known])
+        played = positions[known]
+        self.scores[played] = np.maximum(SCORE_BASE + self.mistakes[played] * SCORE_PER_MISTAKE, SCORE_BASE)
+
+
+class IndexCache:
+    """LRU of (data_version, expires_at, ItemIndex) entries under a byte budget."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2].nbytes
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def peek(self, key):
+        """The cached index whatever its version, without touching LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[2] if entry is not None else None
+
+    def put(self, key, version, index):
+        with self._lock:
+            self._drop(key)
+            if index.nbytes > self.max_bytes:
+                return  # used for this call only
+            self._entries[key] = (version, time.monotonic() + self.ttl, index)
+            self.bytes += index.nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {"indexes": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+cache = IndexCache(
+    max_bytes=int(os.environ.get("ITEM_INDEX_MEMORY_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.environ.get("ITEM_INDEX_TTL", 300)),
+)
+
+
+def candidates(user_id, kind, filters):
+    """
+    Candidate rows for a start call of `kind` ("words" or "conjugations")
+    with `filters`, in the same shape and order as the candidate queries
+    return them; None when the index is disabled.
+    """
+    if not index_enabled():
+        return None
+    key = (user_id, kind)
+    # Read the version before building, so a write landing meanwhile makes
+    # the next lookup rebuild rather than trust this index.
+    version = get_data_version(user_id)
+    index = cache.get(key, version)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    if index is None:
+        cur.execute(ITEM_INDEX_QUERIES[kind], {"user_id": user_id})
+        index = ItemIndex(kind, cur.fetchall())
+        cache.put(key, version, index)
+
+    rows = []
+    ids = index.candidates(_conditions(kind, filters))
+    if ids:
+        cur.execute(ITEMS_BY_ID_QUERIES[kind], {"user_id": user_id, "ids": ids})
+        by_id = {row["id"]: row for row in cur.fetchall()}
+        rows = [by_id[i] for i in ids if i in by_id]
+    cur.close()
+    conn.close()
+    return rows
+
+
+def record_results(user_id, kind, ids, mistakes):
+    """Keep a cached index's scores current after an end-game commit."""
+    if not index_enabled() or not ids:
+        return
+    index = cache.peek((user_id, kind))
+    if index is not None:
+        index.record_results(ids, mistakes)
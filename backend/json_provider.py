@@ -0,0 +1,78 @@
+"""
+Fast JSON serialization for API responses.
+
+`OrjsonProvider` is a drop-in replacement for Flask's default JSON provider.
+orjson encodes dicts, lists and datetimes in C and serializes dict
+subclasses such as psycopg2's RealDictRow directly, so large result sets
+are no longer walked in Python. Without orjson installed it falls back to
+Flask's behaviour.
+
+Datetimes are written as HTTP dates by default, exactly like Flask's
+provider; set JSON_DATETIME_FORMAT=iso to emit orjson's native ISO 8601
+strings instead (the fastest option). Decimals are written as strings, as
+Flask does.
+"""
+from datetime import date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Key order carries no meaning in our payloads; skip the sort.
+    sort_keys = False
+    datetime_format = "http"
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.datetime_format == "http":
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            kwargs.setdefault("sort_keys", self.sort_keys)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is None and self._app.debug or self.compact is False
+        body = orjson.dumps(obj, default=_default, option=self._options(indent))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app, provider=None, datetime_format=None):
+    """Install the JSON provider named by `provider` ("orjson" or "default")."""
+    if provider == "default":
+        return
+    app.json = OrjsonProvider(app)
+    if datetime_format:
+        app.json.datetime_format = datetime_format
@@ -0,0 +1,110 @@
+"""
+The shared lexicon (migration 007).
+
+Words and conjugations are stored once in lexicon_words /
+lexicon_conjugations; a user's vocabulary and conjugations rows reference an
+entry and store only overrides. Reads use the vocabulary_entries and
+conjugation_entries views, which resolve the overrides.
+
+`resolve_words` / `resolve_conjugations` find or create the entries for any
+number of items in one statement, so callers resolve everything a request
+adds in a single round trip.
+"""
+
+RESOLVE_WORDS_SQL = """
+    WITH input AS (
+        SELECT *
+        FROM unnest(%(words)s::text[], %(parts_of_speech)s::text[], %(articles)s::text[],
+                    %(translations)s::text[]) WITH ORDINALITY
+             AS i(word, part_of_speech, article, translation, ord)
+    ),
+    inserted AS (
+        INSERT INTO lexicon_words (word, part_of_speech, article, translations)
+        SELECT word, part_of_speech, article, ARRAY[translation]
+        FROM input
+        ORDER BY ord
+        ON CONFLICT (word, COALESCE(part_of_speech, ''), COALESCE(article, '')) DO NOTHING
+        RETURNING id, word, part_of_speech, article, translations
+    )
+    SELECT i.ord, COALESCE(n.id, l.id) AS id, COALESCE(n.translations, l.translations) AS translations
+    FROM input i
+    LEFT JOIN inserted n
+      ON n.word = i.word
+     AND COALESCE(n.part_of_speech, '') = COALESCE(i.part_of_speech, '')
+     AND COALESCE(n.article, '') = COALESCE(i.article, '')
+    LEFT JOIN lexicon_words l
+      ON l.word = i.word
+     AND COALESCE(l.part_of_speech, '') = COALESCE(i.part_of_speech, '')
+     AND COALESCE(l.article, '') = COALESCE(i.article, '')
+    ORDER BY i.ord;
+"""
+
+RESOLVE_CONJUGATIONS_SQL = """
+    WITH input AS (
+        SELECT *
+        FROM unnest(%(verbs)s::text[], %(persons)s::text[], %(tenses)s::text[],
+                    %(conjugations)s::text[], %(irregular)s::bool[], %(pronominal)s::bool[],
+                    %(verb_groups)s::int[]) WITH ORDINALITY
+             AS i(verb, person, tense, conjugation, irregular, pronominal, verb_group, ord)
+    ),
+    inserted AS (
+        INSERT INTO lexicon_conjugations (verb, person, tense, conjugation, irregular, pronominal, verb_group)
+        SELECT verb, person, tense, conjugation, irregular, pronominal, verb_group
+        FROM input
+        ORDER BY ord
+        ON CONFLICT (verb, person, tense, conjugation, irregular, pronominal, COALESCE(verb_group, 0))
+        DO NOTHING
+        RETURNING id, verb, person, tense, conjugation, irregular, pronominal, verb_group
+    )
+    SELECT i.ord, COALESCE(n.id, l.id) AS id
+    FROM input i
+    LEFT JOIN inserted n
+      ON (n.verb, n.person, n.tense, n.conjugation, n.irregular, n.pronominal, COALESCE(n.verb_group, 0))
+       = (i.verb, i.person, i.tense, i.conjugation, i.irregular, i.pronominal, COALESCE(i.verb_group, 0))
+    LEFT JOIN lexicon_conjugations l
+      ON (l.verb, l.person, l.tense, l.conjugation, l.irregular, l.pronominal, COALESCE(l.verb_group, 0))
+       = (i.verb, i.person, i.tense, i.conjugation, i.irregular, i.pronominal, COALESCE(i.verb_group, 0))
+    ORDER BY i.ord;
+"""
+
+
+def _resolve(cur, sql, params):
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    if any(row["id"] is None for row in rows):
+        # An entry committed by a concurrent request after this statement's
+        # snapshot was taken: skipped by ON CONFLICT, but not visible to the
+        # join. A new statement sees it.
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return rows
+
+
+def resolve_words(cur, words):
+    """
+    Lexicon entries for `words`, a list of (word, part_of_speech, article,
+    translation) tuples; new entries start with that one translation.
+    Returns [{"id", "translations"}, ...] in input order.
+    """
+    return _resolve(cur, RESOLVE_WORDS_SQL, {
+        "words": [w[0] for w in words],
+        "parts_of_speech": [w[1] for w in words],
+        "articles": [w[2] for w in words],
+        "translations": [w[3] for w in words],
+    })
+
+
+def resolve_conjugations(cur, conjugations):
+    """
+    Lexicon entry ids for `conjugations`, a list of (verb, person, tense,
+    conjugation, irregular, pronominal, verb_group) tuples, in input order.
+    """
+    return [row["id"] for row in _resolve(cur, RESOLVE_CONJUGATIONS_SQL, {
+        "verbs": [c[0] for c in conjugations],
+        "persons": [c[1] for c in conjugations],
+        "tenses": [c[2] for c in conjugations],
+        "conjugations": [c[3] for c in conjugations],
+        "irregular": [bool(c[4]) for c in conjugations],
+        "pronominal": [bool(c[5]) for c in conjugations],
+        "verb_groups": [c[6] for c in conjugations],
+    })]
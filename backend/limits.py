@@ -0,0 +1,146 @@
+"""
+Per-user admission control for the expensive endpoints.
+
+Each endpoint class (game, stats, search, export, batch) gets, per user, a
+token bucket (sustained requests per second plus a burst allowance) and a
+cap on requests in flight at once. A request that exceeds either gets a 429
+with a Retry-After header before the view touches the database, and the
+rejection is counted so it shows up on /metrics.
+
+Buckets, leases and counters live in the state store (see store.py), so
+deployments with several worker processes should use a shared STATE_STORE.
+
+Limits are configured per class as "rate/burst/concurrency", e.g.
+RATE_LIMIT_STATS="0.5/5/2", and read once by `load_limits` when the app is
+created, so a malformed value fails at startup. RATE_LIMITS_ENABLED=0 turns
+admission control off.
+"""
+import math
+import os
+import time
+from functools import wraps
+
+from flask import jsonify, make_response, session
+
+from logs import logger
+from store import get_store
+
+# class: (tokens per second, burst, concurrent requests, lease ttl in seconds)
+DEFAULT_LIMITS = {
+    "game": (1.0, 5, 2, 60),
+    "stats": (0.5, 5, 2, 60),
+    "search": (5.0, 20, 4, 30),
+    "export": (0.1, 3, 1, 600),
+    "batch": (1.0, 5, 2, 60),
+}
+REJECTION_REASONS = ("rate", "concurrency")
+
+
+def limits_enabled():
+    return os.environ.get("RATE_LIMITS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+_limits = None
+
+
+def load_limits():
+    """Read every class's RATE_LIMIT_* setting; raises ValueError on a bad one."""
+    global _limits
+    limits = {}
+    for endpoint_class, (rate, burst, concurrency, ttl) in DEFAULT_LIMITS.items():
+        name = f"RATE_LIMIT_{endpoint_class.upper()}"
+        raw = os.environ.get(name)
+        if raw:
+            try:
+                rate, burst, concurrency = raw.split("/")
+                rate, burst, concurrency = float(rate), float(burst), int(concurrency)
+            except ValueError:
+                raise ValueError(f"{name} must be rate/burst/concurrency, e.g. 0.5/5/2; got {raw!r}")
+        if rate <= 0 or burst < 1 or concurrency < 1:
+            raise ValueError(f"{name} needs rate > 0, burst >= 1 and concurrency >= 1; got {raw!r}")
+        limits[endpoint_class] = (rate, burst, concurrency, ttl)
+    _limits = limits
+    return limits
+
+
+def get_limits(endpoint_class):
+    return (_limits or load_limits())[endpoint_class]
+
+
+def _rejection_key(endpoint_class, reason):
+    return f"rejected:{endpoint_class}:{reason}"
+
+
+def admit(user_id, endpoint_class):
+    """
+    Decide whether `user_id` may run a request of `endpoint_class` now.
+
+    Returns (lease, retry_after). When admitted, retry_after is 0 and the
+    lease must be handed back to `release` once the response is finished.
+    """
+    if not limits_enabled():
+        return None, 0
+    store = get_store()
+    rate, burst, concurrency, ttl = get_limits(endpoint_class)
+    now = time.time()
+    key = f"{endpoint_class}:{user_id}"
+
+    # The lease first: a request turned away for concurrency keeps its token.
+    token = store.acquire_lease(f"lease:{key}", concurrency, ttl, now)
+    if token is None:
+        return None, _reject(endpoint_class, "concurrency", 1)
+
+    wait = store.take_token(f"bucket:{key}", rate, burst, now)
+    if wait:
+        store.release_lease(f"lease:{key}", token)
+        return None, _reject(endpoint_class, "rate", wait)
+    return (key, token), 0
+
+
+def release(lease):
+    if lease is not None:
+        key, token = lease
+        get_store().release_lease(f"lease:{key}", token)
+
+
+def _reject(endpoint_class, reason, wait):
+    get_store().incr(_rejection_key(endpoint_class, reason))
+    logger.warning("request rejected", extra={
+        "sample": 0.1, "endpoint_class": endpoint_class, "reason": reason,
+    })
+    return max(1, math.ceil(wait))
+
+
+def rejection_counts():
+    store = get_store()
+    return {
+        endpoint_class: {reason: store.get(_rejection_key(endpoint_class, reason))
+                         for reason in REJECTION_REASONS}
+        for endpoint_class in DEFAULT_LIMITS
+    }
+
+
+def too_many_requests(retry_after):
+    response = make_response(jsonify({"error": "Too many requests, please slow down."}), 429)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def admission_controlled(endpoint_class):
+    """Apply the per-user limits of `endpoint_class`. Goes after login_required."""
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            lease, retry_after = admit(session.get("user_id"), endpoint_class)
+            if retry_after:
+                return too_many_requests(retry_after)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                release(lease)
+                raise
+            # Streamed responses (exports) keep their slot until fully sent.
+            response.call_on_close(lambda: release(lease))
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,163 @@
+"""
+Structured, non-blocking logging.
+
+Request threads only put records on a bounded queue; a background
+QueueListener formats them as one JSON object per line and writes them to
+stdout. When the queue is full, records are dropped (and counted) rather
+than blocking a request.
+
+Every record logged during a request carries its correlation id, taken from
+the X-Request-ID header or generated, and echoed back on the response.
+High-volume events can be sampled: pass `extra={"sample": 0.01}` to keep
+roughly 1 in 100 of them.
+
+Environment: LOG_LEVEL (default INFO), LOG_REQUEST_SAMPLE_RATE (share of
+per-request access records kept, default 0.0).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+
+from flask import g, has_request_context, request, session
+
+logger = logging.getLogger("leximax")
+
+# Attributes every LogRecord has; anything else came in through `extra`.
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request's correlation id and user to each record."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.user_id = session.get("user_id")
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep records logged with `extra={"sample": p}` with probability p."""
+
+    def filter(self, record):
+        rate = getattr(record, "sample", None)
+        return rate is None or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key != "sample" and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks, and (re)starts its listener thread in
+    whichever process it finds itself in, so it survives a gunicorn fork.
+    """
+
+    def __init__(self, maxsize, target):
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._listener = logging.handlers.QueueListener(
+                    self.queue, self.target, respect_handler_level=True
+                )
+                self._listener.start()
+                self._pid = os.getpid()
+                atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Keep the traceback as text and drop the live exception, which
+        # can't cross the queue safely.
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+_handler = None
+
+
+def configure_logging(level=None, queue_size=10000):
+    """Route the `leximax` logger through the background JSON handler."""
+    global _handler
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    if _handler is None:
+        target = logging.StreamHandler(sys.stdout)
+        target.setFormatter(JSONFormatter())
+        _handler = BackgroundQueueHandler(queue_size, target)
+        _handler.addFilter(SamplingFilter())
+        _handler.addFilter(RequestContextFilter())
+        logger.addHandler(_handler)
+        logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def init_request_logging(app, sample_rate=None):
+    """Assign correlation ids and log a (sampled) access record per request."""
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("LOG_REQUEST_SAMPLE_RATE", 0.0))
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        response.headers["X-Request-ID"] = g.get("request_id", "")
+        if sample_rate > 0:
+            logger.info("request", extra={
+                "sample": sample_rate,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - g.get("request_started", 0)) * 1000, 2),
+            })
+        return response
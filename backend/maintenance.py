@@ -0,0 +1,477 @@
+"""
+Background maintenance, kept off the request path.
+
+    python maintenance.py                       # run every task once
+    python maintenance.py repair_scores         # run selected tasks
+    python maintenance.py --every 300           # keep running, one pass every 5 minutes
+    python maintenance.py --list                # show registered tasks
+    RUN_RETENTION_DAYS=180 python maintenance.py archive_runs
+
+Every task works in small batches, each in its own short transaction with a
+lock_timeout, and prints progress and timing as it goes. A batch that can't
+get its locks in time, or runs past statement_timeout, is skipped and picked
+up again on the next pass; after a timeout the task's later batches are half
+the size. Only one maintenance process runs a pass at a time (a Postgres
+advisory lock). A failing task is reported and the pass moves on; with
+--every, a dropped connection is reopened for the next pass.
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+from dotenv import load_dotenv
+
+from db import get_db_connection
+from queries import RUN_SOURCES
+from versions import bump_all_data_versions
+
+ADVISORY_LOCK_KEY = 0x1E71_3A11
+
+TASKS = {}
+
+
+def task(name):
+    """Register a maintenance task: a function taking a BatchRunner."""
+    def decorator(fn):
+        TASKS[name] = fn
+        return fn
+    return decorator
+
+
+class BatchRunner:
+    """Runs batched statements for a task, one short transaction per batch."""
+
+    def __init__(self, conn, batch_size=1000, lock_timeout="2s", statement_timeout="30s",
+                 pause=0.05, max_seconds=60):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self.statement_timeout = statement_timeout
+        self.pause = pause
+        self.max_seconds = max_seconds
+
+    def _batch(self, sql, params):
+        """Run one batch; returns the affected row count, or None if it hit a lock or timed out."""
+        cur = self.conn.cursor()
+        try:
+            cur.execute("SELECT set_config('lock_timeout', %s, true), "
+                        "set_config('statement_timeout', %s, true);",
+                        (self.lock_timeout, self.statement_timeout))
+            cur.execute(sql, params)
+            # Statements that can't report a rowcount return an `affected` column.
+            affected = cur.fetchone()["affected"] if cur.description else cur.rowcount
+            self.conn.commit()
+            return affected
+        except psycopg2.errors.LockNotAvailable:
+            self.conn.rollback()
+            return None
+        except psycopg2.errors.QueryCanceled:
+            self.conn.rollback()
+            self.batch_size = max(1, self.batch_size // 2)
+            return None
+        finally:
+            cur.close()
+
+    def _report(self, label, batch, affected, total, started):
+        print(f"  {label}: batch {batch}, {affected} rows ({total} total) "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def until_done(self, label, sql, params=None):
+        """
+        Repeat `sql` (which takes a %(limit)s, plus any `params`) until a
+        batch affects fewer than batch_size rows. For work found through an
+        index, e.g. rows still needing a repair.
+        """
+        total, batch, deadline = 0, 0, time.monotonic() + self.max_seconds
+        while time.monotonic() < deadline:
+            batch += 1
+            started = time.perf_counter()
+            size = self.batch_size
+            affected = self._batch(sql, {**(params or {}), "limit": size})
+            if affected is None and self.batch_size < size:
+                print(f"  {label}: batch {batch} timed out, retrying with {self.batch_size} rows")
+                continue
+            if affected is None:
+                print(f"  {label}: batch {batch} hit a lock or timed out, leaving the rest for the next pass")
+                break
+            total += affected
+            self._report(label, batch, affected, total, started)
+            if affected < self.batch_size:
+                break
+            time.sleep(self.pause)
+        return total
+
+    def by_id_range(self, label, table, key, sql):
+        """
+        Walk `table` in ranges of batch_size ids, running `sql` with
+        %(lo)s (exclusive) and %(hi)s (inclusive). For anti-joins, which
+        can't be found through an index and would otherwise scan
+        everything in one go.
+        """
+        cur = self.conn.cursor()
+        cur.execute(f"SELECT MIN({key}) AS lo, MAX({key}) AS hi FROM {table};")
+        bounds = cur.fetchone()
+        self.conn.commit()
+        cur.close()
+        if bounds["lo"] is None:
+            return 0
+
+        total, batch, deadline = 0, 0, time.monotonic() + self.max_seconds
+        lo = bounds["lo"] - 1
+        while lo < bounds["hi"]:
+            if time.monotonic() >= deadline:
+                print(f"  {label}: time budget used up at {table}.{key} > {lo}")
+                break
+            batch += 1
+            started = time.perf_counter()
+            hi = lo + self.batch_size
+            affected = self._batch(sql, {"lo": lo, "hi": hi})
+            if affected is None:
+                print(f"  {label}: {table}.{key} in ({lo}, {hi}] hit a lock or timed out, skipped")
+            else:
+                total += affected
+                if affected:
+                    self._report(label, batch, affected, total, started)
+            lo = hi
+            time.sleep(self.pause)
+        return total
+
+
+# --- Score repair ---
+# Same formula the start routes used to apply inline, now in batches found
+# through the partial indexes from migration 002.
+
+REPAIR_WORD_SCORES_BATCH_SQL = """
+    UPDATE word_tracking wt
+    SET score = GREATEST(
+        1 + (array_length(wt.mistake_timestamps, 1) * 2) +
+        EXTRACT(EPOCH FROM (NOW() - COALESCE(wt.last_accessed, '2000-01-01'::TIMESTAMPTZ))) / 3600,
+        1
+    )
+    WHERE wt.word_id IN (
+        SELECT word_id FROM word_tracking
+        WHERE score IS NULL OR score < 1
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    );
+"""
+
+REPAIR_CONJUGATION_SCORES_BATCH_SQL = """
+    UPDATE conjugation_tracking ct
+    SET score = GREATEST(
+        1 + (array_length(ct.mistake_timestamps, 1) * 2) +
+        EXTRACT(EPOCH FROM (NOW() - COALESCE(ct.last_accessed, '2000-01-01'::TIMESTAMPTZ))) / 3600,
+        1
+    )
+    WHERE ct.id IN (
+        SELECT id FROM conjugation_tracking
+        WHERE score IS NULL OR score < 1
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    );
+"""
+
+
+@task("repair_scores")
+def repair_scores(runner):
+    return (runner.until_done("word scores", REPAIR_WORD_SCORES_BATCH_SQL)
+            + runner.until_done("conjugation scores", REPAIR_CONJUGATION_SCORES_BATCH_SQL))
+
+
+# --- Tracking reconciliation ---
+# Items without a tracking row get the same defaults add_word/add_conjugation
+# give new items; tracking rows whose item is gone are removed.
+
+ADD_MISSING_WORD_TRACKING_SQL = """
+    INSERT INTO word_tracking (word_id, total_attempts, mistake_timestamps, last_accessed, score, user_id)
+    SELECT v.id, 0, ARRAY[]::TIMESTAMPTZ[], NOW(), 5, v.user_id
+    FROM vocabulary v
+    WHERE v.id > %(lo)s AND v.id <= %(hi)s
+      AND NOT EXISTS (SELECT 1 FROM word_tracking wt WHERE wt.word_id = v.id)
+    ON CONFLICT (word_id) DO NOTHING;
+"""
+
+DELETE_ORPHAN_WORD_TRACKING_SQL = """
+    DELETE FROM word_tracking wt
+    WHERE wt.word_id > %(lo)s AND wt.word_id <= %(hi)s
+      AND NOT EXISTS (SELECT 1 FROM vocabulary v WHERE v.id = wt.word_id);
+"""
+
+ADD_MISSING_CONJUGATION_TRACKING_SQL = """
+    INSERT INTO conjugation_tracking (id, total_attempts, mistake_timestamps, last_accessed, score, user_id)
+    SELECT c.id, 0, ARRAY[]::TIMESTAMPTZ[], NOW(), 5, c.user_id
+    FROM conjugations c
+    WHERE c.id > %(lo)s AND c.id <= %(hi)s
+      AND NOT EXISTS (SELECT 1 FROM conjugation_tracking ct WHERE ct.id = c.id)
+    ON CONFLICT (id) DO NOTHING;
+"""
+
+DELETE_ORPHAN_CONJUGATION_TRACKING_SQL = """
+    DELETE FROM conjugation_tracking ct
+    WHERE ct.id > %(lo)s AND ct.id <= %(hi)s
+      AND NOT EXISTS (SELECT 1 FROM conjugations c WHERE c.id = ct.id);
+"""
+
+
+@task("reconcile_tracking")
+def reconcile_tracking(runner):
+    return (
+        runner.by_id_range("missing word tracking", "vocabulary", "id", ADD_MISSING_WORD_TRACKING_SQL)
+        + runner.by_id_range("orphan word tracking", "word_tracking", "word_id",
+                             DELETE_ORPHAN_WORD_TRACKING_SQL)
+        + runner.by_id_range("missing conjugation tracking", "conjugations", "id",
+                             ADD_MISSING_CONJUGATION_TRACKING_SQL)
+        + runner.by_id_range("orphan conjugation tracking", "conjugation_tracking", "id",
+                             DELETE_ORPHAN_CONJUGATION_TRACKING_SQL)
+    )
+
+
+# --- Run retention ---
+# Runs older than RUN_RETENTION_DAYS move from the hot tables into monthly
+# partitions of the archive tables (migration 004) and are folded into
+# run_summaries, so /stats keeps its totals while reading far fewer rows.
+# With ARCHIVE_DETACH_AFTER_MONTHS set, detach_archives detaches archive
+# partitions older than that many months; they stay in the database as
+# plain tables, ready to be dumped and dropped.
+
+RUN_RETENTION_DAYS = int(os.getenv("RUN_RETENTION_DAYS", "365"))
+ARCHIVE_DETACH_AFTER_MONTHS = int(os.getenv("ARCHIVE_DETACH_AFTER_MONTHS", "0"))  # 0 = never
+
+ARCHIVE_RUNS_BATCH_SQL = """
+    WITH moved AS (
+        DELETE FROM {table}
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE {time} < %(cutoff)s
+            ORDER BY {time}
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ),
+    archived AS (
+        INSERT INTO {archive} SELECT * FROM moved
+    ),
+    summarized AS (
+        INSERT INTO run_summaries AS rs
+            (user_id, game, day, format, ungraded, time_limit,
+             runs, attempts, correct, accuracy_sum, ratio_sum)
+        SELECT user_id, %(game)s, ({time} AT TIME ZONE 'UTC')::date, {format},
+               bool_or(ungraded), MIN(time_limit),
+               COUNT(*), SUM({attempts}), SUM({correct}),
+               SUM({accuracy}), COALESCE(SUM({ratio}), 0)
+        FROM moved
+        GROUP BY 1, 3, 4
+        ON CONFLICT (user_id, game, day, format) DO UPDATE SET
+            runs = rs.runs + EXCLUDED.runs,
+            attempts = rs.attempts + EXCLUDED.attempts,
+            correct = rs.correct + EXCLUDED.correct,
+            accuracy_sum = rs.accuracy_sum + EXCLUDED.accuracy_sum,
+            ratio_sum = rs.ratio_sum + EXCLUDED.ratio_sum
+    )
+    SELECT COUNT(*) AS affected FROM moved;
+"""
+
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def _partition_name(archive, month):
+    return f"{archive}_{month:%Y_%m}"
+
+
+def _ensure_partitions(conn, src, cutoff):
+    """Create the monthly archive partitions the runs before `cutoff` need."""
+    cur = conn.cursor()
+    cur.execute(f"SELECT MIN({src['time']}) AS oldest FROM {src['table']} WHERE {src['time']} < %s;",
+                (cutoff,))
+    oldest = cur.fetchone()["oldest"]
+    month = _month_start(oldest.astimezone(timezone.utc)) if oldest else None
+    while month is not None and month < cutoff:
+        name = _partition_name(src["archive"], month)
+        cur.execute("""
+            SELECT to_regclass(%(name)s) IS NOT NULL AS exists,
+                   EXISTS (SELECT 1 FROM pg_inherits
+                           WHERE inhrelid = to_regclass(%(name)s)
+                             AND inhparent = %(archive)s::regclass) AS attached;
+        """, {"name": name, "archive": src["archive"]})
+        partition = cur.fetchone()
+        if partition["exists"] and not partition["attached"]:
+            # Detached by detach_archives (or by hand); CREATE ... IF NOT
+            # EXISTS would skip it and the month's runs would have nowhere to go.
+            conn.rollback()
+            cur.close()
+            raise RuntimeError(
+                f"{name} exists but is not a partition of {src['archive']}, and {src['table']} "
+                f"still has runs from {month:%Y-%m}. Re-attach it (ALTER TABLE {src['archive']} "
+                f"ATTACH PARTITION {name} ...) or rename it, or keep ARCHIVE_DETACH_AFTER_MONTHS "
+                f"longer than RUN_RETENTION_DAYS."
+            )
+        if not partition["exists"]:
+            cur.execute(f"""
+                CREATE TABLE {name}
+                PARTITION OF {src['archive']} FOR VALUES FROM (%s) TO (%s);
+            """, (month, _next_month(month)))
+        month = _next_month(month)
+    conn.commit()
+    cur.close()
+
+
+@task("archive_runs")
+def archive_runs(runner):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=RUN_RETENTION_DAYS)
+    total = 0
+    for game, src in RUN_SOURCES.items():
+        _ensure_partitions(runner.conn, src, cutoff)
+        sql = ARCHIVE_RUNS_BATCH_SQL.format(**src)
+        total += runner.until_done(f"{game} runs", sql, {"cutoff": cutoff, "game": game})
+    return total
+
+
+@task("detach_archives")
+def detach_archives(runner):
+    if not ARCHIVE_DETACH_AFTER_MONTHS:
+        return 0
+    month = _month_start(datetime.now(timezone.utc))
+    for _ in range(ARCHIVE_DETACH_AFTER_MONTHS):
+        month = _month_start(month - timedelta(days=1))
+    detached = 0
+    cur = runner.conn.cursor()
+    for src in RUN_SOURCES.values():
+        # Partitions are named by month, so name order is age order.
+        cur.execute("""
+            SELECT c.relname AS name
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass AND c.relname < %s
+            ORDER BY c.relname;
+        """, (src["archive"], _partition_name(src["archive"], month)))
+        names = [row["name"] for row in cur.fetchall()]
+        runner.conn.commit()
+        for name in names:
+            affected = runner._batch(f"ALTER TABLE {src['archive']} DETACH PARTITION {name};", None)
+            if affected is None:
+                print(f"  {name}: hit a lock or timed out, leaving it for the next pass")
+                continue
+            print(f"  detached {name}")
+            detached += 1
+    cur.close()
+    return detached
+
+
+def run_pass(conn, names, **runner_options):
+    """
+    Run the named tasks once. Returns the names of the tasks that failed, or
+    None if another process holds the lock. A dropped connection is raised.
+    If any task changed rows (or failed after committing some batches),
+    every user's data version is bumped so clients don't revalidate against
+    stale ETags.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (ADVISORY_LOCK_KEY,))
+    locked = cur.fetchone()["locked"]
+    conn.commit()
+    if not locked:
+        print("Another maintenance pass is running; skipping.")
+        cur.close()
+        return None
+
+    failed = []
+    changed = False
+    try:
+        for name in names:
+            print(f"{name} ...")
+            started = time.perf_counter()
+            try:
+                rows = TASKS[name](BatchRunner(conn, **runner_options))
+            except Exception:
+                if conn.closed:
+                    raise
+                conn.rollback()
+                print(f"{name} failed after {time.perf_counter() - started:.2f} s:", file=sys.stderr)
+                traceback.print_exc()
+                failed.append(name)
+                changed = True
+                continue
+            print(f"{name}: {rows} rows in {time.perf_counter() - started:.2f} s")
+            changed = changed or bool(rows)
+    finally:
+        # The advisory lock belongs to the session: gone with a dropped
+        # connection, and only releasable outside an aborted transaction.
+        if not conn.closed:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
+            conn.commit()
+        cur.close()
+        if changed:
+            _bump_data_versions()
+    return failed
+
+
+def _bump_data_versions():
+    try:
+        bump_all_data_versions()
+    except Exception:
+        print("Could not bump the data versions; clients may keep stale copies:", file=sys.stderr)
+        traceback.print_exc()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="LexiMax background maintenance")
+    parser.add_argument("tasks", nargs="*", help="tasks to run (default: all)")
+    parser.add_argument("--list", action="store_true", help="list tasks and exit")
+    parser.add_argument("--every", type=float, help="repeat a pass every N seconds")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--lock-timeout", default="2s")
+    parser.add_argument("--statement-timeout", default="30s")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    parser.add_argument("--max-seconds", type=float, default=60, help="time budget per task step")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in TASKS:
+            print(name)
+        return 0
+    unknown = [name for name in args.tasks if name not in TASKS]
+    if unknown:
+        parser.error(f"unknown task(s): {', '.join(unknown)}")
+    names = args.tasks or list(TASKS)
+
+    load_dotenv()
+    conn = None
+    options = dict(batch_size=args.batch_size, lock_timeout=args.lock_timeout,
+                   statement_timeout=args.statement_timeout, pause=args.pause,
+                   max_seconds=args.max_seconds)
+    try:
+        while True:
+            failed = None
+            try:
+                if conn is None or conn.closed:
+                    conn = get_db_connection(scoped=False)
+                failed = run_pass(conn, names, **options)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if not args.every:
+                    raise
+                print("Lost the database connection; retrying next pass:", file=sys.stderr)
+                traceback.print_exc()
+            if not args.every:
+                return 1 if failed else 0
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
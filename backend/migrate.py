@@ -0,0 +1,93 @@
+"""
+Apply the SQL files in migrations/ in filename order.
+
+    python migrate.py           # apply pending migrations
+    python migrate.py --list    # show applied and pending migrations
+
+Applied files are recorded in `schema_migrations`. Each file runs in its own
+transaction, unless its first line is `-- migrate: no-transaction` (needed
+for CREATE INDEX CONCURRENTLY); such files run statement by statement in
+autocommit mode, with statements separated by a `;` at the end of a line.
+Applying any migration bumps every user's data version (see versions.py).
+"""
+import os
+import re
+import sys
+
+from dotenv import load_dotenv
+
+from db import get_db_connection
+from versions import bump_all_data_versions
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+
+def migration_files():
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+
+
+def applied_migrations(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name       TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("SELECT name FROM schema_migrations;")
+    return {row["name"] for row in cur.fetchall()}
+
+
+def split_statements(sql):
+    return [s.strip() for s in re.split(r";\s*$", sql, flags=re.MULTILINE) if s.strip()]
+
+
+def apply_migration(conn, name):
+    with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+        sql = f.read()
+    cur = conn.cursor()
+    if sql.startswith(NO_TRANSACTION):
+        conn.autocommit = True
+        try:
+            for statement in split_statements(sql):
+                cur.execute(statement)
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s);", (name,))
+        finally:
+            conn.autocommit = False
+    else:
+        cur.execute(sql)
+        cur.execute("INSERT INTO schema_migrations (name) VALUES (%s);", (name,))
+        conn.commit()
+    for notice in conn.notices:
+        print("   ", notice.strip())
+    del conn.notices[:]
+    cur.close()
+
+
+def main(argv):
+    load_dotenv()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    applied = applied_migrations(cur)
+    conn.commit()
+    cur.close()
+
+    pending = [name for name in migration_files() if name not in applied]
+    if "--list" in argv:
+        for name in migration_files():
+            print(("applied  " if name in applied else "pending  ") + name)
+        return 0
+
+    for name in pending:
+        print(f"Applying {name} ...")
+        apply_migration(conn, name)
+    print(f"{len(pending)} migration(s) applied.")
+    conn.close()
+    if pending:
+        # Migrations can change what the read routes return (e.g. 007's views).
+        bump_all_data_versions()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
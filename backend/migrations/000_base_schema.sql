@@ -0,0 +1,91 @@
+-- Base schema the application was originally deployed with. Everything is
+-- IF NOT EXISTS so this is a no-op on existing databases and bootstraps
+-- fresh ones.
+
+CREATE TABLE IF NOT EXISTS users (
+    id            SERIAL PRIMARY KEY,
+    username      TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    settings      JSONB NOT NULL DEFAULT '{}'::jsonb
+);
+
+CREATE TABLE IF NOT EXISTS vocabulary (
+    id             SERIAL PRIMARY KEY,
+    word           TEXT NOT NULL,
+    translations   TEXT[] NOT NULL DEFAULT ARRAY[]::TEXT[],
+    part_of_speech TEXT,
+    article        TEXT,
+    class          TEXT,
+    user_id        INTEGER NOT NULL REFERENCES users (id),
+    created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS vocabulary_user_id_idx ON vocabulary (user_id);
+
+CREATE TABLE IF NOT EXISTS word_tracking (
+    word_id            INTEGER PRIMARY KEY REFERENCES vocabulary (id),
+    word               TEXT,
+    total_attempts     INTEGER NOT NULL DEFAULT 0,
+    mistake_timestamps TIMESTAMPTZ[] NOT NULL DEFAULT ARRAY[]::TIMESTAMPTZ[],
+    last_accessed      TIMESTAMPTZ,
+    score              DOUBLE PRECISION,
+    user_id            INTEGER NOT NULL REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS word_tracking_user_id_idx ON word_tracking (user_id);
+
+CREATE TABLE IF NOT EXISTS conjugations (
+    id          SERIAL PRIMARY KEY,
+    verb        TEXT NOT NULL,
+    person      TEXT NOT NULL,
+    tense       TEXT NOT NULL,
+    conjugation TEXT NOT NULL,
+    irregular   BOOLEAN NOT NULL DEFAULT FALSE,
+    pronominal  BOOLEAN NOT NULL DEFAULT FALSE,
+    verb_group  INTEGER,
+    user_id     INTEGER NOT NULL REFERENCES users (id),
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS conjugations_user_id_idx ON conjugations (user_id);
+
+CREATE TABLE IF NOT EXISTS conjugation_tracking (
+    id                 INTEGER PRIMARY KEY REFERENCES conjugations (id),
+    verb               TEXT,
+    person             TEXT,
+    tense              TEXT,
+    total_attempts     INTEGER NOT NULL DEFAULT 0,
+    mistake_timestamps TIMESTAMPTZ[] NOT NULL DEFAULT ARRAY[]::TIMESTAMPTZ[],
+    last_accessed      TIMESTAMPTZ,
+    score              DOUBLE PRECISION,
+    user_id            INTEGER NOT NULL REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS conjugation_tracking_user_id_idx ON conjugation_tracking (user_id);
+
+CREATE TABLE IF NOT EXISTS game_runs (
+    id                    SERIAL PRIMARY KEY,
+    timestamp             TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    time_limit            DOUBLE PRECISION,  -- minutes
+    game_type             TEXT,
+    zen_mode              BOOLEAN,
+    total_words_attempted INTEGER NOT NULL DEFAULT 0,
+    correct_words         INTEGER NOT NULL DEFAULT 0,
+    ungraded              BOOLEAN NOT NULL DEFAULT FALSE,
+    user_id               INTEGER NOT NULL REFERENCES users (id),
+    classes               TEXT[],
+    parts_of_speech       TEXT[]
+);
+CREATE INDEX IF NOT EXISTS game_runs_user_id_idx ON game_runs (user_id);
+
+CREATE TABLE IF NOT EXISTS conjugation_game_runs (
+    id              SERIAL PRIMARY KEY,
+    end_time        TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    time_limit      INTEGER,  -- seconds
+    mode            TEXT,
+    zen_mode        BOOLEAN,
+    ungraded        BOOLEAN NOT NULL DEFAULT FALSE,
+    tenses          TEXT[],
+    groups          INTEGER[],
+    pronominal_mode TEXT,
+    total_attempts  INTEGER NOT NULL DEFAULT 0,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    user_id         INTEGER NOT NULL REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS conjugation_game_runs_user_id_idx ON conjugation_game_runs (user_id);
@@ -0,0 +1,24 @@
+-- migrate: no-transaction
+-- Trigram indexes behind /search. Built CONCURRENTLY so existing tables stay
+-- writable; btree_gin lets user_id live in the same GIN index.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- array_to_string() is only STABLE, so wrap it to make translations indexable.
+CREATE OR REPLACE FUNCTION leximax_search_text(text[]) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(array_to_string($1, ' ')) $$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS vocabulary_word_trgm_idx
+    ON vocabulary USING gin (user_id, lower(word) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS vocabulary_translations_trgm_idx
+    ON vocabulary USING gin (user_id, leximax_search_text(translations) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conjugations_verb_trgm_idx
+    ON conjugations USING gin (user_id, lower(verb) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conjugations_conjugation_trgm_idx
+    ON conjugations USING gin (user_id, lower(conjugation) gin_trgm_ops);
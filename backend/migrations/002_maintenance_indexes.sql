@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Partial indexes so maintenance.py finds rows needing a score repair
+-- without scanning the tracking tables. Both stay empty in steady state.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS word_tracking_needs_score_idx
+    ON word_tracking (word_id) WHERE score IS NULL OR score < 1;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conjugation_tracking_needs_score_idx
+    ON conjugation_tracking (id) WHERE score IS NULL OR score < 1;
@@ -0,0 +1,13 @@
+-- The tracking tables keep only keys and counters; labels are read from
+-- vocabulary / conjugations through joins. Dropping a column only touches
+-- the catalog, but needs a brief exclusive lock, so don't queue behind
+-- long-running transactions. Existing tuples shed the old text the next
+-- time they are rewritten (every end-game attempt does that).
+SET LOCAL lock_timeout = '5s';
+
+ALTER TABLE word_tracking DROP COLUMN IF EXISTS word;
+
+ALTER TABLE conjugation_tracking
+    DROP COLUMN IF EXISTS verb,
+    DROP COLUMN IF EXISTS person,
+    DROP COLUMN IF EXISTS tense;
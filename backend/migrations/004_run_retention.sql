@@ -0,0 +1,43 @@
+-- migrate: no-transaction
+-- Retention tier for game runs. maintenance.py's archive_runs task moves
+-- runs older than RUN_RETENTION_DAYS out of the hot tables into monthly
+-- partitions of the *_archive tables, and folds them into run_summaries
+-- (one row per user, game, UTC day and format), which /stats reads
+-- alongside the hot runs. Old archive partitions can be detached and
+-- dumped without touching the hot tables.
+
+CREATE TABLE IF NOT EXISTS run_summaries (
+    user_id      INTEGER NOT NULL REFERENCES users (id),
+    game         TEXT NOT NULL,  -- 'vocabulary' or 'conjugation'
+    day          DATE NOT NULL,  -- UTC
+    format       TEXT NOT NULL,
+    ungraded     BOOLEAN NOT NULL,
+    time_limit   DOUBLE PRECISION,
+    runs         INTEGER NOT NULL,
+    attempts     BIGINT NOT NULL,
+    correct      BIGINT NOT NULL,
+    accuracy_sum DOUBLE PRECISION NOT NULL,  -- per-run accuracies, for averages
+    ratio_sum    DOUBLE PRECISION NOT NULL,  -- per-run correct/second, for averages
+    PRIMARY KEY (user_id, game, day, format)
+);
+
+-- Same columns as the hot tables, minus keys and defaults; partitions are
+-- created month by month by archive_runs.
+CREATE TABLE IF NOT EXISTS game_runs_archive (LIKE game_runs)
+    PARTITION BY RANGE ("timestamp");
+
+CREATE INDEX IF NOT EXISTS game_runs_archive_user_id_idx
+    ON game_runs_archive (user_id, "timestamp");
+
+CREATE TABLE IF NOT EXISTS conjugation_game_runs_archive (LIKE conjugation_game_runs)
+    PARTITION BY RANGE (end_time);
+
+CREATE INDEX IF NOT EXISTS conjugation_game_runs_archive_user_id_idx
+    ON conjugation_game_runs_archive (user_id, end_time);
+
+-- So archive_runs finds expired runs without scanning the hot tables.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS game_runs_timestamp_idx
+    ON game_runs ("timestamp");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conjugation_game_runs_end_time_idx
+    ON conjugation_game_runs (end_time);
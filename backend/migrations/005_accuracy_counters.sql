@@ -0,0 +1,37 @@
+-- Attempts and mistakes per user, game, breakdown dimension and value,
+-- kept up to date by the end-game tracking updates (see queries.py) and
+-- read by /stats/breakdown. Backfilled here from the tracking tables; run
+-- it together with the deploy that starts updating the counters, since
+-- games ended in between are not counted.
+CREATE TABLE IF NOT EXISTS accuracy_counters (
+    user_id   INTEGER NOT NULL REFERENCES users (id),
+    game      TEXT NOT NULL,       -- 'vocabulary' or 'conjugation'
+    dimension TEXT NOT NULL,       -- e.g. 'class', 'tense', 'verb_group'
+    value     TEXT NOT NULL,
+    attempts  BIGINT NOT NULL DEFAULT 0,
+    mistakes  BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, game, dimension, value)
+);
+
+INSERT INTO accuracy_counters (user_id, game, dimension, value, attempts, mistakes)
+SELECT v.user_id, 'vocabulary', d.dimension, d.value,
+       SUM(wt.total_attempts), SUM(COALESCE(array_length(wt.mistake_timestamps, 1), 0))
+FROM word_tracking wt
+JOIN vocabulary v ON v.id = wt.word_id
+CROSS JOIN LATERAL (VALUES ('class', v.class::text),
+                           ('part_of_speech', v.part_of_speech::text)) AS d(dimension, value)
+WHERE wt.total_attempts > 0 AND d.value IS NOT NULL
+GROUP BY v.user_id, d.dimension, d.value
+ON CONFLICT DO NOTHING;
+
+INSERT INTO accuracy_counters (user_id, game, dimension, value, attempts, mistakes)
+SELECT c.user_id, 'conjugation', d.dimension, d.value,
+       SUM(ct.total_attempts), SUM(COALESCE(array_length(ct.mistake_timestamps, 1), 0))
+FROM conjugation_tracking ct
+JOIN conjugations c ON c.id = ct.id
+CROSS JOIN LATERAL (VALUES ('tense', c.tense::text),
+                           ('verb_group', c.verb_group::text),
+                           ('pronominal', c.pronominal::text)) AS d(dimension, value)
+WHERE ct.total_attempts > 0 AND d.value IS NOT NULL
+GROUP BY c.user_id, d.dimension, d.value
+ON CONFLICT DO NOTHING;
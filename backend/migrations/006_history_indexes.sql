@@ -0,0 +1,23 @@
+-- migrate: no-transaction
+-- Keyset indexes for /history: each page is a short backward range scan
+-- per table, however far back the cursor is. The archive indexes replace
+-- the (user_id, time) ones from migration 004; archive tables are
+-- partitioned, so theirs can't be built CONCURRENTLY. A plain build only
+-- blocks writes, and only maintenance writes them; /history and exports,
+-- which read them, are not blocked.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS game_runs_user_history_idx
+    ON game_runs (user_id, "timestamp", id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS conjugation_game_runs_user_history_idx
+    ON conjugation_game_runs (user_id, end_time, id);
+
+CREATE INDEX IF NOT EXISTS game_runs_archive_user_history_idx
+    ON game_runs_archive (user_id, "timestamp", id);
+
+DROP INDEX IF EXISTS game_runs_archive_user_id_idx;
+
+CREATE INDEX IF NOT EXISTS conjugation_game_runs_archive_user_history_idx
+    ON conjugation_game_runs_archive (user_id, end_time, id);
+
+DROP INDEX IF EXISTS conjugation_game_runs_archive_user_id_idx;
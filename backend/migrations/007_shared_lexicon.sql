@@ -0,0 +1,158 @@
+-- Shared lexicon. The text of a word (word, part of speech, article,
+-- translations) or of a conjugation (every column but the owner) lives once
+-- in lexicon_words / lexicon_conjugations; vocabulary and conjugations rows
+-- point at an entry and keep only what is the user's own: class, created_at,
+-- tracking, and overrides. A non-NULL content column on a user row wins over
+-- the entry's (vocabulary.translations is the usual one; edited rows are
+-- detached from the lexicon and own all their columns again).
+--
+-- Reads go through the vocabulary_entries / conjugation_entries views, which
+-- have the columns the tables used to have. This migration links every
+-- existing row, clears the copied columns and reports the text moved out of
+-- the user tables; the space is reused by later writes (or reclaimed at once
+-- by VACUUM FULL).
+SET LOCAL lock_timeout = '5s';
+
+CREATE TEMP TABLE lexicon_sizes ON COMMIT DROP AS
+SELECT (SELECT COALESCE(SUM(pg_column_size(word) + pg_column_size(translations)
+                            + COALESCE(pg_column_size(part_of_speech), 0)
+                            + COALESCE(pg_column_size(article), 0)), 0)
+        FROM vocabulary) AS words_before,
+       (SELECT COALESCE(SUM(pg_column_size(verb) + pg_column_size(person) + pg_column_size(tense)
+                            + pg_column_size(conjugation) + pg_column_size(irregular)
+                            + pg_column_size(pronominal) + COALESCE(pg_column_size(verb_group), 0)), 0)
+        FROM conjugations) AS conjugations_before;
+
+CREATE TABLE IF NOT EXISTS lexicon_words (
+    id             SERIAL PRIMARY KEY,
+    word           TEXT NOT NULL,
+    part_of_speech TEXT,
+    article        TEXT,
+    translations   TEXT[] NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS lexicon_words_key
+    ON lexicon_words (word, COALESCE(part_of_speech, ''), COALESCE(article, ''));
+
+CREATE TABLE IF NOT EXISTS lexicon_conjugations (
+    id          SERIAL PRIMARY KEY,
+    verb        TEXT NOT NULL,
+    person      TEXT NOT NULL,
+    tense       TEXT NOT NULL,
+    conjugation TEXT NOT NULL,
+    irregular   BOOLEAN NOT NULL,
+    pronominal  BOOLEAN NOT NULL,
+    verb_group  INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS lexicon_conjugations_key
+    ON lexicon_conjugations (verb, person, tense, conjugation, irregular, pronominal, COALESCE(verb_group, 0));
+
+-- Content columns become overrides: nullable, and without defaults, which
+-- would otherwise override the entry.
+ALTER TABLE vocabulary
+    ADD COLUMN IF NOT EXISTS lexicon_id INTEGER REFERENCES lexicon_words (id),
+    ALTER COLUMN word DROP NOT NULL,
+    ALTER COLUMN translations DROP NOT NULL,
+    ALTER COLUMN translations DROP DEFAULT;
+
+ALTER TABLE conjugations
+    ADD COLUMN IF NOT EXISTS lexicon_id INTEGER REFERENCES lexicon_conjugations (id),
+    ALTER COLUMN verb DROP NOT NULL,
+    ALTER COLUMN person DROP NOT NULL,
+    ALTER COLUMN tense DROP NOT NULL,
+    ALTER COLUMN conjugation DROP NOT NULL,
+    ALTER COLUMN irregular DROP NOT NULL,
+    ALTER COLUMN irregular DROP DEFAULT,
+    ALTER COLUMN pronominal DROP NOT NULL,
+    ALTER COLUMN pronominal DROP DEFAULT;
+
+-- One entry per distinct word; its translations are the most common list
+-- among the users who have it. Users with another list keep it as override.
+INSERT INTO lexicon_words (word, part_of_speech, article, translations)
+SELECT word, part_of_speech, article, mode() WITHIN GROUP (ORDER BY translations)
+FROM vocabulary
+WHERE lexicon_id IS NULL
+GROUP BY word, part_of_speech, article
+ON CONFLICT DO NOTHING;
+
+UPDATE vocabulary v
+SET lexicon_id = l.id,
+    word = NULL,
+    part_of_speech = NULL,
+    article = NULL,
+    translations = CASE WHEN v.translations = l.translations THEN NULL ELSE v.translations END
+FROM lexicon_words l
+WHERE v.lexicon_id IS NULL
+  AND l.word = v.word
+  AND COALESCE(l.part_of_speech, '') = COALESCE(v.part_of_speech, '')
+  AND COALESCE(l.article, '') = COALESCE(v.article, '');
+
+INSERT INTO lexicon_conjugations (verb, person, tense, conjugation, irregular, pronominal, verb_group)
+SELECT DISTINCT verb, person, tense, conjugation, irregular, pronominal, verb_group
+FROM conjugations
+WHERE lexicon_id IS NULL
+ON CONFLICT DO NOTHING;
+
+UPDATE conjugations c
+SET lexicon_id = l.id,
+    verb = NULL, person = NULL, tense = NULL, conjugation = NULL,
+    irregular = NULL, pronominal = NULL, verb_group = NULL
+FROM lexicon_conjugations l
+WHERE c.lexicon_id IS NULL
+  AND (l.verb, l.person, l.tense, l.conjugation, l.irregular, l.pronominal, COALESCE(l.verb_group, 0))
+    = (c.verb, c.person, c.tense, c.conjugation, c.irregular, c.pronominal, COALESCE(c.verb_group, 0));
+
+-- Each row looks its entry up by primary key (OFFSET 0 keeps the planner
+-- from turning the lookup into a hash join over the whole lexicon), so
+-- reading a user's rows costs in proportion to that user's data, however
+-- large the shared lexicon grows.
+CREATE OR REPLACE VIEW vocabulary_entries AS
+SELECT v.id,
+       COALESCE(v.word, l.word) AS word,
+       COALESCE(v.translations, l.translations) AS translations,
+       COALESCE(v.part_of_speech, l.part_of_speech) AS part_of_speech,
+       COALESCE(v.article, l.article) AS article,
+       v.class,
+       v.user_id,
+       v.created_at
+FROM vocabulary v
+LEFT JOIN LATERAL (SELECT * FROM lexicon_words l WHERE l.id = v.lexicon_id OFFSET 0) l ON true;
+
+CREATE OR REPLACE VIEW conjugation_entries AS
+SELECT c.id,
+       COALESCE(c.verb, l.verb) AS verb,
+       COALESCE(c.person, l.person) AS person,
+       COALESCE(c.tense, l.tense) AS tense,
+       COALESCE(c.conjugation, l.conjugation) AS conjugation,
+       COALESCE(c.irregular, l.irregular) AS irregular,
+       COALESCE(c.pronominal, l.pronominal) AS pronominal,
+       COALESCE(c.verb_group, l.verb_group) AS verb_group,
+       c.user_id,
+       c.created_at
+FROM conjugations c
+LEFT JOIN LATERAL (SELECT * FROM lexicon_conjugations l WHERE l.id = c.lexicon_id OFFSET 0) l ON true;
+
+DO $$
+DECLARE
+    sizes RECORD;
+    words_after BIGINT;
+    conjugations_after BIGINT;
+BEGIN
+    SELECT * INTO sizes FROM lexicon_sizes;
+    SELECT COALESCE(SUM(COALESCE(pg_column_size(word), 0) + COALESCE(pg_column_size(translations), 0)
+                        + COALESCE(pg_column_size(part_of_speech), 0)
+                        + COALESCE(pg_column_size(article), 0) + 4), 0)
+           + (SELECT COALESCE(SUM(pg_column_size(l.*)), 0) FROM lexicon_words l)
+      INTO words_after FROM vocabulary;
+    SELECT COALESCE(SUM(COALESCE(pg_column_size(verb), 0) + COALESCE(pg_column_size(person), 0)
+                        + COALESCE(pg_column_size(tense), 0) + COALESCE(pg_column_size(conjugation), 0)
+                        + COALESCE(pg_column_size(irregular), 0) + COALESCE(pg_column_size(pronominal), 0)
+                        + COALESCE(pg_column_size(verb_group), 0) + 4), 0)
+           + (SELECT COALESCE(SUM(pg_column_size(l.*)), 0) FROM lexicon_conjugations l)
+      INTO conjugations_after FROM conjugations;
+    RAISE NOTICE 'vocabulary: % -> % bytes of text (% saved), % shared entries',
+        sizes.words_before, words_after, sizes.words_before - words_after,
+        (SELECT COUNT(*) FROM lexicon_words);
+    RAISE NOTICE 'conjugations: % -> % bytes of text (% saved), % shared entries',
+        sizes.conjugations_before, conjugations_after, sizes.conjugations_before - conjugations_after,
+        (SELECT COUNT(*) FROM lexicon_conjugations);
+END $$;
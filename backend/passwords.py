@@ -0,0 +1,122 @@
+"""
+Password hashing off the request thread.
+
+Hashing is deliberately slow and CPU-bound; run inline, a burst of logins
+(a whole class signing in at once) holds every worker thread and stalls
+game traffic. Hashes are computed in a small process pool per worker
+process instead, and the number of hashes waiting for it is bounded: past
+that, `hash_password`/`check_password` raise `HashingBusy` and the route
+answers 503 with a Retry-After.
+
+Hashes use werkzeug's format, so existing ones keep working. When
+PASSWORD_HASH_METHOD changes, a user's stored hash is upgraded on their
+next successful login (`check_password` returns the new hash).
+
+Environment: PASSWORD_HASH_METHOD (werkzeug method string, default
+"scrypt", e.g. "scrypt:65536:8:1" or "pbkdf2:sha256:600000"),
+PASSWORD_HASH_WORKERS processes (default 2; 0 hashes on the request
+thread), PASSWORD_HASH_QUEUE hashes allowed to wait for a process
+(default 16), PASSWORD_HASH_TIMEOUT seconds (default 10).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Too many hashes are already queued; try again shortly."""
+
+
+def hash_method():
+    return os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+
+
+@lru_cache(maxsize=None)
+def _canonical(method):
+    # werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1");
+    # stored hashes carry the full form, so compare against that.
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def needs_rehash(stored_hash, method):
+    return stored_hash.split("$", 1)[0] != _canonical(method)
+
+
+def _check_and_rehash(stored_hash, password, method):
+    """(matches, new hash if it matches but uses other parameters, else None)."""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    if needs_rehash(stored_hash, method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+_executor = None
+_executor_pid = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Like prefetch's pool, one per worker process. Children are spawned,
+    # not forked, so they don't inherit a threaded parent's state.
+    global _executor, _executor_pid, _slots
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                workers = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+                _executor = None
+                if workers > 0:
+                    _executor = ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                _slots = threading.BoundedSemaphore(workers + int(os.environ.get("PASSWORD_HASH_QUEUE", 16)))
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _run(fn, *args):
+    executor = _get_executor()
+    if executor is None:
+        return fn(*args)
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # The slot stays taken until the hash is finished or cancelled, not just
+    # until this request stops waiting for it.
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10)))
+    except FutureTimeout:
+        future.cancel()
+        raise HashingBusy()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, hash_method())
+
+
+def check_password(stored_hash, password):
+    """
+    (matches, upgraded hash or None). Store the upgraded hash, if any; it
+    uses the current PASSWORD_HASH_METHOD.
+    """
+    return _run(_check_and_rehash, stored_hash, password, hash_method())
+
+
+def shutdown():
+    global _executor_pid
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor_pid = None
@@ -0,0 +1,159 @@
+"""
+Prefetched candidate sets for the next game.
+
+When a game ends, the end-game route already knows the user's filters and
+has just committed their new tracking state, so it schedules the next
+candidate query on a small background pool. The following start-game call
+with the same filters takes that result instead of querying again; each
+prefetched set is served at most once.
+
+Entries are keyed by (user, kind, filter signature) and remember the user's
+data version (see versions.py) from when they were scheduled. Adding,
+editing or deleting vocabulary or conjugations bumps that version, so a
+stale entry is never served, whichever worker made the change. The cache
+itself is per process, bounded in size (LRU) and in age (TTL).
+
+Environment: PREFETCH_ENABLED (default 1), PREFETCH_MAX_ENTRIES (default
+1000), PREFETCH_TTL seconds (default 300), PREFETCH_WORKERS (default 2),
+PREFETCH_WAIT seconds a start call waits for a still-running prefetch
+(default 0.5).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from db import get_db_connection
+from logs import logger
+from versions import get_data_version
+
+
+def prefetch_enabled():
+    return os.environ.get("PREFETCH_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def signature(filters):
+    """Order-insensitive signature of a filter dict (list order doesn't matter)."""
+    normalized = {k: sorted(v, key=str) if isinstance(v, list) else v for k, v in filters.items()}
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class CandidateCache:
+    """Bounded LRU of (data_version, expires_at, rows-or-Future) entries."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key, value):
+        """Drop `key`, but only if it still holds `value` (a newer put wins)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is value:
+                del self._entries[key]
+
+    def take(self, key, version):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+cache = CandidateCache(
+    max_entries=int(os.environ.get("PREFETCH_MAX_ENTRIES", 1000)),
+    ttl=float(os.environ.get("PREFETCH_TTL", 300)),
+)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Threads don't survive a fork, so each worker process gets its own pool.
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("PREFETCH_WORKERS", 2)),
+                    thread_name_prefix="prefetch",
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _run_query(sql, params):
+    conn = get_db_connection(scoped=False)
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        cur.close()
+        return rows
+    finally:
+        conn.close()
+
+
+def schedule(user_id, kind, filters, query):
+    """
+    Compute `query` (an (sql, params) pair) in the background and keep the
+    rows for the next start call of `kind` with the same `filters`. Call
+    only after the end-game transaction has committed.
+    """
+    if not prefetch_enabled():
+        return
+    key = (user_id, kind, signature(filters))
+    future = _get_executor().submit(_run_query, *query)
+    cache.put(key, get_data_version(user_id), future)
+
+    def forget_failures(done):
+        if done.exception() is not None:
+            logger.warning("prefetch failed", extra={"kind": kind, "error": str(done.exception())})
+            cache.discard(key, done)
+    future.add_done_callback(forget_failures)
+
+
+def store(user_id, kind, filters, version, rows):
+    """Keep already computed rows (used by the async serving mode)."""
+    if prefetch_enabled():
+        cache.put((user_id, kind, signature(filters)), version, rows)
+
+
+def take(user_id, kind, filters, wait=None):
+    """
+    Return the prefetched rows for this start call, or None. A prefetch
+    that is still running is waited for up to `wait` seconds.
+    """
+    if not prefetch_enabled():
+        return None
+    value = cache.take((user_id, kind, signature(filters)), get_data_version(user_id))
+    if not isinstance(value, Future):
+        return value
+    if wait is None:
+        wait = float(os.environ.get("PREFETCH_WAIT", 0.5))
+    try:
+        return value.result(timeout=wait)
+    except Exception:
+        # Still running or failed: the caller queries as usual.
+        return None
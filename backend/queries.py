@@ -0,0 +1,777 @@
+"""
+SQL shared by the sync (Flask/psycopg2) and async (Quart/asyncpg) request
+paths for the game and stats endpoints.
+
+Builders return `(sql, params)` pairs written for psycopg2 (`%s` /
+`%(name)s` placeholders); `to_asyncpg` rewrites them for asyncpg. Shaping
+helpers turn fetched rows into the JSON the endpoints return, so both paths
+produce identical responses.
+"""
+import base64
+import json
+import re
+from datetime import datetime, timedelta, timezone
+
+# Bucket sizes accepted by the growth series, mapped to generate_series steps.
+GROWTH_GRANULARITIES = {"day": "1 day", "week": "1 week", "month": "1 month"}
+
+
+def build_where_clause(conditions):
+    """
+    Given a list of conditions (strings), return a WHERE clause that joins
+    them with AND. If no conditions, returns an empty string.
+    """
+    if conditions:
+        return "WHERE " + " AND ".join(conditions)
+    return ""
+
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def to_asyncpg(sql, params=()):
+    """Rewrite a psycopg2-style (sql, params) pair into asyncpg's ($n, args)."""
+    args = []
+    named = {}
+    positional = iter(params) if not isinstance(params, dict) else None
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(0) == "%s":
+            args.append(next(positional))
+            return f"${len(args)}"
+        name = match.group(1)
+        if name not in named:
+            args.append(params[name])
+            named[name] = len(args)
+        return f"${named[name]}"
+
+    return _PLACEHOLDER.sub(replace, sql), args
+
+
+# --- Growth ---
+
+def growth_series_query(user_id, granularity="day", start=None, end=None, include_baseline=True,
+                        max_buckets=None):
+    """
+    Gap-filled running totals of words and conjugations added per bucket
+    ("day", "week" or "month"), computed entirely in SQL.
+
+    `start`/`end` bound the series (`end` is exclusive). Without `start` the
+    series begins at the user's first addition, without `end` it stops at
+    NOW(). With `include_baseline`, the totals also count items added before
+    `start`; otherwise they start from zero. With `max_buckets` and no
+    `start`, the series starts no earlier than that many buckets before
+    its end.
+    """
+    # The MATERIALIZED CTEs are evaluated once; inlined, first_added ran
+    # twice and baseline once per bucket, each a pass over the user's rows.
+    sql = """
+        WITH first_added AS MATERIALIZED (
+            SELECT LEAST(
+                       (SELECT MIN(created_at) FROM vocabulary WHERE user_id = %(user_id)s),
+                       (SELECT MIN(created_at) FROM conjugations WHERE user_id = %(user_id)s)
+                   ) AS at
+        ),
+        bounds AS (
+            SELECT COALESCE(%(start)s::timestamptz,
+                            CASE WHEN f.at IS NOT NULL THEN GREATEST(
+                                f.at,
+                                COALESCE(%(end)s::timestamptz, NOW())
+                                    - %(max_buckets)s::int * CAST(%(step)s AS TEXT)::interval
+                            ) END) AS lo,
+                   COALESCE(%(end)s::timestamptz, NOW()) AS hi
+            FROM first_added f
+        ),
+        buckets AS (
+            SELECT generate_series(
+                       date_trunc(%(granularity)s, b.lo),
+                       date_trunc(%(granularity)s, b.hi - INTERVAL '1 microsecond'),
+                       CAST(%(step)s AS TEXT)::interval
+                   ) AS bucket
+            FROM bounds b
+        ),
+        words AS (
+            SELECT date_trunc(%(granularity)s, v.created_at) AS bucket, COUNT(*) AS added
+            FROM vocabulary v, bounds b
+            WHERE v.user_id = %(user_id)s AND v.created_at >= b.lo AND v.created_at < b.hi
+            GROUP BY 1
+        ),
+        conjs AS (
+            SELECT date_trunc(%(granularity)s, c.created_at) AS bucket, COUNT(*) AS added
+            FROM conjugations c, bounds b
+            WHERE c.user_id = %(user_id)s AND c.created_at >= b.lo AND c.created_at < b.hi
+            GROUP BY 1
+        ),
+        baseline AS MATERIALIZED (
+            SELECT CASE WHEN %(baseline)s THEN
+                       (SELECT COUNT(*) FROM vocabulary v
+                        WHERE v.user_id = %(user_id)s AND v.created_at < b.lo)
+                   ELSE 0 END AS words,
+                   CASE WHEN %(baseline)s THEN
+                       (SELECT COUNT(*) FROM conjugations c
+                        WHERE c.user_id = %(user_id)s AND c.created_at < b.lo)
+                   ELSE 0 END AS conjs
+            FROM bounds b
+        )
+        SELECT to_char(bk.bucket, 'YYYY-MM-DD') AS date,
+               COALESCE(w.added, 0) AS "newWords",
+               COALESCE(c.added, 0) AS "newConjugations",
+               (bl.words + SUM(COALESCE(w.added, 0)) OVER (ORDER BY bk.bucket))::bigint AS "cumulativeWords",
+               (bl.conjs + SUM(COALESCE(c.added, 0)) OVER (ORDER BY bk.bucket))::bigint AS "cumulativeConjugations"
+        FROM buckets bk
+        LEFT JOIN words w ON w.bucket = bk.bucket
+        LEFT JOIN conjs c ON c.bucket = bk.bucket
+        CROSS JOIN baseline bl
+        ORDER BY bk.bucket;
+    """
+    return sql, {
+        "user_id": user_id,
+        "granularity": granularity,
+        "step": GROWTH_GRANULARITIES[granularity],
+        "start": start,
+        "end": end,
+        "baseline": include_baseline,
+        "max_buckets": max_buckets,
+    }
+
+
+# --- Start game ---
+# Scores are repaired in the background (maintenance.py); until then a
+# missing score counts as 1.
+
+def word_filters(data):
+    """Start-game filters from a start or end-game payload."""
+    return {
+        "classes": data.get("classes", []),
+        "parts_of_speech": data.get("parts_of_speech", []),
+    }
+
+
+def conjugation_filters(data):
+    return {
+        "mode": data.get("mode", "both"),                        # "regular", "irregular", or "both"
+        "tenses": data.get("tenses", []),                        # array of strings
+        "groups": data.get("groups", []),                        # array of ints
+        "pronominal_mode": data.get("pronominal_mode", "both"),  # "only", "exclude", "both"
+    }
+
+
+def word_candidates_query(user_id, classes, parts_of_speech):
+    where_clauses = ["v.user_id = %(user_id)s"]
+    params = {"user_id": user_id}
+
+    if classes:
+        where_clauses.append("v.class = ANY(%(classes)s)")
+        params["classes"] = classes
+
+    if parts_of_speech:
+        where_clauses.append("v.part_of_speech = ANY(%(parts_of_speech)s)")
+        params["parts_of_speech"] = parts_of_speech
+
+    return f"""
+        SELECT v.id, v.word, v.translations, v.part_of_speech, v.article, v.class
+        FROM vocabulary_entries v
+        JOIN word_tracking wt ON v.id = wt.word_id AND wt.user_id = v.user_id
+        {build_where_clause(where_clauses)}
+        ORDER BY RANDOM() * COALESCE(wt.score, 1) DESC
+        LIMIT 500
+    """, params
+
+
+def conjugation_candidates_query(user_id, mode, tenses, groups, pronominal_mode):
+    where_clauses = ["c.user_id = %(user_id)s"]
+    params = {"user_id": user_id}
+
+    # (a) Filter by "mode" => irregular; "both" means no filter
+    if mode == "regular":
+        where_clauses.append("c.irregular = FALSE")
+    elif mode == "irregular":
+        where_clauses.append("c.irregular = TRUE")
+
+    # (b) Filter by tenses, e.g. ["présent","imparfait"]
+    if tenses:
+        where_clauses.append("c.tense = ANY(%(tenses)s)")
+        params["tenses"] = tenses
+
+    # (c) Filter by groups, e.g. [1,2]
+    if groups:
+        where_clauses.append("c.verb_group = ANY(%(groups)s)")
+        params["groups"] = groups
+
+    # (d) pronominal mode; "both" means no filter
+    if pronominal_mode == "only":
+        where_clauses.append("c.pronominal = TRUE")
+    elif pronominal_mode == "exclude":
+        where_clauses.append("c.pronominal = FALSE")
+
+    return f"""
+        SELECT c.id, c.verb, c.person, c.tense, c.conjugation,
+               c.irregular, c.pronominal, c.verb_group
+        FROM conjugation_entries c
+        JOIN conjugation_tracking ct ON c.id = ct.id AND ct.user_id = c.user_id
+        {build_where_clause(where_clauses)}
+        ORDER BY RANDOM() * COALESCE(ct.score, 1) DESC
+        LIMIT 500
+    """, params
+
+
+# The columns item_index.py builds its per-user indexes from, and the
+# lookup of the candidate rows it picks.
+
+ITEM_INDEX_QUERIES = {
+    "words": """
+        SELECT v.id, wt.score, COALESCE(array_length(wt.mistake_timestamps, 1), 0) AS mistakes,
+               v.class, v.part_of_speech
+        FROM vocabulary_entries v
+        JOIN word_tracking wt ON v.id = wt.word_id AND wt.user_id = v.user_id
+        WHERE v.user_id = %(user_id)s
+        ORDER BY v.id
+    """,
+    "conjugations": """
+        SELECT c.id, ct.score, COALESCE(array_length(ct.mistake_timestamps, 1), 0) AS mistakes,
+               c.irregular, c.tense, c.verb_group, c.pronominal
+        FROM conjugation_entries c
+        JOIN conjugation_tracking ct ON c.id = ct.id AND ct.user_id = c.user_id
+        WHERE c.user_id = %(user_id)s
+        ORDER BY c.id
+    """,
+}
+
+ITEMS_BY_ID_QUERIES = {
+    "words": """
+        SELECT v.id, v.word, v.translations, v.part_of_speech, v.article, v.class
+        FROM vocabulary_entries v
+        WHERE v.user_id = %(user_id)s AND v.id = ANY(%(ids)s)
+    """,
+    "conjugations": """
+        SELECT c.id, c.verb, c.person, c.tense, c.conjugation,
+               c.irregular, c.pronominal, c.verb_group
+        FROM conjugation_entries c
+        WHERE c.user_id = %(user_id)s AND c.id = ANY(%(ids)s)
+    """,
+}
+
+
+# --- End game ---
+# Attempts are applied in one set-based UPDATE per game. Repeated attempts at
+# the same item are aggregated first, so the result matches applying them
+# one by one: each attempt bumps total_attempts, each mistake appends a
+# timestamp, and the score is recomputed from the final mistake count (the
+# hours-since-access term is zero because last_accessed becomes NOW()).
+# The same statement adds the game's attempts and mistakes to the user's
+# accuracy_counters, per value of each breakdown dimension of the items
+# played, so breakdowns never have to scan the tracking tables. Counters
+# record an attempt under the values the item had when it was played.
+
+# Breakdown dimensions per game, with the item column each one counts.
+ACCURACY_DIMENSIONS = {
+    "vocabulary": {"class": "v.class", "part_of_speech": "v.part_of_speech"},
+    "conjugation": {"tense": "c.tense", "verb_group": "c.verb_group", "pronominal": "c.pronominal"},
+}
+
+
+def _count_accuracy_cte(game, item_join):
+    """
+    A data-modifying CTE upserting the `attempts` CTE into accuracy_counters.
+    Rows are upserted in key order, so concurrent games of one user lock
+    counters in the same order.
+    """
+    values = ", ".join(f"('{dimension}', {column}::text)"
+                       for dimension, column in ACCURACY_DIMENSIONS[game].items())
+    return f"""
+        counted AS (
+            INSERT INTO accuracy_counters AS ac (user_id, game, dimension, value, attempts, mistakes)
+            SELECT %(user_id)s::int, '{game}', d.dimension, d.value, SUM(a.attempts), SUM(a.mistakes)
+            FROM attempts a
+            {item_join}
+            CROSS JOIN LATERAL (VALUES {values}) AS d(dimension, value)
+            WHERE d.value IS NOT NULL
+            GROUP BY d.dimension, d.value
+            ORDER BY d.dimension, d.value
+            ON CONFLICT (user_id, game, dimension, value) DO UPDATE SET
+                attempts = ac.attempts + EXCLUDED.attempts,
+                mistakes = ac.mistakes + EXCLUDED.mistakes
+        )"""
+
+def record_word_game_query(user_id, data):
+    return """
+        INSERT INTO game_runs
+          (time_limit, game_type, zen_mode, total_words_attempted, correct_words, ungraded, user_id, classes, parts_of_speech)
+        VALUES (%(time_limit)s, %(game_type)s, %(zen_mode)s, %(total_attempts)s, %(score)s,
+                %(ungraded)s, %(user_id)s, %(classes)s, %(parts_of_speech)s);
+    """, {
+        "time_limit": data.get("time_limit") / 60,
+        "game_type": data.get("game_type"),
+        "zen_mode": data.get("zen_mode"),
+        "total_attempts": data.get("total_attempts"),
+        "score": data.get("score"),
+        "ungraded": data.get("ungraded", False),
+        "user_id": user_id,
+        "classes": data.get("classes", ["all"]),
+        "parts_of_speech": data.get("parts_of_speech", ["all"]),
+    }
+
+
+# An item's score after a game: 3, plus 2 per mistake ever made on it. The
+# end-game tracking UPDATEs apply it in SQL; the item index and rescore.py's
+# "standard" formula apply the same constants to NumPy arrays.
+SCORE_BASE = 3
+SCORE_PER_MISTAKE = 2
+
+
+def tracking_score_sql(mistakes):
+    """The end-game score for an SQL expression counting an item's mistakes."""
+    return f"GREATEST({SCORE_BASE} + ({mistakes}) * {SCORE_PER_MISTAKE}, {SCORE_BASE})"
+
+
+def update_word_tracking_query(user_id, results):
+    counted = _count_accuracy_cte(
+        "vocabulary", "JOIN vocabulary_entries v ON v.id = a.word_id AND v.user_id = %(user_id)s"
+    )
+    return f"""
+        WITH attempts AS (
+            SELECT r.word_id, COUNT(*) AS attempts, COUNT(*) FILTER (WHERE r.mistake) AS mistakes
+            FROM unnest(%(ids)s::int[], %(mistakes)s::bool[]) AS r(word_id, mistake)
+            GROUP BY r.word_id
+        ),{counted}
+        UPDATE word_tracking wt
+        SET last_accessed = NOW(),
+            total_attempts = wt.total_attempts + a.attempts,
+            mistake_timestamps = wt.mistake_timestamps || array_fill(NOW(), ARRAY[a.mistakes::int]),
+            score = {tracking_score_sql("COALESCE(array_length(wt.mistake_timestamps, 1), 0) + a.mistakes")}
+        FROM attempts a
+        WHERE wt.word_id = a.word_id AND wt.user_id = %(user_id)s;
+    """, {
+        "ids": [result["word_id"] for result in results],
+        "mistakes": [result["correct"] is False for result in results],
+        "user_id": user_id,
+    }
+
+
+def record_conjugation_game_query(user_id, data):
+    return """
+        INSERT INTO conjugation_game_runs (
+          end_time, time_limit, mode, zen_mode, ungraded, tenses, groups,
+          pronominal_mode, total_attempts, correct_answers, user_id
+        )
+        VALUES (
+          NOW(), %(time_limit)s, %(mode)s, %(zen_mode)s, %(ungraded)s, %(tenses)s,
+          %(groups)s::int[], %(pronominal_mode)s, %(total_attempts)s, %(correct_answers)s, %(user_id)s
+        );
+    """, {
+        "time_limit": data.get("time_limit"),             # in seconds
+        "mode": data.get("mode"),                         # "regular","irregular","both"
+        "zen_mode": data.get("zen_mode", False),
+        "ungraded": data.get("ungraded", False),
+        "tenses": data.get("tenses", []),                 # TEXT[]
+        "groups": data.get("groups", []),                 # INT[]
+        "pronominal_mode": data.get("pronominal_mode", "both"),
+        "total_attempts": data.get("total_attempts"),
+        "correct_answers": data.get("correct_answers"),
+        "user_id": user_id,
+    }
+
+
+def update_conjugation_tracking_query(user_id, results):
+    counted = _count_accuracy_cte(
+        "conjugation", "JOIN conjugation_entries c ON c.id = a.id AND c.user_id = %(user_id)s"
+    )
+    return f"""
+        WITH attempts AS (
+            SELECT r.id, COUNT(*) AS attempts, COUNT(*) FILTER (WHERE r.mistake) AS mistakes
+            FROM unnest(%(ids)s::int[], %(mistakes)s::bool[]) AS r(id, mistake)
+            GROUP BY r.id
+        ),{counted}
+        UPDATE conjugation_tracking ct
+        SET last_accessed = NOW(),
+            total_attempts = ct.total_attempts + a.attempts,
+            mistake_timestamps = ct.mistake_timestamps || array_fill(NOW(), ARRAY[a.mistakes::int]),
+            score = {tracking_score_sql("COALESCE(array_length(ct.mistake_timestamps, 1), 0) + a.mistakes")}
+        FROM attempts a
+        WHERE ct.id = a.id AND ct.user_id = %(user_id)s;
+    """, {
+        "ids": [result["id"] for result in results],
+        "mistakes": [not result["correct"] for result in results],
+        "user_id": user_id,
+    }
+
+
+# --- Stats ---
+# Per-run expressions shared by /stats and the archival task in
+# maintenance.py, which compacts runs older than the retention window into
+# per-user, per-day rows of `run_summaries` (one per format). Stats read
+# the summaries alongside whatever raw runs are still in the hot tables.
+
+RUN_SOURCES = {
+    "vocabulary": {
+        "table": "game_runs",
+        "archive": "game_runs_archive",
+        "time": '"timestamp"',
+        "attempts": "total_words_attempted",
+        "correct": "correct_words",
+        "format": """CONCAT('Vocabulary (', game_type, '), ', (time_limit * 60), 's, ',
+                            CASE WHEN ungraded THEN 'Ungraded' ELSE 'Graded' END)""",
+        "accuracy": """CASE WHEN total_words_attempted = 0 THEN 0
+                            ELSE (correct_words::float/total_words_attempted*100) END""",
+        "ratio": "(correct_words::float/NULLIF(time_limit * 60, 0))",
+        "time_limit_seconds": "round(time_limit * 60)::int",
+        "history": """'vocabulary' AS game, id, "timestamp" AS played_at,
+                      round(time_limit * 60)::int AS time_limit_seconds, game_type, NULL::TEXT AS mode,
+                      zen_mode, ungraded, total_words_attempted AS total_attempts,
+                      correct_words AS correct, classes, parts_of_speech,
+                      NULL::TEXT[] AS tenses, NULL::INT[] AS groups, NULL::TEXT AS pronominal_mode""",
+    },
+    "conjugation": {
+        "table": "conjugation_game_runs",
+        "archive": "conjugation_game_runs_archive",
+        "time": "end_time",
+        "attempts": "total_attempts",
+        "correct": "correct_answers",
+        "format": """CONCAT('Conjugation, ', time_limit, 's, ',
+                            CASE WHEN ungraded THEN 'Ungraded' ELSE 'Graded' END)""",
+        "accuracy": """CASE WHEN total_attempts = 0 THEN 0
+                            ELSE (correct_answers::float/total_attempts*100) END""",
+        "ratio": "(correct_answers::float/NULLIF(time_limit, 0))",
+        "time_limit_seconds": "time_limit",
+        "history": """'conjugation' AS game, id, end_time AS played_at,
+                      time_limit::int AS time_limit_seconds, NULL::TEXT AS game_type, mode,
+                      zen_mode, ungraded, total_attempts, correct_answers AS correct,
+                      NULL::TEXT[] AS classes, NULL::TEXT[] AS parts_of_speech,
+                      tenses, groups, pronominal_mode""",
+    },
+}
+
+
+def _run_queries(game, prefix, run_clause, graded_clause, ungraded_clause,
+                 summary_clause, graded_summary_clause, ungraded_summary_clause, params):
+    """The overview and run-series queries for one game, raw runs + summaries."""
+    src = RUN_SOURCES[game]
+    table, time = src["table"], src["time"]
+    summary_day = "(day::timestamp AT TIME ZONE 'UTC')"
+    return {
+        "played": (f"{prefix}_games_played", f"""
+            SELECT (SELECT COUNT(*) FROM {table} {run_clause})
+                 + (SELECT COALESCE(SUM(runs), 0) FROM run_summaries {summary_clause})
+                   AS {prefix}_games_played;
+        """, params),
+        # Accuracy calculations for graded attempts.
+        "stats": (f"{prefix}_stats", f"""
+            SELECT COALESCE(SUM(correct), 0)::bigint AS {prefix}_correct,
+                   COALESCE(SUM(attempts), 0)::bigint AS {prefix}_attempts
+            FROM (
+                SELECT {src["correct"]} AS correct, {src["attempts"]} AS attempts
+                FROM {table} {graded_clause}
+                UNION ALL
+                SELECT correct, attempts FROM run_summaries {graded_summary_clause}
+            ) runs;
+        """, params),
+        "formats": (f"{prefix}_formats", f"""
+            SELECT format, SUM(cnt)::bigint AS cnt
+            FROM (
+                SELECT {src["format"]} AS format, COUNT(*) AS cnt
+                FROM {table} {run_clause}
+                GROUP BY 1
+                UNION ALL
+                SELECT format, runs FROM run_summaries {summary_clause}
+            ) formats
+            GROUP BY format;
+        """, params),
+        # Archived days appear as one point per format, averaged over its runs.
+        "graded_runs": (f"graded_{prefix}_runs", f"""
+            SELECT {time} AS run_date, {src["accuracy"]} AS accuracy
+            FROM {table} {graded_clause}
+            UNION ALL
+            SELECT {summary_day}, accuracy_sum / runs
+            FROM run_summaries {graded_summary_clause}
+            ORDER BY run_date;
+        """, params),
+        "ungraded_runs": (f"ungraded_{prefix}_runs", f"""
+            SELECT {time} AS run_date, {src["correct"]} AS score, time_limit,
+                   {src["ratio"]} AS ratio
+            FROM {table} {ungraded_clause}
+            UNION ALL
+            SELECT {summary_day}, ROUND(correct::numeric / runs)::int, time_limit,
+                   ratio_sum / runs
+            FROM run_summaries {ungraded_summary_clause}
+            ORDER BY run_date;
+        """, params),
+    }
+
+
+def stats_queries(time_range, user_id):
+    """
+    All /stats queries, grouped into independent sections. Queries within a
+    section run in order on one connection; sections may run concurrently.
+    Returns {section: [(name, sql, params), ...]}.
+    """
+    # Define base time filters.
+    if time_range == "week":
+        base_time = ">= NOW() - INTERVAL '7 days'"
+    elif time_range == "month":
+        base_time = ">= NOW() - INTERVAL '30 days'"
+    else:
+        base_time = None
+
+    # Helper lists of conditions for each section.
+    user_condition = "user_id = %(user_id)s"
+
+    # For vocabulary, conjugations, game_runs, conjugation_game_runs, and tracking.
+    vocab_conditions = []
+    conj_conditions = []
+    game_conditions = []         # For game_runs table.
+    conj_game_conditions = []    # For conjugation_game_runs table.
+    tracking_conditions = []     # For word_tracking and conjugation_tracking.
+    summary_conditions = []      # For run_summaries.
+
+    if base_time:
+        vocab_conditions.append("created_at " + base_time)
+        conj_conditions.append("created_at " + base_time)
+        game_conditions.append("timestamp " + base_time)
+        conj_game_conditions.append("end_time " + base_time)
+        tracking_conditions.append("last_accessed " + base_time)
+        summary_conditions.append("day " + base_time)
+
+    # Always add the user condition.
+    vocab_conditions.append(user_condition)
+    conj_conditions.append(user_condition)
+    game_conditions.append(user_condition)
+    conj_game_conditions.append(user_condition)
+    tracking_conditions.append(user_condition)
+    summary_conditions.append(user_condition)
+
+    # Build WHERE clauses.
+    vocab_clause = build_where_clause(vocab_conditions)
+    conj_clause = build_where_clause(conj_conditions)
+    game_clause = build_where_clause(game_conditions)
+    conj_game_clause = build_where_clause(conj_game_conditions)
+
+    # Now, for graded/ungraded queries add the extra "ungraded" condition.
+    graded_game_clause = build_where_clause(game_conditions + ["ungraded = FALSE"])
+    ungraded_game_clause = build_where_clause(game_conditions + ["ungraded = TRUE"])
+    graded_conj_game_clause = build_where_clause(conj_game_conditions + ["ungraded = FALSE"])
+    ungraded_conj_game_clause = build_where_clause(conj_game_conditions + ["ungraded = TRUE"])
+    # For tracking, filter for total_attempts > 0. Labels come from a join,
+    # so qualify the columns with the tracking table's alias.
+    attempted_conditions = tracking_conditions + ["total_attempts > 0"]
+    word_tracking_clause = build_where_clause([f"wt.{c}" for c in attempted_conditions])
+    conj_tracking_clause = build_where_clause([f"ct.{c}" for c in attempted_conditions])
+
+    params = {"user_id": user_id}
+
+    word_summaries = summary_conditions + ["game = 'vocabulary'"]
+    conj_summaries = summary_conditions + ["game = 'conjugation'"]
+    word_runs = _run_queries(
+        "vocabulary", "word", game_clause, graded_game_clause, ungraded_game_clause,
+        build_where_clause(word_summaries),
+        build_where_clause(word_summaries + ["ungraded = FALSE"]),
+        build_where_clause(word_summaries + ["ungraded = TRUE"]),
+        params,
+    )
+    conj_runs = _run_queries(
+        "conjugation", "conj", conj_game_clause, graded_conj_game_clause, ungraded_conj_game_clause,
+        build_where_clause(conj_summaries),
+        build_where_clause(conj_summaries + ["ungraded = FALSE"]),
+        build_where_clause(conj_summaries + ["ungraded = TRUE"]),
+        params,
+    )
+
+    # Gap-filled daily running totals, counted from the start of the range.
+    growth_start = None
+    if time_range == "week":
+        growth_start = datetime.now(timezone.utc) - timedelta(days=7)
+    elif time_range == "month":
+        growth_start = datetime.now(timezone.utc) - timedelta(days=30)
+    growth_sql, growth_params = growth_series_query(
+        user_id, "day", start=growth_start, include_baseline=False
+    )
+
+    return {
+        "overview": [
+            ("words_added", f"SELECT COUNT(*) AS words_added FROM vocabulary {vocab_clause};", params),
+            ("conj_added", f"SELECT COUNT(*) AS conj_added FROM conjugations {conj_clause};", params),
+            word_runs["played"],
+            conj_runs["played"],
+            word_runs["stats"],
+            conj_runs["stats"],
+            # Most frequent format played
+            word_runs["formats"],
+            conj_runs["formats"],
+        ],
+        "growth": [
+            ("cumulative_growth", growth_sql, growth_params),
+        ],
+        "runs": [
+            word_runs["graded_runs"],
+            conj_runs["graded_runs"],
+            word_runs["ungraded_runs"],
+            conj_runs["ungraded_runs"],
+        ],
+        "best_worst": [
+            ("word_stats_rows", f"""
+                SELECT v.word, wt.total_attempts,
+                       COALESCE(array_length(wt.mistake_timestamps, 1), 0) AS mistakes
+                FROM word_tracking wt
+                JOIN vocabulary_entries v ON v.id = wt.word_id AND v.user_id = wt.user_id
+                {word_tracking_clause};
+            """, params),
+            ("conj_stats_rows", f"""
+                SELECT c.verb, c.tense, c.person, ct.total_attempts,
+                       COALESCE(array_length(ct.mistake_timestamps, 1), 0) AS mistakes
+                FROM conjugation_tracking ct
+                JOIN conjugation_entries c ON c.id = ct.id AND c.user_id = ct.user_id
+                {conj_tracking_clause};
+            """, params),
+        ],
+    }
+
+
+def _best_and_worst(rows):
+    for row in rows:
+        attempts = row["total_attempts"]
+        mistakes = row["mistakes"]
+        row["accuracy"] = ((attempts - mistakes) / attempts * 100) if attempts > 0 else 0
+    best = sorted(rows, key=lambda r: (r["accuracy"], r["total_attempts"]), reverse=True)[:5]
+    worst = sorted(rows, key=lambda r: (r["mistakes"], r["total_attempts"]), reverse=True)[:5]
+    return best, worst
+
+
+def shape_stats(rows):
+    """Build the /stats response from {query name: list of row dicts}."""
+    word_stats = rows["word_stats"][0]
+    conj_stats = rows["conj_stats"][0]
+    total_attempts = word_stats["word_attempts"] + conj_stats["conj_attempts"]
+    total_correct = word_stats["word_correct"] + conj_stats["conj_correct"]
+    avg_accuracy = (total_correct / total_attempts * 100) if total_attempts > 0 else 0
+
+    all_formats = list(rows["word_formats"]) + list(rows["conj_formats"])
+    most_frequent_format = "N/A"
+    if all_formats:
+        all_formats.sort(key=lambda x: x["cnt"], reverse=True)
+        most_frequent_format = all_formats[0]["format"]
+
+    overall_stats = {
+        "wordsAdded": rows["words_added"][0]["words_added"],
+        "conjugationsAdded": rows["conj_added"][0]["conj_added"],
+        "wordGamesPlayed": rows["word_games_played"][0]["word_games_played"],
+        "conjugationGamesPlayed": rows["conj_games_played"][0]["conj_games_played"],
+        "averageAccuracy": round(avg_accuracy, 2),
+        "mostFrequentFormat": most_frequent_format
+    }
+
+    best_words, worst_words = _best_and_worst(rows["word_stats_rows"])
+    best_conjs, worst_conjs = _best_and_worst(rows["conj_stats_rows"])
+
+    return {
+        "overallStats": overall_stats,
+        "cumulativeGrowth": rows["cumulative_growth"],
+        "gradedWordRuns": rows["graded_word_runs"],
+        "gradedConjRuns": rows["graded_conj_runs"],
+        "ungradedWordRuns": rows["ungraded_word_runs"],
+        "ungradedConjRuns": rows["ungraded_conj_runs"],
+        "bestWords": best_words,
+        "worstWords": worst_words,
+        "bestConjugations": best_conjs,
+        "worstConjugations": worst_conjs
+    }
+
+
+# --- Accuracy breakdown ---
+
+def accuracy_breakdown_query(user_id):
+    return """
+        SELECT game, dimension, value, attempts, mistakes
+        FROM accuracy_counters
+        WHERE user_id = %(user_id)s
+        ORDER BY game, dimension, value;
+    """, {"user_id": user_id}
+
+
+# Counters store every value as text; these dimensions are typed in responses.
+_BREAKDOWN_VALUE_TYPES = {"verb_group": int, "pronominal": lambda value: value == "true"}
+
+
+def shape_breakdown(rows):
+    """{game: {dimension: [{value, attempts, mistakes, accuracy}, ...]}}"""
+    result = {game: {dimension: [] for dimension in dimensions}
+              for game, dimensions in ACCURACY_DIMENSIONS.items()}
+    for row in rows:
+        attempts, mistakes = row["attempts"], row["mistakes"]
+        parse = _BREAKDOWN_VALUE_TYPES.get(row["dimension"], str)
+        result[row["game"]][row["dimension"]].append({
+            "value": parse(row["value"]),
+            "attempts": attempts,
+            "mistakes": mistakes,
+            "accuracy": round((attempts - mistakes) / attempts * 100, 2) if attempts > 0 else 0,
+        })
+    return result
+
+
+# --- History ---
+# Runs newest first, from the hot and archive tables of both games, paged
+# with a keyset cursor on (played_at, game, id). Each branch reads at most
+# one page through its (user_id, time, id) index (migration 006) and the
+# outer query merges them, so a page costs the same however deep it is.
+
+HISTORY_FILTERS = {
+    "game_type": ("vocabulary", "game_type = %(game_type)s"),
+    "mode": ("conjugation", "mode = %(mode)s"),
+}
+
+# Ids in a branch are compared against this when the cursor's row belongs
+# to a game sorting after it (every run at the cursor's time still follows).
+_MAX_ID = 2**31 - 1
+
+
+def encode_history_cursor(row):
+    raw = json.dumps([row["played_at"].isoformat(), row["game"], row["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor):
+    """(played_at, game, id) from a cursor; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        played_at, game, run_id = json.loads(raw)
+        return datetime.fromisoformat(played_at), game, int(run_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def history_query(user_id, games, filters, cursor=None, limit=50):
+    """
+    One page of runs of `games` matching `filters` (game_type, mode,
+    ungraded, time_limit in seconds), strictly after `cursor` if given.
+    Fetches limit + 1 rows, so callers can tell whether another page exists.
+    """
+    params = {"user_id": user_id, "limit": limit + 1, **filters}
+    branches = []
+    for game in games:
+        src = RUN_SOURCES[game]
+        conditions = ["user_id = %(user_id)s"]
+        for name, (filter_game, condition) in HISTORY_FILTERS.items():
+            if name in filters and filter_game == game:
+                conditions.append(condition)
+        if "ungraded" in filters:
+            conditions.append("ungraded = %(ungraded)s")
+        if "time_limit" in filters:
+            conditions.append(f"{src['time_limit_seconds']} = %(time_limit)s")
+        if cursor:
+            played_at, cursor_game, cursor_id = cursor
+            params["before"] = played_at
+            params[f"{game}_id"] = (cursor_id if game == cursor_game
+                                    else _MAX_ID if game < cursor_game else 0)
+            conditions.append(f"({src['time']}, id) < (%(before)s, %({game}_id)s)")
+        for table in (src["table"], src["archive"]):
+            branches.append(f"""
+                (SELECT {src["history"]}
+                 FROM {table}
+                 {build_where_clause(conditions)}
+                 ORDER BY {src["time"]} DESC, id DESC
+                 LIMIT %(limit)s)""")
+    sql = "\n                UNION ALL".join(branches) + """
+        ORDER BY played_at DESC, game DESC, id DESC
+        LIMIT %(limit)s;
+    """
+    return sql, params
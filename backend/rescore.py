@@ -0,0 +1,174 @@
+"""
+Offline re-scoring of the tracking tables.
+
+    python rescore.py --formula standard           # both tables
+    python rescore.py words --formula decayed --half-life-days 30
+    python rescore.py conjugations --formula decayed --dry-run   # report, write nothing
+
+The formula must be chosen explicitly. "standard" is the score the end-game
+routes give an item (see queries.SCORE_BASE): it only restores scores that
+drifted from it, e.g. rows the repair task scored. "decayed" changes how
+items are ranked for every user. Items never played keep the score the add
+routes gave them.
+
+For formula changes and data migrations that touch every tracking row.
+Rows are streamed through a server-side cursor in large chunks, scored with
+NumPy array operations, and COPYed into a temporary table; one
+UPDATE ... FROM then writes every changed score in a single statement,
+instead of one UPDATE per row. Progress and throughput are printed per
+chunk and per phase.
+
+The final UPDATE locks every changed row until it commits, and overwrites
+scores that games update while the run is in progress, so run it while
+the app is quiet.
+"""
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+from db import get_db_connection
+from queries import SCORE_BASE, SCORE_PER_MISTAKE
+
+TABLES = {
+    "words": ("word_tracking", "word_id"),
+    "conjugations": ("conjugation_tracking", "id"),
+}
+
+
+
+class Chunk:
+    """One chunk of tracking rows as flat arrays."""
+
+    def __init__(self, rows):
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        self.mistake_counts = np.fromiter((len(r[1]) for r in rows), dtype=np.int64, count=len(rows))
+        # Every mistake timestamp of the chunk, flattened, and the row each belongs to.
+        self.mistake_times = np.fromiter(
+            (t for r in rows for t in r[1]), dtype=np.float64, count=int(self.mistake_counts.sum())
+        )
+        self.mistake_rows = np.repeat(np.arange(len(rows)), self.mistake_counts)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def standard_scores(chunk, now, **_):
+    """The end-game score: 3 + 2 per mistake, never below 3."""
+    return np.maximum(SCORE_BASE + SCORE_PER_MISTAKE * chunk.mistake_counts, SCORE_BASE).astype(np.float64)
+
+
+def decayed_scores(chunk, now, half_life_days=30, **_):
+    """Like standard, but each mistake counts less as it ages (exponential half-life)."""
+    ages = (now - chunk.mistake_times) / 86400
+    weights = np.exp2(-ages / half_life_days)
+    decayed = np.bincount(chunk.mistake_rows, weights=weights, minlength=len(chunk))
+    return np.maximum(SCORE_BASE + SCORE_PER_MISTAKE * decayed, SCORE_BASE)
+
+
+FORMULAS = {
+    "standard": standard_scores,
+    "decayed": decayed_scores,
+}
+
+
+def select_sql(table, key):
+    return f"""
+        SELECT {key},
+               ARRAY(SELECT EXTRACT(EPOCH FROM t)::float8 FROM unnest(mistake_timestamps) t)
+        FROM {table}
+        WHERE total_attempts > 0
+    """
+
+
+def copy_chunk(cur, ids, scores):
+    buf = io.StringIO()
+    np.savetxt(buf, np.column_stack((ids, scores)), fmt=("%d", "%.6f"), delimiter="\t")
+    buf.seek(0)
+    cur.copy_expert("COPY rescore_tmp (id, score) FROM STDIN", buf)
+
+
+def rescore_table(conn, table, key, formula, chunk_size=50000, dry_run=False, **options):
+    """Re-score every row of `table`; returns the number of rows changed."""
+    now = time.time()
+    score = FORMULAS[formula]
+    cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    cur.execute("CREATE TEMP TABLE rescore_tmp (id INTEGER, score DOUBLE PRECISION) ON COMMIT DROP;")
+
+    reader = conn.cursor(name=f"rescore_{table}", cursor_factory=psycopg2.extensions.cursor)
+    reader.itersize = chunk_size
+    reader.execute(select_sql(table, key))
+
+    total, started = 0, time.perf_counter()
+    timings = {"read": 0.0, "score": 0.0, "copy": 0.0}
+    while True:
+        t0 = time.perf_counter()
+        rows = reader.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = Chunk(rows)
+        t1 = time.perf_counter()
+        scores = score(chunk, now, **options)
+        t2 = time.perf_counter()
+        copy_chunk(cur, chunk.ids, scores)
+        t3 = time.perf_counter()
+        timings["read"] += t1 - t0
+        timings["score"] += t2 - t1
+        timings["copy"] += t3 - t2
+        total += len(chunk)
+        print(f"  {table}: {total} rows, {total / (t3 - started):,.0f} rows/s")
+    reader.close()
+
+    t0 = time.perf_counter()
+    cur.execute("ANALYZE rescore_tmp;")
+    cur.execute(f"""
+        UPDATE {table} t SET score = r.score
+        FROM rescore_tmp r
+        WHERE t.{key} = r.id AND t.score IS DISTINCT FROM r.score;
+    """)
+    changed = cur.rowcount
+    timings["update"] = time.perf_counter() - t0
+    cur.close()
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"{table}: {total} rows scored, {changed} changed{' (dry run, rolled back)' if dry_run else ''} "
+          f"in {elapsed:.2f} s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+    for phase, seconds in timings.items():
+        print(f"  {phase:<7}{seconds:8.2f} s")
+    return changed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Re-score the tracking tables")
+    parser.add_argument("tables", nargs="*", help=f"any of {', '.join(TABLES)} (default: all)")
+    parser.add_argument("--formula", choices=FORMULAS, required=True)
+    parser.add_argument("--half-life-days", type=float, default=30, help="for --formula decayed")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.tables if name not in TABLES]
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(unknown)}")
+
+    load_dotenv()
+    conn = get_db_connection(scoped=False)
+    try:
+        for name in args.tables or list(TABLES):
+            table, key = TABLES[name]
+            rescore_table(conn, table, key, args.formula, chunk_size=args.chunk_size,
+                          dry_run=args.dry_run, half_life_days=args.half_life_days)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,202 @@
+"""
+Tiny stores for per-user counters, token buckets and concurrency leases
+kept outside Postgres.
+
+`MemoryStore` keeps values in the current process, which is all a single
+worker needs. `SQLiteStore` keeps them in a local SQLite file so that every
+worker process on the same host sees the same values.
+
+The backend is chosen with the STATE_STORE environment variable:
+"memory" (the default) or "sqlite:///path/to/state.db".
+"""
+import os
+import sqlite3
+import threading
+import uuid
+
+
+class MemoryStore:
+    """In-process store. Only correct when the app runs in a single process."""
+
+    def __init__(self):
+        self._data = {}
+        self._buckets = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+        # Changes on every restart so values handed out before the restart
+        # (e.g. inside ETags) can never be mistaken for current ones.
+        self.epoch = uuid.uuid4().hex[:12]
+
+    def get(self, key, default=0):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = self._data.get(key, 0) + amount
+            self._data[key] = value
+            return value
+
+    def take_token(self, key, rate, burst, now):
+        """
+        Take one token from the bucket `key` (refilled at `rate` tokens per
+        second up to `burst`). Returns 0 on success, otherwise the number of
+        seconds until a token will be available.
+        """
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 10000:
+                self._prune_buckets(rate, burst, now)
+            return (1 - tokens) / rate
+
+    def _prune_buckets(self, rate, burst, now):
+        # A bucket that has refilled completely is the same as no bucket.
+        for key, (tokens, stamp) in list(self._buckets.items()):
+            if tokens + (now - stamp) * rate >= burst:
+                del self._buckets[key]
+
+    def acquire_lease(self, key, limit, ttl, now):
+        """Take one of `limit` concurrent slots for `key`; returns a token or None."""
+        with self._lock:
+            leases = {t: exp for t, exp in self._leases.get(key, {}).items() if exp > now}
+            if len(leases) >= limit:
+                self._leases[key] = leases
+                return None
+            token = uuid.uuid4().hex
+            leases[token] = now + ttl
+            self._leases[key] = leases
+            return token
+
+    def release_lease(self, key, token):
+        with self._lock:
+            leases = self._leases.get(key)
+            if leases is not None:
+                leases.pop(token, None)
+                if not leases:
+                    del self._leases[key]
+
+
+class SQLiteStore:
+    """Store backed by a local SQLite file, shared by all workers on a host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(key TEXT NOT NULL, token TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (key, token))"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)",
+                (uuid.uuid4().hex[:12],),
+            )
+        self.epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _conn(self):
+        # One connection per thread, and never reuse one across a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=0):
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return default if row is None else _number(row[0])
+
+    def _write(self, fn):
+        """Run `fn(conn)` inside a write transaction and return its result."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def incr(self, key, amount=1):
+        def op(conn):
+            conn.execute(
+                "INSERT INTO kv (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, amount),
+            )
+            return conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0]
+        return _number(self._write(op))
+
+    def take_token(self, key, rate, burst, now):
+        def op(conn):
+            row = conn.execute("SELECT tokens, stamp FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, stamp = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if tokens >= 1:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, stamp) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            return wait
+        return self._write(op)
+
+    def acquire_lease(self, key, limit, ttl, now):
+        def op(conn):
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires <= ?", (key, now))
+            held = conn.execute("SELECT COUNT(*) FROM leases WHERE key = ?", (key,)).fetchone()[0]
+            if held >= limit:
+                return None
+            token = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO leases (key, token, expires) VALUES (?, ?, ?)", (key, token, now + ttl)
+            )
+            return token
+        return self._write(op)
+
+    def release_lease(self, key, token):
+        self._write(lambda conn: conn.execute(
+            "DELETE FROM leases WHERE key = ? AND token = ?", (key, token)
+        ))
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else value
+
+
+def create_store(url):
+    if not url or url == "memory":
+        return MemoryStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported STATE_STORE: {url!r}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide store, creating it from STATE_STORE on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store(os.environ.get("STATE_STORE", "memory"))
+    return _store
@@ -0,0 +1,34 @@
+"""
+Query budgets as a test, so a regression fails the test run:
+
+    python -m unittest test_budgets      # or: python -m pytest test_budgets.py
+
+Runs check_budgets.main(); skipped when the Postgres server binaries
+(initdb, pg_ctl) can't be found.
+"""
+import os
+import unittest
+from unittest import mock
+
+import check_budgets
+
+
+def _postgres_available():
+    try:
+        check_budgets.pg_bin("initdb")
+        check_budgets.pg_bin("pg_ctl")
+    except SystemExit:
+        return False
+    return True
+
+
+@unittest.skipUnless(_postgres_available(), "initdb/pg_ctl not found; install the Postgres server or set PG_BIN")
+class QueryBudgetTest(unittest.TestCase):
+    # check_budgets points the environment at its throwaway cluster.
+    @mock.patch.dict(os.environ)
+    def test_routes_within_budget(self):
+        self.assertEqual(check_budgets.main([]), 0, "routes over budget; see the output above")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Per-user data versions and conditional GET support.
+
+Every route that changes a user's vocabulary, conjugations or settings calls
+`bump_data_version` once its transaction has committed. Read routes wrapped
+with `conditional_get` tag their responses with a strong ETag derived from
+that version, and answer a matching If-None-Match with a 304 before the view
+(and therefore any query) runs.
+
+Changes made outside the request handlers (migrations, maintenance passes)
+call `bump_all_data_versions`, which moves every user's ETag at once.
+
+The versions live in the state store (see store.py), so deployments with
+several worker processes, or with migrate.py / maintenance.py running as
+their own processes, must use a shared STATE_STORE.
+"""
+import hashlib
+from functools import wraps
+
+from flask import make_response, request, session
+
+from logs import logger
+from store import get_store
+
+# Bumped for changes that touch every user's data at once.
+GLOBAL_KEY = "data_version:*"
+
+
+def _key(user_id):
+    return f"data_version:{user_id}"
+
+
+def get_data_version(user_id):
+    return get_store().get(_key(user_id))
+
+
+def bump_data_version(user_id):
+    """
+    Mark the user's data as changed. Call only after the commit. The change
+    is already in the database by then, so a store failure is logged rather
+    than raised (a 500 would hide a write that succeeded).
+    """
+    try:
+        return get_store().incr(_key(user_id))
+    except Exception:
+        logger.exception("Could not bump the data version of user %s", user_id)
+        return None
+
+
+def bump_all_data_versions():
+    """Mark every user's data as changed, e.g. after a migration or maintenance pass."""
+    return get_store().incr(GLOBAL_KEY)
+
+
+def current_etag(user_id):
+    store = get_store()
+    raw = f"{store.epoch}:{store.get(GLOBAL_KEY)}:{user_id}:{get_data_version(user_id)}:{request.path}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def _set_cache_headers(response, etag):
+    response.set_etag(etag)
+    # Responses are per user: let the browser keep them, but always revalidate.
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+def conditional_get(view):
+    """Serve 304 Not Modified when the client already has the current data."""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        # Read the version before the view queries anything, so a write that
+        # lands mid-request produces a newer version on the next call.
+        etag = current_etag(session.get("user_id"))
+        # Compressed representations carry an encoding suffix (see compression.py).
+        for candidate in request.if_none_match.as_set():
+            if candidate == etag or candidate.startswith(etag + "-"):
+                return _set_cache_headers(make_response("", 304), candidate)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            _set_cache_headers(response, etag)
+        return response
+    return decorated_function
@@ -0,0 +1,12 @@
+"""
+Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app object is built once here; with `preload_app` that happens in the
+gunicorn master, and each worker opens its own connection pool after the
+fork (see gunicorn.conf.py).
+"""
+from app import create_app
+
+app = create_app()